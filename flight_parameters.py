@@ -1,13 +1,19 @@
+from sc_clock import SYSTEM_CLOCK
 from sc_config import SimrateControlConfig
+from sc_profiles import AircraftProfileRegistry
+from sc_reads import SimvarReads
+from sc_terrain import TerrainTiles
+from sc_zones import ZoneError, load_zones
 
 # from lib.simconnect_mobiflight import SimConnectMobiFlight
 from lib.koseng.mobiflight_variable_requests import MobiFlightVariableRequests
 from SimConnect import *
 from geopy import distance
 from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
 from sys import maxsize
-from math import ceil, radians, degrees, tan, sin, cos, asin, atan2
-from time import sleep
+from math import ceil, radians, degrees, tan, sin, cos, asin, atan2, sqrt
 
 
 class SimConnectDataError(Exception):
@@ -17,47 +23,248 @@ class SimConnectDataError(Exception):
 # A simple structure to hold distance from the previous and next waypoints
 WaypointClearance = namedtuple("WaypointClearances", "prev next")
 
+# Standard rate turn, radians per second
+STANDARD_RATE = radians(3)
+# Autopilots limit bank to about this, so fast aircraft turn slower than
+# standard rate
+AUTOPILOT_BANK_LIMIT = radians(25)
+GRAVITY = 9.80665  # m/s^2
+# Mean earth radius in nm. Geodesic distances on the WGS84 ellipsoid are
+# within 0.5% of great circle distances on a sphere of this radius.
+EARTH_RADIUS_NM = 6371.0088 / 1.852
+
+# python-SimConnect caches request values for a few milliseconds of wall clock
+# time, which would return stale values under a VirtualClock. Values are kept
+# per tick instead, see `_PerTick`.
+UNCACHED = -1
+
+# Seconds between checks for newly registered LVars, see `register_lvars`
+LVAR_POLL_INTERVAL = 0.02
+
+# Pitch, bank and vertical speed past this share of their limits are near
+# them, see `SimrateDiscriminator.near_thresholds`
+NEAR_LIMIT = 0.8
+
+
+def turn_angle(course_in, course_out):
+    """The course change in degrees (0 to 180) between two courses in degrees."""
+    change = abs(course_out - course_in) % 360
+    return 360 - change if change > 180 else change
+
+
+def turn_lead_distance(angle, ground_speed):
+    """Distance in nm before a waypoint a turn of `angle` degrees starts, at
+    `ground_speed` meters/sec.
+
+    The turn radius is that of a standard rate turn, or of a turn at the
+    autopilot bank limit if that is wider.
+    """
+    standard_radius = ground_speed / STANDARD_RATE
+    bank_radius = ground_speed ** 2 / (GRAVITY * tan(AUTOPILOT_BANK_LIMIT))
+    radius = max(standard_radius, bank_radius) / 1852
+    return radius * tan(radians(min(angle, 179)) / 2)
+
+
+def great_circle(lat1, lon1, lat2, lon2):
+    """The great circle distance in nm between two positions in degrees,
+    within 0.5% of the geodesic distance."""
+    lat1, lat2 = radians(lat1), radians(lat2)
+    h = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin(
+        radians(lon2 - lon1) / 2
+    ) ** 2
+    return 2 * EARTH_RADIUS_NM * asin(min(1.0, sqrt(h)))
+
+
+def distance_bound(lat1, lon1, lat2, lon2):
+    """An upper bound in nm of the geodesic distance between two positions
+    in degrees. Much cheaper than the geodesic itself."""
+    return 1.01 * great_circle(lat1, lon1, lat2, lon2)
+
+
+def _decode(value):
+    return value.decode("utf-8")
+
+
+class _PerTick:
+    """A FlightDataMetrics value computed on first use in a tick and reused
+    until the next `update`.
+
+    The age of the oldest last-known-good simvar it was computed from is kept
+    with it, and checked against the guard using it on every use, see
+    `FlightDataMetrics.max_input_age`.
+    """
+
+    def __init__(self, compute):
+        self.compute = compute
+        self.__doc__ = compute.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        values = instance._tick_values
+        if self.name not in values:
+            outer, instance._input_age = instance._input_age, 0.0
+            try:
+                values[self.name] = (self.compute(instance), instance._input_age)
+            finally:
+                instance._input_age = max(outer, instance._input_age)
+        value, age = values[self.name]
+        instance.check_input_age(self.name, age)
+        recording = instance._recording
+        if recording is not None and self.name not in recording:
+            recording[self.name] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance._tick_values[self.name] = (value, 0.0)
+
+
+def _simvar(name, convert=None):
+    """A simvar read at most once per tick, see `_PerTick`."""
+
+    def compute(fdm):
+        value = fdm._get_value(name)
+        return value if convert is None else convert(value)
+
+    return _PerTick(compute)
+
 
 class FlightDataMetrics:
-    def __init__(self, simconnect_connection, config: SimrateControlConfig):
+    def __init__(
+        self,
+        simconnect_connection,
+        config: SimrateControlConfig,
+        flight_plans=None,
+        clock=SYSTEM_CLOCK,
+        reads=None,
+    ):
         self.sm = simconnect_connection
-        self.vr = MobiFlightVariableRequests(self.sm)
+        self.clock = clock
+        # Shared with the SimRateManager by SimrateController
+        self.reads = (
+            reads
+            if reads is not None
+            else SimvarReads(
+                clock,
+                config.read_deadline,
+                config.breaker_failures,
+                config.breaker_reset,
+            )
+        )
+        # A FlightPlanIndex to find the plan being flown in, see `next_turn`
+        self.flight_plans = flight_plans
+        self.flight_plan = None
+        self._plan_searched = None
+        self.vr = MobiFlightVariableRequests(
+            self.sm, block_mode=config.lvar_block_mode, clock=clock.monotonic
+        )
         self.vr.clear_sim_variables()
         self._config = config
-        self.aq = AircraftRequests(self.sm)
+        self.aq = AircraftRequests(self.sm, _time=UNCACHED)
         self.messages = []
-        self._request_sleep = 0.05
-        self._max_request_sleep = 0.5
-        self._min_request_sleep = 0.01
+        self.profiles = AircraftProfileRegistry(config.profile_directory)
+        self.profile = self.profiles.default
+        self._registered_title = None
+        # How long to wait for newly registered LVars to report a first value
+        self._lvar_first_value_timeout = 1.0
+        # The active leg and the turn made onto it, see `track_legs`
+        self._leg = None
+        self._previous_turn = None
+        self._tick_values = {}
+        self._tick_requests = 0
+        # See `record_inputs`
+        self._recording = None
+        # See `max_input_age`
+        self._max_input_age = None
+        self._input_age = 0.0
         self.update()
 
+    def rebind(self, simconnect_connection):
+        """Continue on a new SimConnect connection, keeping all state."""
+        self.sm = simconnect_connection
+        self.vr.rebind(self.sm)
+        self.aq = AircraftRequests(self.sm, _time=UNCACHED)
+        self.lvars = self.vr.snapshot()
+
+    def reconfigure(self, config: SimrateControlConfig):
+        if config.profile_directory != self._config.profile_directory:
+            self.profiles = AircraftProfileRegistry(config.profile_directory)
+            self._registered_title = None
+        self.reads.reconfigure(
+            config.read_deadline, config.breaker_failures, config.breaker_reset
+        )
+        self._config = config
+
     def _get_value(self, aq_name, retries=maxsize):
-        # PySimConnect seems to crash the sim if requests happen too fast.
-        sleep(self._request_sleep)
-        val = self.aq.find(str(aq_name)).value
-        i = 0
-        while val is None and i < retries:
-            i += 1
-            self._request_sleep = min(
-                self._request_sleep + 0.05 * i, self._max_request_sleep
+        """The value of a simvar, or its last good value when it could not be
+        read in time. See `SimvarReads`."""
+        value, age = self.reads.read(aq_name, self._request, retries)
+        if self.reads.retries > 0:
+            self.messages.append(
+                f"Warning: Retried {aq_name} {self.reads.retries} times."
             )
-            sleep(self._request_sleep)
-            val = self.aq.find(str(aq_name)).value
-        if i > 0:
-            self.messages.append(f"Warning: Retried {aq_name} {i} times.")
-        self._request_sleep = max(self._min_request_sleep, self._request_sleep - 0.01)
-        return val
+        if age > 0 and value is not None:
+            self.messages.append(f"Warning: Using {aq_name} from {age:.1f} s ago.")
+        elif value is None:
+            self.messages.append(f"Warning: No value for {aq_name}.")
+        self._input_age = max(self._input_age, age)
+        self.check_input_age(aq_name, age)
+        return value
+
+    def _request(self, aq_name):
+        return self.aq.find(str(aq_name)).value
+
+    @property
+    def simvar_requests(self):
+        """Requests made to the sim this tick."""
+        return self.reads.requests - self._tick_requests
+
+    @contextmanager
+    def max_input_age(self, seconds):
+        """Within this, using a last-known-good value older than `seconds`
+        raises SimConnectDataError."""
+        outer, self._max_input_age = self._max_input_age, seconds
+        try:
+            yield
+        finally:
+            self._max_input_age = outer
+
+    @contextmanager
+    def record_inputs(self):
+        """Collects the per-tick values used within this, by name, in the
+        order they were first used."""
+        outer, self._recording = self._recording, {}
+        inputs = self._recording
+        try:
+            yield inputs
+        finally:
+            self._recording = outer
+            if outer is not None:
+                for name, value in inputs.items():
+                    outer.setdefault(name, value)
+
+    def check_input_age(self, name, age):
+        if self._max_input_age is not None and age > self._max_input_age:
+            raise SimConnectDataError(f"{name} is {age:.1f} s old")
 
     @property
     def ete(self):
-        ete1 = self._get_value("GPS_ETE")
+        source = self.profile.ete_source
+        ete1 = self._get_value("GPS_ETE") if source != "lvar" else 0
+        if source == "gps":
+            return ete1
 
         # ete2 is a workaround for the WT avionics framework ETE.
         # See issue #40
         ete2 = 0
-        distance = self.vr.get("(L:WT1000_LNav_Destination_Dis)") / 1852
+        lvar_distance = self.lvars.read(self.profile.ete_distance_lvar)
+        distance = lvar_distance.value / 1852
         gspeed = self.ground_speed()
-        if distance > 0 and gspeed > 0:
+        # A value that never arrived is not a distance of zero
+        if lvar_distance.updates > 0 and distance > 0 and gspeed > 0:
             # meters to nmi
             ete2 = distance / gspeed
 
@@ -65,71 +272,117 @@ class FlightDataMetrics:
         return ete
 
     def update(self, retries=maxsize):
-        # Load these all up for three reasons.
-        # 1. These are static items
-        # 2. Running them over and over may trigger a memory leak in the game
-        # 3. It seems to increase reliability of reading/setting the data
+        """Start a new tick.
+
+        Simvars are only read when first used in a tick, and then reused for
+        the rest of it, see `_simvar`. A decision that stops at the first
+        guard, e.g. with the autopilot off, only reads what that guard needs.
+        Reading each value at most once per tick also avoids hammering the
+        sim, which may trigger a memory leak in the game.
+        """
         self.messages = []
-        self.aq_title = self._get_value("TITLE").decode("utf-8")
-        self.aq_prev_wp_lat = self._get_value("GPS_WP_PREV_LAT")
-        self.aq_prev_wp_lon = self._get_value("GPS_WP_PREV_LON")
-        self.aq_cur_lat = self._get_value("GPS_POSITION_LAT")
-        self.aq_cur_long = self._get_value("GPS_POSITION_LON")
-        self.aq_next_wp_lat = self._get_value("GPS_WP_NEXT_LAT")
-        self.aq_next_wp_lon = self._get_value("GPS_WP_NEXT_LON")
-        self.aq_next_wp_alt = self._get_value("GPS_WP_NEXT_ALT")
-        self.aq_ground_elevation = self._get_value("GROUND_ALTITUDE")
-        ident = self._get_value("GPS_WP_NEXT_ID").decode("utf-8")
-        self.aq_next_wp_ident = ident
-        self.aq_next_wp_ident = (
-            ident
-            if (
-                self.next_waypoint_altitude()
-                > (self.get_ground_elevation() + self._config.waypoint_minimum_agl)
-                and self._config.waypoint_vnav
-            )
-            else f"LAND ({ident})"
+        self._tick_values = {}
+        self._tick_requests = self.reads.requests
+        self._input_age = 0.0
+        # Every LVar read this tick comes from the same MobiFlight update
+        self.lvars = self.vr.snapshot()
+        if self.aq_title != self._registered_title:
+            self.profile = self.profiles.resolve(self.aq_title)
+            self.register_lvars(self.profile.lvars)
+            self._registered_title = self.aq_title
+
+    aq_title = _simvar("TITLE", _decode)
+    aq_prev_wp_lat = _simvar("GPS_WP_PREV_LAT")
+    aq_prev_wp_lon = _simvar("GPS_WP_PREV_LON")
+    aq_cur_lat = _simvar("GPS_POSITION_LAT")
+    aq_cur_long = _simvar("GPS_POSITION_LON")
+    aq_next_wp_lat = _simvar("GPS_WP_NEXT_LAT")
+    aq_next_wp_lon = _simvar("GPS_WP_NEXT_LON")
+    aq_next_wp_alt = _simvar("GPS_WP_NEXT_ALT")
+    aq_next_wp_id = _simvar("GPS_WP_NEXT_ID", _decode)
+    aq_ground_elevation = _simvar("GROUND_ALTITUDE")
+    aq_pitch = _simvar("PLANE_PITCH_DEGREES")
+    aq_bank = _simvar("PLANE_BANK_DEGREES")
+    aq_vsi = _simvar("VERTICAL_SPEED")
+    aq_cur_waypoint_index = _simvar("GPS_FLIGHT_PLAN_WP_INDEX")
+    aq_num_waypoints = _simvar("GPS_FLIGHT_PLAN_WP_COUNT")
+    aq_agl = _simvar("PLANE_ALT_ABOVE_GROUND")
+    aq_alt_indicated = _simvar("INDICATED_ALTITUDE")
+    aq_heading_hold = _simvar("AUTOPILOT_HEADING_LOCK")
+    aq_approach_hold = _simvar("AUTOPILOT_APPROACH_HOLD")
+    aq_approach_active = _simvar("GPS_IS_APPROACH_ACTIVE")
+    aq_ground_speed = _simvar("GPS_GROUND_SPEED")
+    aq_track = _simvar("GPS_GROUND_TRUE_TRACK")
+    aq_landing_lights = _simvar("LIGHT_LANDING")
+
+    @_PerTick
+    def aq_next_wp_ident(self):
+        ident = self.aq_next_wp_id
+        if (
+            self.next_waypoint_altitude()
+            > (self.get_ground_elevation() + self._config.waypoint_minimum_agl)
+            and self._config.waypoint_vnav
+        ):
+            return ident
+        return f"LAND ({ident})"
+
+    @_PerTick
+    def aq_ap_master(self):
+        return self._with_lvars(
+            "AUTOPILOT_MASTER",
+            self.profile.ap_master_lvars,
+            self.profile.ap_master_combine,
         )
 
-        self.aq_pitch = self._get_value("PLANE_PITCH_DEGREES")
-        self.aq_bank = self._get_value("PLANE_BANK_DEGREES")
-        self.aq_vsi = self._get_value("VERTICAL_SPEED")
-        self.aq_ap_master = self._get_value("AUTOPILOT_MASTER")
-        self.aq_cur_waypoint_index = self._get_value("GPS_FLIGHT_PLAN_WP_INDEX")
-        self.aq_num_waypoints = self._get_value("GPS_FLIGHT_PLAN_WP_COUNT")
-        self.aq_agl = self._get_value("PLANE_ALT_ABOVE_GROUND")
-        self.aq_alt_indicated = self._get_value("INDICATED_ALTITUDE")
-        self.aq_nav_mode = self._get_value("AUTOPILOT_NAV1_LOCK")
-        self.aq_heading_hold = self._get_value("AUTOPILOT_HEADING_LOCK")
-        self.aq_approach_hold = self._get_value("AUTOPILOT_APPROACH_HOLD")
-        self.aq_approach_active = self._get_value("GPS_IS_APPROACH_ACTIVE")
-        self.aq_ground_speed = self._get_value("GPS_GROUND_SPEED")
-        self.aq_ete = self.ete
-        self.aq_flaps_percent = max(
+    @_PerTick
+    def aq_nav_mode(self):
+        return self._with_lvars(
+            "AUTOPILOT_NAV1_LOCK",
+            self.profile.nav_mode_lvars,
+            self.profile.nav_mode_combine,
+        )
+
+    @_PerTick
+    def aq_ete(self):
+        return self.ete
+
+    @_PerTick
+    def aq_flaps_percent(self):
+        return max(
             self._get_value("TRAILING_EDGE_FLAPS_LEFT_PERCENT"),
             self._get_value("TRAILING_EDGE_FLAPS_RIGHT_PERCENT"),
         )
-        self.aq_landing_lights = self._get_value("LIGHT_LANDING")
-        # Not the best way to handle special cases, but I'm just making sure it
-        # works at all fight now.
-        if (
-            "Airbus A320 Neo FlyByWire" in self.aq_title
-            or "Airbus A320neo FlyByWire" in self.aq_title
-        ):
-            self.aq_ap_master = bool(
-                self.vr.get("(L:A32NX_AUTOPILOT_1_ACTIVE)")
-                + self.vr.get("(L:A32NX_AUTOPILOT_2_ACTIVE)")
-            )
-            self.aq_nav_mode = bool(
-                self.vr.get("(L:A32NX_FCU_HDG_MANAGED_DASHES)")
-                + self.vr.get("(L:A32NX_FCU_HDG_MANAGED_DOT)")
-            )
-        if (
-            "Cessna CJ4 Citation Asobo" in self.aq_title
-            or "Boeing 747-8i Asobo" in self.aq_title
-        ):
-            wt_lnav = self.vr.get("(L:WT_CJ4_NAV_ON, Bool)")
-            self.aq_nav_mode = bool(self.aq_nav_mode + wt_lnav)
+
+    def _with_lvars(self, simvar, lvars, combine):
+        """A simvar as adjusted by the profile's LVars. The simvar is not
+        read when the LVars replace it."""
+        if not lvars:
+            return self._get_value(simvar)
+        simvar_value = self._get_value(simvar) if combine == "add" else 0
+        return self._apply_lvars(simvar_value, lvars, combine)
+
+    def _apply_lvars(self, simvar_value, lvars, combine):
+        value = sum(self.lvars.get(lvar) for lvar in lvars)
+        if combine == "add":
+            value += simvar_value
+        return bool(value)
+
+    def register_lvars(self, lvars):
+        """Register LVars and wait briefly until they have reported a value.
+
+        Only done when the aircraft changes, so ordinary ticks never wait.
+        """
+        self.vr.register(lvars)
+        pending = [self.vr.first_value(lvar) for lvar in lvars]
+        # Polled on the clock, so a virtual one does not wait in real time
+        deadline = self.clock.monotonic() + self._lvar_first_value_timeout
+        not_done = [future for future in pending if not future.done()]
+        while not_done and self.clock.monotonic() < deadline:
+            self.clock.sleep(LVAR_POLL_INTERVAL)
+            not_done = [future for future in not_done if not future.done()]
+        if not_done:
+            self.messages.append(f"Warning: {len(not_done)} LVars not received yet.")
+        self.lvars = self.vr.snapshot()
 
     def next_waypoint_altitude(self):
         next_alt = self.aq_next_wp_alt * 3.28084
@@ -139,9 +392,9 @@ class FlightDataMetrics:
         # TIMECLI = Initial climb out of airport. Set to minimum cruise alt.
         # TIMEVER = Seem to be related to arrival. Should be use ground
         # elevation.
-        if "TIMECLI" in self.aq_next_wp_ident:
+        if "TIMECLI" in self.aq_next_wp_id:
             next_alt = self.get_ground_elevation() + self._config.min_agl_cruise
-        elif "TIMEVER" in self.aq_next_wp_ident:
+        elif "TIMEVER" in self.aq_next_wp_id:
             next_alt = self.get_ground_elevation()
 
         if (
@@ -150,6 +403,98 @@ class FlightDataMetrics:
             next_alt = self.get_ground_elevation()
         return next_alt
 
+    def track_legs(self):
+        """Record the course change when the FMS sequences to the next leg.
+
+        The turn is only known when the old next waypoint became the new
+        previous one. A direct-to or a changed plan leaves it unknown.
+        """
+        leg = (
+            self.aq_prev_wp_lat,
+            self.aq_prev_wp_lon,
+            self.aq_next_wp_lat,
+            self.aq_next_wp_lon,
+        )
+        if None in leg or leg == self._leg:
+            return
+        old, self._leg = self._leg, leg
+        self._previous_turn = None
+        if (
+            old is not None
+            and abs(old[2] - leg[0]) < 1e-6
+            and abs(old[3] - leg[1]) < 1e-6
+        ):
+            self._previous_turn = turn_angle(
+                self._course(*old), self._course(*leg)
+            )
+
+    @property
+    def previous_turn(self):
+        """The course change at the previous waypoint in degrees, or None.
+
+        Legs are only tracked while the waypoint guard is reached, so a leg
+        sequenced with e.g. the autopilot off leaves the turn unknown.
+        """
+        self.track_legs()
+        return self._previous_turn
+
+    def _course(self, lat1, lon1, lat2, lon2):
+        return self._get_bearing(
+            radians(lat1), radians(lon1), radians(lat2), radians(lon2)
+        )
+
+    def leg_course(self):
+        """The course of the active leg in degrees."""
+        return self._course(*self._leg)
+
+    def _plan_index(self, plan, lat, lon):
+        for i, wp in enumerate(plan.waypoints):
+            if abs(wp.lat - lat) < 1e-3 and abs(wp.lon - lon) < 1e-3:
+                return i
+        return None
+
+    def find_flight_plan(self):
+        """The saved plan, newest first, that has the active leg in it."""
+        if self.flight_plans is None or self._leg is None:
+            return None
+        prev_lat, prev_lon, next_lat, next_lon = self._leg
+        for plan in self.flight_plans.recent():
+            i = self._plan_index(plan, next_lat, next_lon)
+            if i is not None and i > 0:
+                prev = plan.waypoints[i - 1]
+                if abs(prev.lat - prev_lat) < 1e-3 and abs(prev.lon - prev_lon) < 1e-3:
+                    return plan
+        return None
+
+    def next_turn(self):
+        """The course change at the next waypoint in degrees, or None.
+
+        SimConnect has no waypoint after the next one, so this needs the
+        saved flight plan being flown.
+        """
+        self.track_legs()
+        if self._leg is None:
+            return None
+        next_lat, next_lon = self._leg[2], self._leg[3]
+        plan = self.flight_plan
+        if plan is None or self._plan_index(plan, next_lat, next_lon) is None:
+            # Search again only when the leg or the saved plans change
+            searched = (self._leg, getattr(self.flight_plans, "version", None))
+            if searched != self._plan_searched:
+                self._plan_searched = searched
+                self.flight_plan = self.find_flight_plan()
+            plan = self.flight_plan
+        if plan is None:
+            return None
+        i = self._plan_index(plan, next_lat, next_lon)
+        if i is None or i + 1 >= len(plan.waypoints):
+            return None
+        following = plan.waypoints[i + 1]
+        return turn_angle(
+            self.leg_course(),
+            self._course(next_lat, next_lon, following.lat, following.lon),
+        )
+
     def get_ground_elevation(self):
         # return self.aq_alt_indicated - self.aq_agl
         return self.aq_ground_elevation * 3.28084
@@ -159,6 +504,11 @@ class FlightDataMetrics:
 
     def get_waypoint_distances(self):
         """Get the distance to the previous and next FPL waypoints."""
+        if "waypoint_distances" not in self._tick_values:
+            self._tick_values["waypoint_distances"] = self._waypoint_distances()
+        return self._tick_values["waypoint_distances"]
+
+    def _waypoint_distances(self):
         try:
             prev_wp_lat = self.aq_prev_wp_lat
             prev_wp_lon = self.aq_prev_wp_lon
@@ -287,13 +637,167 @@ class FlightDataMetrics:
         )
 
 
+def _max_input_age(seconds):
+    """Declares the oldest last-known-good input, in seconds, a guard accepts.
+    An older one is a data error, which brings the sim to the minimum rate."""
+
+    def decorate(guard):
+        @wraps(guard)
+        def checked(self, *args, **kwargs):
+            with self.flight_params.max_input_age(seconds):
+                return guard(self, *args, **kwargs)
+
+        return checked
+
+    return decorate
+
+
+class _Verdict:
+    """A guard's result and messages, with the per-tick inputs they were
+    worked out from. See `_reused`."""
+
+    def __init__(self, result, messages, inputs, continuous, holds, config):
+        self.result = result
+        self.messages = messages
+        self.inputs = inputs
+        self.continuous = continuous
+        self.holds = holds
+        self.config = config
+
+    def still_holds(self, fdm):
+        for name, value in self.inputs.items():
+            current = getattr(fdm, name)
+            if name in self.continuous:
+                if current is None:
+                    return False
+            elif current != value:
+                return False
+        return self.holds()
+
+
+def _reused(margin, continuous):
+    """Reuses a guard's last verdict and messages while they cannot have
+    changed, instead of working them out again.
+
+    Every per-tick input the guard used must have the same value, except the
+    `continuous` ones. For those `margin(discriminator, result, inputs)` is
+    called after the guard, and returns a check that the result still holds
+    with their current values, or None when it cannot be reused. A check
+    that fails at once means the guard is clear of its threshold but within
+    the danger band of it, see `near_thresholds`, and it is worked out every
+    tick. That is found with or without the cache.
+    """
+
+    def decorate(guard):
+        @wraps(guard)
+        def reused(self, *args):
+            cache = self._config.decision_cache
+            key = (guard.__name__,) + args
+            verdict = self._verdicts.get(key) if cache else None
+            if verdict is not None and verdict.config is self._config:
+                try:
+                    if verdict.still_holds(self.flight_params):
+                        self.guards_reused += 1
+                        self.messages.extend(verdict.messages)
+                        return verdict.result
+                except (SimConnectDataError, TypeError):
+                    # Worked out again, to fail the way it always has
+                    pass
+            first = len(self.messages)
+            with self.flight_params.record_inputs() as inputs:
+                result = guard(self, *args)
+            holds = margin(self, result, inputs)
+            try:
+                if holds is not None and not holds():
+                    self.near_thresholds.add(guard.__name__)
+                    holds = None
+            except TypeError:
+                holds = None
+            if not cache:
+                return result
+            self.guards_evaluated += 1
+            if holds is None:
+                self._verdicts.pop(key, None)
+            else:
+                self._verdicts[key] = _Verdict(
+                    result,
+                    self.messages[first:],
+                    inputs,
+                    continuous,
+                    holds,
+                    self._config,
+                )
+            return result
+
+        return reused
+
+    return decorate
+
+
+# Guards checked before the flight level change guard in `get_max_sim_rate`,
+# including it. While one of them limits the rate the next is not predicted.
+_AHEAD_OF_FLC = (
+    "autopilot",
+    "cruise configuration",
+    "flight level change",
+    "flight plan",
+    "data error",
+)
+
+
 class SimrateDiscriminator:
     def __init__(self, flight_parameters, config: SimrateControlConfig):
         self._config = config
         self.flight_params: FlightDataMetrics = flight_parameters
         self.messages = []
+        # Guard verdicts reused while their inputs stay clear of the
+        # thresholds, see `_reused`, and how often that happened
+        self._verdicts = {}
+        self.guards_evaluated = 0
+        self.guards_reused = 0
+        # The guards of the last decision that are clear of their thresholds,
+        # but would trip within `danger_band` seconds of flight at max_rate,
+        # or for pitch, bank and vertical speed are past NEAR_LIMIT of theirs
+        self.near_thresholds = set()
         self.have_paused_at_tod = False
+        # The outcome of the last `get_max_sim_rate` and the guard that set it
+        self.max_sim_rate = None
+        self.limiting_guard = None
+        self.terrain = self._open_terrain(config)
+        # Rate cap zones, and why they did not load
+        self.zones = None
+        self.zones_error = None
+        self._load_zones(config)
+
+    def reconfigure(self, config: SimrateControlConfig):
+        if (
+            config.terrain_directory != self._config.terrain_directory
+            or config.terrain_cache_tiles != self._config.terrain_cache_tiles
+        ):
+            if self.terrain is not None:
+                self.terrain.close()
+            self.terrain = self._open_terrain(config)
+        if config.zones_file != self._config.zones_file:
+            self._load_zones(config)
+        self._config = config
+
+    @staticmethod
+    def _open_terrain(config):
+        if not config.terrain_directory:
+            return None
+        return TerrainTiles(config.terrain_directory, config.terrain_cache_tiles)
+
+    def _load_zones(self, config):
+        self.zones = None
+        self.zones_error = None
+        if not config.zones_file:
+            return
+        try:
+            self.zones = load_zones(config.zones_file)
+        except ZoneError as e:
+            self.zones_error = str(e)
 
+    @_max_input_age(2)
     def are_angles_aggressive(self):
         """Check to see if pitch and bank angles are "agressive."
 
@@ -311,12 +815,18 @@ class SimrateDiscriminator:
                 agressive = True
             else:
                 agressive = False
+                if (
+                    pitch > NEAR_LIMIT * self._config.max_pitch
+                    or bank > NEAR_LIMIT * self._config.max_bank
+                ):
+                    self.near_thresholds.add("are_angles_aggressive")
 
         except TypeError:
             raise SimConnectDataError()
 
         return agressive
 
+    @_max_input_age(2)
     def is_vs_aggressive(self):
         """Check to see if the vertical speed is "aggressively" high or low.
 
@@ -328,6 +838,12 @@ class SimrateDiscriminator:
             vsi = self.flight_params.aq_vsi
             if vsi > self._config.min_vsi and vsi < self._config.max_vsi:
                 agressive = False
+                if not (
+                    NEAR_LIMIT * self._config.min_vsi
+                    < vsi
+                    < NEAR_LIMIT * self._config.max_vsi
+                ):
+                    self.near_thresholds.add("is_vs_aggressive")
             else:
                 self.messages.append(f"Agressive VS detected: {vsi} ft/s")
                 agressive = True
@@ -337,6 +853,7 @@ class SimrateDiscriminator:
 
         return agressive
 
+    @_max_input_age(2)
     def is_ap_active(self) -> bool:
         """Is the autopilot configured an a sane way? Namely, is it turned on.
 
@@ -363,6 +880,7 @@ class SimrateDiscriminator:
             raise SimConnectDataError()
         return ap_active
 
+    @_max_input_age(10)
     def is_waypoints_valid(self):
         try:
             sc_is_prev_wp_valid = (
@@ -383,35 +901,104 @@ class SimrateDiscriminator:
         self.messages.append("No valid waypoints detected.")
         return False
 
-    def is_waypoint_close(self):
-        """Check is a waypoint is close by.
-
-        In the future, the definition of "close" could be parameterized on
-        bearing to/out of the waypoint. Greater degrees of turn
-        need more buffer.
+    def _waypoint_buffer(self, angle, rate, nautical_miles_per_second, legacy):
+        """Distance around a waypoint to keep below `rate` for a turn of `angle`.
 
-        IMPORTANT: Buffer size is decided largely by the FMS switching waypoints early
-        to cut corners.
+        No buffer for nearly straight waypoints, the turn lead distance plus
+        `waypoint_buffer` seconds of flight at `rate` for turns of
+        `waypoint_full_buffer_angle` or more, and a share of that in between.
+        An unknown turn keeps the fixed `legacy` buffer.
         """
-        close = True
-        try:
-            ground_speed = self.flight_params.aq_ground_speed  # units: meters/sec
-            mps_to_nmps = 5.4e-4  # one meter per second to 1 nautical mile per second
-            nautical_miles_per_second = ground_speed * mps_to_nmps
-            previous_dist = max(
+        if angle is None:
+            return legacy
+        straight = self._config.waypoint_straight_angle
+        full = self._config.waypoint_full_buffer_angle
+        if angle <= straight:
+            return 0
+        share = min(1.0, (angle - straight) / max(full - straight, 1e-6))
+        lead = turn_lead_distance(angle, nautical_miles_per_second / 5.4e-4)
+        return max(
+            self._config.minimum_waypoint_distance,
+            share
+            * (lead + nautical_miles_per_second * self._config.waypoint_buffer * rate),
+        )
+
+    def _waypoint_buffers(self, nautical_miles_per_second):
+        """The buffers around the previous and next waypoints, in nm."""
+        previous_dist = self._waypoint_buffer(
+            self.flight_params.previous_turn,
+            self._config.cautious_rate,
+            nautical_miles_per_second,
+            max(
                 self._config.minimum_waypoint_distance,
                 ceil(
                     nautical_miles_per_second
                     * self._config.waypoint_buffer
                     * self._config.cautious_rate
                 ),
-            )
-            next_dist = max(
+            ),
+        )
+        next_dist = self._waypoint_buffer(
+            self.flight_params.next_turn(),
+            self._config.max_rate,
+            nautical_miles_per_second,
+            max(
                 self._config.minimum_waypoint_distance,
                 nautical_miles_per_second
                 * self._config.waypoint_buffer
                 * self._config.max_rate,
+            ),
+        )
+        return previous_dist, next_dist
+
+    def _band_seconds(self):
+        """The danger band in seconds of flight."""
+        return self._config.max_rate * self._config.danger_band
+
+    def _waypoint_margin(self, close, inputs):
+        """Clear of both waypoints holds until the aircraft may have flown into
+        a buffer, going by an upper bound of how far it has moved since."""
+        if close:
+            return None
+        fp = self.flight_params
+        lat, lon = fp.aq_cur_lat, fp.aq_cur_long
+        clearance = fp.get_waypoint_distances()
+
+        def holds():
+            nautical_miles_per_second = fp.aq_ground_speed * 5.4e-4
+            band = (
+                nautical_miles_per_second
+                * self._config.max_rate
+                * self._config.danger_band
+            )
+            previous_dist, next_dist = self._waypoint_buffers(nautical_miles_per_second)
+            moved = distance_bound(lat, lon, fp.aq_cur_lat, fp.aq_cur_long)
+            return (
+                -90 <= fp.aq_cur_lat <= 90
+                and clearance.prev - moved > previous_dist + band
+                and clearance.next - moved > next_dist + band
             )
+
+        return holds
+
+    @_max_input_age(2)
+    @_reused(_waypoint_margin, {"aq_cur_lat", "aq_cur_long", "aq_ground_speed"})
+    def is_waypoint_close(self):
+        """Check is a waypoint is close by.
+
+        "Close" depends on the course change at the waypoint. Greater degrees
+        of turn need more buffer, nearly straight waypoints need none. See
+        `_waypoint_buffer`.
+
+        IMPORTANT: Buffer size is decided largely by the FMS switching waypoints early
+        to cut corners.
+        """
+        close = True
+        try:
+            ground_speed = self.flight_params.aq_ground_speed  # units: meters/sec
+            mps_to_nmps = 5.4e-4  # one meter per second to 1 nautical mile per second
+            nautical_miles_per_second = ground_speed * mps_to_nmps
+            previous_dist, next_dist = self._waypoint_buffers(nautical_miles_per_second)
             clearance = self.flight_params.get_waypoint_distances()
 
             if clearance.prev > previous_dist and clearance.next > next_dist:
@@ -425,11 +1012,15 @@ class SimrateDiscriminator:
 
         return close
 
+    @_max_input_age(2)
     def is_too_low(self, low):
         """Is the plan below `low` AGL"""
         try:
             agl = self.flight_params.aq_agl
             if agl > low:
+                sink = -min(0, self.flight_params.aq_vsi) / 60
+                if agl - sink * self._band_seconds() <= low:
+                    self.near_thresholds.add("is_too_low")
                 return False
         except TypeError:
             raise SimConnectDataError()
@@ -437,6 +1028,104 @@ class SimrateDiscriminator:
         self.messages.append(f"Plane close to ground: {agl} ft AGL")
         return True
 
+    @_max_input_age(5)
+    def is_terrain_ahead(self, rate):
+        """Would the aircraft get below `min_agl_cruise` over the terrain ahead
+        within the lookahead time, flying at `rate`?
+
+        Looks `terrain_lookahead` minutes ahead, scaled by the rate, along the
+        ground track. A descent is projected forward, a climb is not, and the
+        terrain leaving the least clearance counts, not only the highest.
+        """
+        if self.terrain is None:
+            return False
+        try:
+            fp = self.flight_params
+            nm_per_second = fp.ground_speed()
+            seconds = self._config.terrain_lookahead * 60 * rate
+            feet_per_nm = 0.0
+            if nm_per_second > 0:
+                feet_per_nm = min(0, fp.aq_vsi) / 60 / nm_per_second
+
+            def lowest(seconds):
+                return self.terrain.lowest_clearance(
+                    fp.aq_cur_lat,
+                    fp.aq_cur_long,
+                    fp.aq_track,
+                    nm_per_second * seconds,
+                    fp.aq_alt_indicated / 3.28084,
+                    feet_per_nm / 3.28084,
+                    self._config.terrain_sample_spacing,
+                )
+
+            def clear(found):
+                return (
+                    found is None
+                    or found[0] * 3.28084 >= self._config.min_agl_cruise
+                )
+
+            # Clear a danger band further ahead is clear now, in one lookup
+            if clear(lowest(seconds + self._band_seconds())):
+                return False
+            found = lowest(seconds)
+            if clear(found):
+                self.near_thresholds.add("is_terrain_ahead")
+                return False
+            _, elevation, distance = found
+            feet = elevation * 3.28084
+        except TypeError:
+            raise SimConnectDataError()
+
+        self.messages.append(
+            f"Terrain {int(feet)} ft in {distance:.1f} nm at {rate}x"
+        )
+        return True
+
+    @_max_input_age(2)
+    def zone_limit(self, rate):
+        """The lowest max rate of the zones the aircraft is in, or would
+        enter within the lookahead flying at `rate`. None if there are none.
+
+        Looks `zones_lookahead` minutes ahead, scaled by the rate, along the
+        ground track, with the altitude projected by the vertical speed.
+        """
+        if self.zones is None:
+            return None
+        try:
+            fp = self.flight_params
+            nm_per_second = fp.ground_speed()
+            distance_nm = nm_per_second * self._config.zones_lookahead * 60 * rate
+            feet_per_nm = 0.0
+            if nm_per_second > 0:
+                feet_per_nm = fp.aq_vsi / 60 / nm_per_second
+            # A danger band further, to tell whether a lower cap is near
+            ahead = self.zones.ahead(
+                fp.aq_cur_lat,
+                fp.aq_cur_long,
+                fp.aq_track,
+                distance_nm + nm_per_second * self._band_seconds(),
+                fp.aq_alt_indicated,
+                feet_per_nm,
+            )
+        except TypeError:
+            raise SimConnectDataError()
+        beyond = [zone.max_rate for distance, zone in ahead if distance > distance_nm]
+        ahead = [hit for hit in ahead if hit[0] <= distance_nm]
+        cap = min((zone.max_rate for _, zone in ahead), default=rate)
+        if beyond and min(beyond) < min(cap, rate):
+            self.near_thresholds.add("zone_limit")
+        if not ahead:
+            return None
+        distance_nm, zone = min(ahead, key=lambda hit: (hit[1].max_rate, hit[0]))
+        if distance_nm > 0:
+            self.messages.append(
+                f"Zone {zone.name} in {distance_nm:.1f} nm, {zone.max_rate:g}x"
+            )
+        else:
+            self.messages.append(f"In zone {zone.name}, {zone.max_rate:g}x")
+        return zone.max_rate
+
+    @_max_input_age(5)
     def is_last_waypoint(self):
         """Is the FMS targeting the final waypoint?"""
         cur_waypoint_index = self.flight_params.aq_cur_waypoint_index
@@ -453,22 +1142,26 @@ class SimrateDiscriminator:
 
         return True
 
+    def _flc_exempt(self):
+        """Is no flight level change guarded, however close?"""
+        # Allow acceleration if the VSI is better than the required.
+        if (
+            self.flight_params.target_altitude_change() > 0
+            and self.flight_params.aq_vsi >= self.flight_params.required_fpm()
+        ) or (
+            self.flight_params.target_altitude_change() < 0
+            and self.flight_params.aq_vsi <= self.flight_params.required_fpm()
+        ):
+            return True
+
+        return (
+            not self._config.decel_for_climb
+            and self.flight_params.target_altitude_change() > 0
+        )
+
     def is_past_leg_flc(self):
         try:
-            # Allow acceleration if the VSI is better than the required.
-            if (
-                self.flight_params.target_altitude_change() > 0
-                and self.flight_params.aq_vsi >= self.flight_params.required_fpm()
-            ) or (
-                self.flight_params.target_altitude_change() < 0
-                and self.flight_params.aq_vsi <= self.flight_params.required_fpm()
-            ):
-                return False
-
-            if (
-                not self._config.decel_for_climb
-                and self.flight_params.target_altitude_change() > 0
-            ):
+            if self._flc_exempt():
                 return False
 
             if (
@@ -481,6 +1174,37 @@ class SimrateDiscriminator:
             return True
         return False
 
+    def _flc_margin(self, approaching, inputs):
+        """No flight level change needed in level flight before the last
+        waypoint holds while the altitude stays that of the next waypoint and
+        the destination stays further than the approach time."""
+        fp = self.flight_params
+        if approaching or fp.target_altitude_change() != 0 or self.is_last_waypoint():
+            return None
+        seconds = self._config.min_approach_time * 60
+        band = self._band_seconds()
+
+        def holds():
+            return (
+                fp.target_altitude_change() == 0
+                and (not self._config.ete_guard or fp.aq_ete >= seconds + band)
+                and ("aq_cur_lat" not in inputs or -90 <= fp.aq_cur_lat <= 90)
+            )
+
+        return holds
+
+    @_max_input_age(2)
+    @_reused(
+        _flc_margin,
+        {
+            "aq_cur_lat",
+            "aq_cur_long",
+            "aq_ground_speed",
+            "aq_alt_indicated",
+            "aq_ground_elevation",
+            "aq_ete",
+        },
+    )
     def is_flc_needed(self):
         """Checks several items to see if we are "arriving" because there are
         different ways a flight plan may be set up.
@@ -538,7 +1262,10 @@ class SimrateDiscriminator:
 
         return approaching
 
+    @_max_input_age(10)
     def is_cruise_lights(self):
+        if not self.flight_params.profile.check_landing_lights:
+            return True
         lights = (
             not self.flight_params.aq_landing_lights
         )
@@ -546,9 +1273,13 @@ class SimrateDiscriminator:
             self.messages.append("Lights not configured for cruise")
         return lights
 
+    @_max_input_age(10)
     def is_cruise_configured(self):
         cruise_configured = True
-        if self.flight_params.aq_flaps_percent > 0:
+        if (
+            self.flight_params.profile.check_flaps
+            and self.flight_params.aq_flaps_percent > 0
+        ):
             cruise_configured = False
             self.messages.append("Flaps extended")
 
@@ -561,15 +1292,20 @@ class SimrateDiscriminator:
         """
         stable = 1
         self.messages = []
+        self.near_thresholds = set()
+        guard = None
         try:
             if self.is_waypoints_valid():
                 if not self.is_ap_active():
+                    guard = "autopilot"
                     stable = 1
                 elif (
                     not self.is_cruise_configured() or not self.is_cruise_lights()
                 ) and self._config.check_cruise_configuration:
+                    guard = "cruise configuration"
                     stable = 1
                 elif self.is_flc_needed():
+                    guard = "flight level change"
                     if self._config.pause_at_tod and not self.have_paused_at_tod:
                         self.have_paused_at_tod = True
                         self.messages.append("Pause at TOD.")
@@ -578,13 +1314,23 @@ class SimrateDiscriminator:
                         stable = self._config.min_rate
                     self.messages.append("Flight level change needed.")
                 elif self.is_too_low(self._config.min_agl_cruise):
+                    guard = "ground proximity"
                     self.messages.append("Too close to ground.")
                     stable = self._config.min_rate
+                elif self.is_terrain_ahead(self._config.max_rate):
+                    guard = "terrain"
+                    self.messages.append("Rising terrain ahead.")
+                    if self.is_terrain_ahead(self._config.cautious_rate):
+                        stable = self._config.min_rate
+                    else:
+                        stable = self._config.cautious_rate
                 elif self.are_angles_aggressive():
+                    guard = "pitch or bank"
                     self.messages.append("Pitch or bank too high")
                     stable = self._config.cautious_rate
                 elif self.is_vs_aggressive():
                     # pitch/bank may be a better/suffcient proxy
+                    guard = "vertical speed"
                     self.messages.append("Vertical speed too high.")
                     stable = self._config.cautious_rate
                 elif self.is_waypoint_close():
@@ -592,19 +1338,86 @@ class SimrateDiscriminator:
                     # so we slow down far enough away that we don't enter a turn prior
                     # to slowing down (4nm). To keep from speeding up immediately when
                     # a corner is cut we also give until 2.5nm after the switch
+                    guard = "waypoint"
                     self.messages.append("Close to waypoint.")
                     stable = self._config.cautious_rate
                 else:
                     self.messages.append("Flight stable")
                     stable = self._config.max_rate
             else:
+                guard = "flight plan"
                 self.messages.append("No valid flight plan. Stability undefined.")
                 stable = self._config.min_rate
+            if stable > 0:
+                cap = self.zone_limit(stable)
+                if cap is not None and cap < stable:
+                    # A cap, not a stability guard, so the guards above
+                    # still get their say
+                    guard = "zone"
+                    stable = cap
         except SimConnectDataError as e:
+            guard = "data error"
             self.messages.append("DATA ERROR: DECEL")
             stable = self._config.min_rate
 
-        return min(stable, int(self._config.max_rate))
+        if self.zones_error is not None:
+            self.messages.append(f"Zones not loaded: {self.zones_error}")
+        self.limiting_guard = guard
+        self.max_sim_rate = min(stable, int(self._config.max_rate))
+        return self.max_sim_rate
+
+    def upcoming_events(self):
+        """The guards that will lower the rate of the last decision next,
+        going by the current ground speed. {event: (sim seconds until it
+        trips, the rate then)}, see `sc_horizon`. A rate of 0 pauses.
+
+        The waypoint buffer of the next waypoint is predicted in cruise, the
+        flight level change point and the approach time unless a guard
+        checked before them limits the rate.
+        """
+        events = {}
+        if self.max_sim_rate is None or self.limiting_guard in _AHEAD_OF_FLC:
+            return events
+        fp = self.flight_params
+        try:
+            nautical_miles_per_second = fp.ground_speed()
+            if nautical_miles_per_second <= 0:
+                return events
+            cautious = self._config.cautious_rate
+            if self.limiting_guard is None and cautious < self.max_sim_rate:
+                _, next_dist = self._waypoint_buffers(nautical_miles_per_second)
+                clearance = great_circle(
+                    fp.aq_cur_lat, fp.aq_cur_long, fp.aq_next_wp_lat, fp.aq_next_wp_lon
+                )
+                events["waypoint"] = (
+                    (clearance - next_dist) / nautical_miles_per_second,
+                    cautious,
+                )
+            rate = self._config.min_rate
+            if self._config.pause_at_tod and not self.have_paused_at_tod:
+                rate = 0
+            if rate >= self.max_sim_rate:
+                return events
+            if fp.target_altitude_change() != 0 and not self._flc_exempt():
+                events["flight level change"] = (
+                    fp.time_to_flc()
+                    - self._config.descent_safety_factor * self._config.max_rate,
+                    rate,
+                )
+            if self._config.ete_guard:
+                seconds = self._config.min_approach_time * 60
+                events["approach"] = (fp.aq_ete - seconds, rate)
+        except (SimConnectDataError, TypeError, ValueError, ZeroDivisionError):
+            return {}
+        return events
+
+    def hold(self, rate, guard):
+        """Lower the outcome of the last decision to `rate`, for a guard
+        that tripped since."""
+        if self.max_sim_rate is None or rate < self.max_sim_rate:
+            self.max_sim_rate = rate
+            self.limiting_guard = guard
+            self.messages.append(f"Holding {rate}x for {guard}.")
 
     def get_messages(self):
         return self.messages
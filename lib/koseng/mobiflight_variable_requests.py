@@ -1,26 +1,212 @@
 import logging
 import struct
+import threading
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import Future
 from ctypes import sizeof
 from ctypes.wintypes import FLOAT
+from functools import partial
 from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_PERIOD, SIMCONNECT_UNUSED
+from time import monotonic
 
 
 class SimVariable:
-    def __init__(self, id, name, float_value = 0):
+    def __init__(self, id, name, float_value = 0, page = 0, offset = 0):
         self.id = id
         self.name = name
         self.float_value = float_value
+        self.page = page
+        self.offset = offset
+        # clock time of the last update received, None until the first
+        self.received = None
+        self.updates = 0
     def __str__(self):
-        return f"Id={self.id}, value={self.float_value}, name={self.name}"
+        return f"Id={self.id}, value={self.float_value}, name={self.name}, updates={self.updates}"
+
+
+# A value with the seconds since it was received (None if it never was) and
+# the number of updates received so far. MobiFlight only sends changed values,
+# so a large age can also mean the value simply has not changed.
+LVarReading = namedtuple("LVarReading", "value age updates")
+
+
+FLOAT_FROM_DWORD = struct.Struct("<f")
+
+
+class LVarBlock:
+    """Buffered copy of one page's whole LVARS area.
+
+    The dispatch thread copies each update into a spare buffer and then makes
+    it the front buffer. A reader pins the front buffer, and the writer never
+    picks the front or the pinned buffer, so a pinned buffer is never written
+    while it is read. That takes one buffer more than plain double buffering.
+
+    Every update carries the whole area, so whether a slot's own value has
+    arrived is kept per slot: from the update in which the slot changed, or
+    the one current when the module acknowledged adding its variable.
+    """
+
+    BUFFERS = 3
+
+    def __init__(self, size, clock=monotonic):
+        self.size = size
+        self.clock = clock
+        self.buffers = [array("f", bytes(size)) for _ in range(self.BUFFERS)]
+        self.views = [memoryview(b).cast("B") for b in self.buffers]
+        self.front = 0
+        self.pinned = 0
+        self.generation = 0
+        self.received = None
+        slots = len(self.buffers[0])
+        # Per slot, the generation its value first arrived in, -1 until then,
+        # and the time it did
+        self.seen = array("q", [-1]) * slots
+        self.seen_at = array("d", bytes(8 * slots))
+        # Slots of variables added whose value has not arrived yet
+        self.unseen = set()
+
+    def write(self, data):
+        back = 0
+        while back == self.front or back == self.pinned:
+            back += 1
+        previous = self.buffers[self.front]
+        self.views[back][:] = data
+        self.front = back
+        self.received = self.clock()
+        self.generation += 1
+        if self.unseen:
+            current = self.buffers[back]
+            for slot in list(self.unseen):
+                if current[slot] != previous[slot]:
+                    self.acknowledge(slot)
+
+    def watch(self, slot):
+        """Wait for the value of a variable added in `slot`."""
+        if self.seen[slot] < 0:
+            self.unseen.add(slot)
+
+    def acknowledge(self, slot):
+        """The slot holds its variable's value as of the current update."""
+        if self.seen[slot] < 0:
+            self.seen_at[slot] = self.clock()
+            self.seen[slot] = self.generation
+        self.unseen.discard(slot)
+
+    def forget(self):
+        """No slot has a value any more, e.g. after clearing the variables."""
+        self.unseen.clear()
+        self.seen = array("q", [-1]) * len(self.seen)
+
+    def reading(self, slot, generation, received, now):
+        """The age and update count of the slot's value in update
+        `generation`, received at `received`, as of `now`."""
+        seen = self.seen[slot]
+        if seen < 0 or seen > generation:
+            return None, 0
+        seen_at = self.seen_at[slot]
+        if received is None or received < seen_at:
+            received = seen_at
+        return max(0.0, now - received), generation - seen + 1
+
+    def pin(self):
+        front = self.front
+        self.pinned = front
+        while self.front != front:
+            front = self.front
+            self.pinned = front
+        return self.buffers[front], self.generation, self.received
+
+
+class LVarSnapshot:
+    """All LVar values of one tick, taken from the same update of each page."""
+
+    def __init__(self, variable_requests):
+        self._vr = variable_requests
+        self.taken = variable_requests.clock()
+        if variable_requests.block_mode:
+            pinned = [page.block.pin() for page in variable_requests.pages]
+            self._buffers = [buffer for buffer, _, _ in pinned]
+            self.generation = tuple(generation for _, generation, _ in pinned)
+            self._received = [received for _, _, received in pinned]
+        else:
+            self._buffers = None
+            self.generation = None
+
+    def get(self, variableString):
+        sim_var = self._vr.lookup(variableString)
+        if self._buffers is None or sim_var.page >= len(self._buffers):
+            return self._vr.get(variableString)
+        return self._buffers[sim_var.page][sim_var.offset // sizeof(FLOAT)]
+
+    def read(self, variableString):
+        """Like `get`, but with the age and update count of the value."""
+        sim_var = self._vr.lookup(variableString)
+        if self._buffers is None or sim_var.page >= len(self._buffers):
+            return self._vr.read(variableString)
+        slot = sim_var.offset // sizeof(FLOAT)
+        age, updates = self._vr.pages[sim_var.page].block.reading(
+            slot,
+            self.generation[sim_var.page],
+            self._received[sim_var.page],
+            self.taken,
+        )
+        return LVarReading(self._buffers[sim_var.page][slot], age, updates)
+
+
+class LVarPage:
+    """One MobiFlight client and its LVARS client data area.
+
+    Page 0 is the default "MobiFlight" client. Every further page is an
+    additional client registered with the WASM module through
+    "MF.Clients.Add.<name>", which gets its own LVars/Command/Response areas.
+    Work for a page is queued until the module confirms the client exists.
+    """
+
+    def __init__(self, index, name, lvars_area_id, cmd_area_id, response_area_id):
+        self.index = index
+        self.name = name
+        self.lvars_area_id = lvars_area_id
+        self.cmd_area_id = cmd_area_id
+        self.response_area_id = response_area_id
+        self.ready = index == 0
+        self.pending = []
+        self.block = None
+        # In block mode, the slot of each variable added, in the order the
+        # pings sent after them are answered. None for a cleared variable.
+        self.acknowledging = deque()
+
+    def __str__(self):
+        return f"Page={self.index}, name={self.name}, ready={self.ready}"
 
 
 class MobiFlightVariableRequests:
 
-    def __init__(self, simConnect):
+    LVARS_AREA_SIZE = 4096
+    LVARS_PER_PAGE = LVARS_AREA_SIZE // sizeof(FLOAT)
+    RESPONSE_REQUEST_ID_BASE = 0x10000
+    BLOCK_ID_BASE = 0x20000
+
+    def __init__(self, simConnect, client_name="SimrateControl", block_mode=False, clock=monotonic):
         logging.info("MobiFlightVariableRequests __init__")
         self.sm = simConnect
+        self.client_name = client_name
+        # Time of the values received, e.g. a virtual clock's monotonic
+        self.clock = clock
+        # In block mode each page is received as one client data block instead
+        # of one subscription per variable.
+        self.block_mode = block_mode
         self.sim_vars = {}
         self.sim_var_name_to_id = {}
+        self.pages = []
+        # Futures waiting for an update, keyed by variable id
+        self.waiters = {}
+        self.waiters_lock = threading.Lock()
+        # Guards the ready flag and pending work of pages, which the
+        # response to "MF.Clients.Add" changes on another thread
+        self.pages_lock = threading.Lock()
+        # Request ids routed to this instance by `subscribe_to_data_change`
+        self.routed = set()
         self.CLIENT_DATA_AREA_LVARS    = 0
         self.CLIENT_DATA_AREA_CMD      = 1
         self.CLIENT_DATA_AREA_RESPONSE = 2
@@ -29,7 +215,6 @@ class MobiFlightVariableRequests:
         self.DATA_STRING_SIZE = 256
         self.DATA_STRING_OFFSET = 0
         self.DATA_STRING_DEFINITION_ID = 0
-        self.sm.register_client_data_handler(self.client_data_callback_handler)
         self.initialize_client_data_areas()
 
 
@@ -37,20 +222,23 @@ class MobiFlightVariableRequests:
         logging.info("add_to_client_data_definition definition_id=%s, offset=%s, size=%s", definition_id, offset, size)
         self.sm.dll.AddToClientDataDefinition(
             self.sm.hSimConnect,
-            definition_id, 
+            definition_id,
             offset,
             size,
             0,  # fEpsilon
             SIMCONNECT_UNUSED) # DatumId
 
-    
-    def subscribe_to_data_change(self, data_area_id, request_id, definition_id):
+
+    def subscribe_to_data_change(self, data_area_id, request_id, definition_id, handler):
         logging.info("subscribe_to_data_change data_area_id=%s, request_id=%s, definition_id=%s", data_area_id, request_id, definition_id)
+        # Route before subscribing, so the first update is not missed
+        self.sm.route_client_data(request_id, handler)
+        self.routed.add(request_id)
         self.sm.dll.RequestClientData(
             self.sm.hSimConnect,
             data_area_id,
             request_id,
-            definition_id, 
+            definition_id,
             SIMCONNECT_CLIENT_DATA_PERIOD.SIMCONNECT_CLIENT_DATA_PERIOD_ON_SET,
             self.FLAG_CHANGED,
             0, # origin
@@ -62,71 +250,310 @@ class MobiFlightVariableRequests:
         logging.info("send_data data_area_id=%s, definition_id=%s, size=%s, dataBytes=%s", data_area_id, definition_id, size, dataBytes)
         self.sm.dll.SetClientData(
             self.sm.hSimConnect,
-            data_area_id, 
+            data_area_id,
             definition_id,
             self.FLAG_DEFAULT,
             0, # dwReserved
-            size, 
-            dataBytes)  
+            size,
+            dataBytes)
 
 
-    def send_command(self, command):
+    def send_command(self, command, page=None):
         logging.info("send_command command=%s", command)
+        if page is None:
+            page = self.pages[0]
         data_byte_array = bytearray(command, "ascii")
         data_byte_array.extend(bytearray(self.DATA_STRING_SIZE - len(data_byte_array)))  # extend to fix DATA_STRING_SIZE
-        self.send_data(self.CLIENT_DATA_AREA_CMD, self.DATA_STRING_DEFINITION_ID, self.DATA_STRING_SIZE, bytes(data_byte_array))
+        self.send_data(page.cmd_area_id, self.DATA_STRING_DEFINITION_ID, self.DATA_STRING_SIZE, bytes(data_byte_array))
+
+
+    def map_client_data_area(self, name, area_id, size):
+        self.sm.dll.MapClientDataNameToID(self.sm.hSimConnect, name.encode("ascii"), area_id)
+        self.sm.dll.CreateClientData(self.sm.hSimConnect, area_id, size, self.FLAG_DEFAULT)
+
 
-        
     def initialize_client_data_areas(self):
         logging.info("initialize_client_data_areas")
+        # The string definition is shared by the response areas of all pages
+        self.add_to_client_data_definition(self.DATA_STRING_DEFINITION_ID, self.DATA_STRING_OFFSET, self.DATA_STRING_SIZE)
+        if not self.pages:
+            page = LVarPage(0, "MobiFlight", self.CLIENT_DATA_AREA_LVARS, self.CLIENT_DATA_AREA_CMD, self.CLIENT_DATA_AREA_RESPONSE)
+            if self.block_mode:
+                page.block = LVarBlock(self.LVARS_AREA_SIZE, self.clock)
+            self.pages.append(page)
+        for page in self.pages:
+            page.ready = page.index == 0
+            page.pending = []
+            page.acknowledging = deque()
+        self.initialize_page(self.pages[0])
+
+
+    def initialize_page(self, page):
+        logging.info("initialize_page %s", page)
         # register client data area for receiving simvars
-        self.sm.dll.MapClientDataNameToID(self.sm.hSimConnect, "MobiFlight.LVars".encode("ascii"), self.CLIENT_DATA_AREA_LVARS)
-        self.sm.dll.CreateClientData(self.sm.hSimConnect, self.CLIENT_DATA_AREA_LVARS, 4096, self.FLAG_DEFAULT)
+        self.map_client_data_area(page.name + ".LVars", page.lvars_area_id, self.LVARS_AREA_SIZE)
         # register client data area for sending commands
-        self.sm.dll.MapClientDataNameToID(self.sm.hSimConnect, "MobiFlight.Command".encode("ascii"), self.CLIENT_DATA_AREA_CMD)
-        self.sm.dll.CreateClientData(self.sm.hSimConnect, self.CLIENT_DATA_AREA_CMD, self.DATA_STRING_SIZE, self.FLAG_DEFAULT)
+        self.map_client_data_area(page.name + ".Command", page.cmd_area_id, self.DATA_STRING_SIZE)
         # register client data area for receiving responses
-        self.sm.dll.MapClientDataNameToID(self.sm.hSimConnect, "MobiFlight.Response".encode("ascii"), self.CLIENT_DATA_AREA_RESPONSE)
-        self.sm.dll.CreateClientData(self.sm.hSimConnect, self.CLIENT_DATA_AREA_RESPONSE, self.DATA_STRING_SIZE, self.FLAG_DEFAULT)
+        self.map_client_data_area(page.name + ".Response", page.response_area_id, self.DATA_STRING_SIZE)
         # subscribe to WASM Module responses
-        self.add_to_client_data_definition(self.DATA_STRING_DEFINITION_ID, self.DATA_STRING_OFFSET, self.DATA_STRING_SIZE)
-        self.subscribe_to_data_change(self.CLIENT_DATA_AREA_RESPONSE, self.DATA_STRING_DEFINITION_ID, self.DATA_STRING_DEFINITION_ID)
+        self.subscribe_to_data_change(page.response_area_id, self.RESPONSE_REQUEST_ID_BASE + page.index, self.DATA_STRING_DEFINITION_ID, partial(self.receive_response, page))
+        if self.block_mode:
+            # subscribe to the whole LVars area at once
+            block_id = self.BLOCK_ID_BASE + page.index
+            self.add_to_client_data_definition(block_id, 0, self.LVARS_AREA_SIZE)
+            self.subscribe_to_data_change(page.lvars_area_id, block_id, block_id, partial(self.receive_block, page))
 
 
-    # simconnect library callback
-    def client_data_callback_handler(self, client_data):
-        if client_data.dwDefineID in self.sim_vars:
-            data_bytes = struct.pack("I", client_data.dwData[0])
-            float_data = struct.unpack('<f', data_bytes)[0]   # unpack delivers a tuple -> [0]
-            self.sim_vars[client_data.dwDefineID].float_value = round(float_data, 5)
-            logging.debug("client_data_callback_handler %s", self.sim_vars[client_data.dwDefineID])
-        else:
-            logging.warning("client_data_callback_handler DefinitionID %s not found!", client_data.dwDefineID)
+    def add_page(self):
+        index = len(self.pages)
+        page = LVarPage(index, f"{self.client_name}{index}", 3 * index, 3 * index + 1, 3 * index + 2)
+        if self.block_mode:
+            page.block = LVarBlock(self.LVARS_AREA_SIZE, self.clock)
+        self.pages.append(page)
+        self.register_page(page)
+        return page
 
 
-    def get(self, variableString):
-        if variableString not in self.sim_var_name_to_id:
+    def register_page(self, page):
+        logging.info("register_page %s", page)
+        self.send_command("MF.Clients.Add." + page.name)
+
+
+    def page_ready(self, page):
+        logging.info("page_ready %s", page)
+        self.initialize_page(page)
+        with self.pages_lock:
+            page.ready = True
+            pending, page.pending = page.pending, []
+        for work in pending:
+            work()
+
+
+    def run_on_page(self, page, work):
+        with self.pages_lock:
+            if not page.ready:
+                page.pending.append(work)
+                return
+        work()
+
+
+    def handle_response(self, page_index, response):
+        logging.info("handle_response page=%s response=%s", page_index, response)
+        if response == "MF.Pong":
+            self.acknowledge(self.pages[page_index])
+            return
+        for page in self.pages:
+            if not page.ready and response == f"MF.Clients.Add.{page.name}.Finished":
+                self.page_ready(page)
+
+
+    def acknowledge(self, page):
+        with self.pages_lock:
+            slot = page.acknowledging.popleft() if page.acknowledging else None
+        if slot is None or page.block is None:
+            return
+        page.block.acknowledge(slot)
+        if self.waiters:
+            self.resolve_waiters(lambda sim_var: sim_var.page == page.index and sim_var.offset // sizeof(FLOAT) == slot)
+
+
+    # Client data handlers, called on the simconnect dispatch thread with the
+    # message routed to them. Anything slow is handed off to another thread.
+
+    def receive_response(self, page, client_data):
+        response = bytes(memoryview(client_data.dwData).cast("B")[:self.DATA_STRING_SIZE])
+        response = response.split(b"\0", 1)[0].decode("ascii", "ignore")
+        self.sm.handoff(partial(self.handle_response, page.index, response))
+
+
+    def receive_block(self, page, client_data):
+        # one copy of the whole area, no per-value decoding
+        block = page.block
+        block.write(memoryview(client_data.dwData).cast("B")[:self.LVARS_AREA_SIZE])
+        if self.waiters:
+            self.sm.handoff(partial(self.resolve_waiters, lambda sim_var: sim_var.page == page.index and block.seen[sim_var.offset // sizeof(FLOAT)] >= 0))
+
+
+    def receive_value(self, sim_var, client_data):
+        float_data = FLOAT_FROM_DWORD.unpack_from(client_data.dwData)[0]   # unpack delivers a tuple -> [0]
+        sim_var.float_value = round(float_data, 5)
+        sim_var.received = self.clock()
+        sim_var.updates += 1
+        if sim_var.id in self.waiters:
+            self.sm.handoff(partial(self.resolve_variable, sim_var))
+
+
+    def add_sim_variable(self, variableString):
+        id = len(self.sim_vars) + 1
+        page_index, slot = divmod(id - 1, self.LVARS_PER_PAGE)
+        while page_index >= len(self.pages):
+            self.add_page()
+        sim_var = SimVariable(id, variableString, page=page_index, offset=slot*sizeof(FLOAT))
+        self.sim_vars[id] = sim_var
+        self.sim_var_name_to_id[variableString] = id
+        self.subscribe_sim_variable(sim_var)
+        return sim_var
+
+
+    def subscribe_sim_variable(self, sim_var):
+        page = self.pages[sim_var.page]
+        def work():
+            if not self.block_mode:
+                # subscribe to variable data change
+                self.add_to_client_data_definition(sim_var.id, sim_var.offset, sizeof(FLOAT))
+                self.subscribe_to_data_change(page.lvars_area_id, sim_var.id, sim_var.id, partial(self.receive_value, sim_var))
+            else:
+                # Watched first, the block with the value may come at once
+                page.block.watch(sim_var.offset // sizeof(FLOAT))
+            self.send_command("MF.SimVars.Add." + sim_var.name, page)
+            if self.block_mode:
+                # The module answers commands in order, so once it answers
+                # the ping the variable's value is in the block, even an
+                # unchanged 0.0 that sent no update
+                with self.pages_lock:
+                    page.acknowledging.append(sim_var.offset // sizeof(FLOAT))
+                self.send_command("MF.Ping", page)
+        self.run_on_page(page, work)
+
+
+    def register(self, variableStrings):
+        """Declare a set of LVars up front so values arrive before first use.
+
+        Unknown variables are added in one pass, in the order given. Variables
+        that are already registered keep their id and offset.
+        """
+        new_vars = [v for v in dict.fromkeys(variableStrings) if v not in self.sim_var_name_to_id]
+        logging.info("register %s new variables", len(new_vars))
+        for variableString in new_vars:
+            self.add_sim_variable(variableString)
+        return [self.sim_var_name_to_id[v] for v in variableStrings]
+
+
+    def rebind(self, simConnect):
+        """Attach to a new SimConnect handle and replay every registration.
+
+        Ids and offsets are unchanged, so consumers holding variable names or
+        ids see the same variables after a reconnect.
+        """
+        logging.info("rebind %s variables", len(self.sim_vars))
+        if self.sm is not simConnect:
+            for request_id in self.routed:
+                self.sm.unroute_client_data(request_id)
+            self.routed = set()
+            self.sm = simConnect
+        self.initialize_client_data_areas()
+        self.send_command("MF.SimVars.Clear")
+        for page in self.pages[1:]:
+            self.register_page(page)
+        for id in sorted(self.sim_vars):
+            self.subscribe_sim_variable(self.sim_vars[id])
+
+
+    def lookup(self, variableString):
+        variable_id = self.sim_var_name_to_id.get(variableString)
+        if variable_id is None:
             # add new variable
-            id = len(self.sim_vars) + 1
-            self.sim_vars[id] = SimVariable(id, variableString)
-            self.sim_var_name_to_id[variableString] = id
-            # subscribe to variable data change
-            offset = (id-1)*sizeof(FLOAT)
-            self.add_to_client_data_definition(id, offset, sizeof(FLOAT))
-            self.subscribe_to_data_change(self.CLIENT_DATA_AREA_LVARS, id, id)
-            self.send_command("MF.SimVars.Add." + variableString)  
-        # determine id and return value
-        variable_id = self.sim_var_name_to_id[variableString]
-        float_value = self.sim_vars[variable_id].float_value
-        logging.debug("get %s. Return=%s", variableString, float_value)
-        return float_value
-            
+            return self.add_sim_variable(variableString)
+        return self.sim_vars[variable_id]
+
+
+    def get(self, variableString):
+        sim_var = self.lookup(variableString)
+        if self.block_mode:
+            page = self.pages[sim_var.page]
+            return page.block.buffers[page.block.front][sim_var.offset // sizeof(FLOAT)]
+        return sim_var.float_value
+
+
+    def read(self, variableString):
+        """Non-blocking read of a value with its age and update count."""
+        sim_var = self.lookup(variableString)
+        if self.block_mode:
+            block = self.pages[sim_var.page].block
+            age, updates = block.reading(
+                sim_var.offset // sizeof(FLOAT),
+                block.generation,
+                block.received,
+                self.clock(),
+            )
+        else:
+            received = sim_var.received
+            updates = sim_var.updates
+            age = None if received is None else self.clock() - received
+        return LVarReading(self.get(variableString), age, updates)
+
+
+    def first_value(self, variableString):
+        """A future resolved with the first value received for the variable.
+
+        Resolves immediately if a value has already arrived. Use
+        `future.result(timeout)` or `asyncio.wrap_future` to wait for it.
+        """
+        reading = self.read(variableString)
+        if reading.updates > 0:
+            future = Future()
+            future.set_result(reading)
+            return future
+        return self.next_value(variableString)
+
+
+    def next_value(self, variableString):
+        """A future resolved with the next value received for the variable."""
+        sim_var = self.lookup(variableString)
+        future = Future()
+        with self.waiters_lock:
+            self.waiters.setdefault(sim_var.id, []).append(future)
+        return future
+
+
+    def resolve_waiters(self, matches):
+        with self.waiters_lock:
+            ids = [id for id in self.waiters if id in self.sim_vars and matches(self.sim_vars[id])]
+            resolved = [(id, self.waiters.pop(id)) for id in ids]
+        for id, futures in resolved:
+            reading = self.read(self.sim_vars[id].name)
+            for future in futures:
+                if not future.done():
+                    future.set_result(reading)
+
+
+    def resolve_variable(self, sim_var):
+        with self.waiters_lock:
+            futures = self.waiters.pop(sim_var.id, None)
+        if futures:
+            reading = self.read(sim_var.name)
+            for future in futures:
+                if not future.done():
+                    future.set_result(reading)
+
+
+    def snapshot(self):
+        """Pin the current values of all pages for one consistent read."""
+        return LVarSnapshot(self)
+
 
     def clear_sim_variables(self):
         logging.info("clear_sim_variables")
+        for id in self.sim_vars:
+            if id in self.routed:
+                self.sm.unroute_client_data(id)
+                self.routed.discard(id)
         self.sim_vars.clear()
         self.sim_var_name_to_id.clear()
-        self.send_command("MF.SimVars.Clear")
-        
-
-       
\ No newline at end of file
+        with self.waiters_lock:
+            waiters, self.waiters = self.waiters, {}
+        for futures in waiters.values():
+            for future in futures:
+                future.cancel()
+        for page in self.pages:
+            with self.pages_lock:
+                ready = page.ready
+                if not ready:
+                    page.pending = []
+                # Pings already sent are still answered
+                page.acknowledging = deque([None] * len(page.acknowledging))
+            if page.block is not None:
+                page.block.forget()
+            if ready:
+                self.send_command("MF.SimVars.Clear", page)
@@ -1,39 +1,176 @@
 import logging, logging.handlers
 import ctypes
+import threading
+from collections import deque
 from ctypes import wintypes
 from SimConnect import SimConnect
-from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA
+from SimConnect.Enum import SIMCONNECT_CLIENT_DATA_ID, SIMCONNECT_RECV_ID, SIMCONNECT_RECV_CLIENT_DATA, SIMCONNECT_RECV_SIMOBJECT_DATA_BYTYPE
+
+
+class DispatchTable:
+    """Routes data messages to the one handler registered for their message
+    type and request id, with a single dictionary lookup.
+
+    Client data with a request id nobody routed goes to every handler in
+    `fallbacks`. `dispatch` returns False for messages it did not handle.
+    """
+
+    # Message types routed by request id, and their structures
+    ROUTED = {
+        SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA: SIMCONNECT_RECV_CLIENT_DATA,
+        SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_SIMOBJECT_DATA_BYTYPE: SIMCONNECT_RECV_SIMOBJECT_DATA_BYTYPE,
+    }
+
+    def __init__(self):
+        # (message type, request id) -> handler
+        self.routes = {}
+        self.fallbacks = []
+        self._pointers = {int(recv_id): ctypes.POINTER(structure) for recv_id, structure in self.ROUTED.items()}
+
+
+    def route(self, recv_id, request_id, handler):
+        self.routes[(int(recv_id), request_id)] = handler
+
+
+    def unroute(self, recv_id, request_id):
+        self.routes.pop((int(recv_id), request_id), None)
+
+
+    def dispatch(self, pData):
+        dwID = pData.contents.dwID
+        pointer = self._pointers.get(dwID)
+        if pointer is None:
+            return False
+        message = ctypes.cast(pData, pointer).contents
+        handler = self.routes.get((dwID, message.dwRequestID))
+        if handler is not None:
+            handler(message)
+            return True
+        if dwID != SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA or not self.fallbacks:
+            return False
+        for handler in self.fallbacks:
+            handler(message)
+        return True
+
+
+class DispatchHandoff:
+    """Runs work for the dispatch thread on a worker thread, in order.
+
+    `put` appends to a deque, which takes no lock, so slow work such as
+    resolving futures or answering the WASM module never holds up the
+    messages behind it. The worker is started on first use. Messages are
+    only valid during the dispatch call, so copy what the work needs first.
+    """
+
+    def __init__(self, name="mobiflight-handoff"):
+        self.name = name
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+
+    def put(self, work):
+        if self._closed:
+            return
+        self._queue.append(work)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        # The worker clears the event before it empties the queue
+        if not self._wake.is_set():
+            self._wake.set()
+
+
+    def flush(self, timeout=None):
+        """Wait until the work put so far has run. False on timeout."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self.put(done.set)
+        return done.wait(timeout)
+
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            while self._queue:
+                work = self._queue.popleft()
+                try:
+                    work()
+                except Exception:
+                    logging.exception("Dispatch handoff work failed")
 
 
 class SimConnectMobiFlight(SimConnect):
 
-    def __init__(self, auto_connect=True, library_path=None):
-        self.client_data_handlers = []
+    def __init__(self, auto_connect=True, library_path=None, config_index=0):
+        self.dispatch_table = DispatchTable()
+        self.dispatch_handoff = DispatchHandoff()
         if library_path:
-            super().__init__(auto_connect, library_path)
+            super().__init__(False, library_path)
         else:
-            super().__init__(auto_connect)
+            super().__init__(False)
         # Fix missing types
         self.dll.MapClientDataNameToID.argtypes = [wintypes.HANDLE, ctypes.c_char_p, SIMCONNECT_CLIENT_DATA_ID]
+        # Select the SimConnect.cfg section to connect with, e.g. a remote seat
+        self.config_index = config_index
+        if config_index:
+            open_ = self.dll.Open
+            self.dll.Open = lambda handle, name, hwnd, msg, event, index: open_(
+                handle, name, hwnd, msg, event, config_index
+            )
+        if auto_connect:
+            self.connect()
 
 
     def register_client_data_handler(self, handler):
-        if not handler in self.client_data_handlers:
+        """Receive client data that has no route, see `route_client_data`."""
+        if not handler in self.dispatch_table.fallbacks:
             logging.info("Register new client data handler")
-            self.client_data_handlers.append(handler)
+            self.dispatch_table.fallbacks.append(handler)
 
 
     def unregister_client_data_handler(self, handler):
-        if handler in self.client_data_handlers:
+        if handler in self.dispatch_table.fallbacks:
             logging.info("Unregister client data handler")
-            self.client_data_handlers.remove(handler)
+            self.dispatch_table.fallbacks.remove(handler)
+
+
+    def route_client_data(self, request_id, handler):
+        self.dispatch_table.route(SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA, request_id, handler)
+
+
+    def unroute_client_data(self, request_id):
+        self.dispatch_table.unroute(SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA, request_id)
+
+
+    def register_simobject_data_handler(self, request_id, handler):
+        self.dispatch_table.route(SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_SIMOBJECT_DATA_BYTYPE, request_id, handler)
+
+
+    def unregister_simobject_data_handler(self, request_id):
+        self.dispatch_table.unroute(SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_SIMOBJECT_DATA_BYTYPE, request_id)
+
+
+    def handoff(self, work):
+        """Run `work` off the dispatch thread, see `DispatchHandoff`."""
+        self.dispatch_handoff.put(work)
+
+
+    def exit(self):
+        self.dispatch_handoff.close()
+        super().exit()
 
 
     def my_dispatch_proc(self, pData, cbData, pContext):
-        dwID = pData.contents.dwID
-        if dwID == SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA:
-            client_data = ctypes.cast(pData, ctypes.POINTER(SIMCONNECT_RECV_CLIENT_DATA)).contents
-            for handler in self.client_data_handlers:
-                handler(client_data)
-        else:
+        # Requests made through AircraftRequests, events and the rest are
+        # handled by the base class
+        if not self.dispatch_table.dispatch(pData):
             super().my_dispatch_proc(pData, cbData, pContext)
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""Measure SimConnect client data dispatch at high message rates.
+
+Runs without a simulator. Every LVar update is delivered to a dispatch
+table the way the dispatch thread would, as a pointer to the received
+message. "broadcast" offers every message to the registered client data
+handler, which looks up the request id itself, as before routing. "routed"
+looks the handler up by message type and request id.
+
+With waiters, every update also resolves a pending future, on the dispatch
+thread ("inline") or on the handoff worker ("handoff"). The dispatch time is
+how long the dispatch thread was busy, the total includes the worker.
+
+    python misc/bench_dispatch.py [number of lvars] [rounds]
+"""
+import ctypes
+import os
+import struct
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from SimConnect.Enum import SIMCONNECT_RECV, SIMCONNECT_RECV_CLIENT_DATA, SIMCONNECT_RECV_ID
+from lib.koseng.mobiflight_variable_requests import MobiFlightVariableRequests
+from lib.koseng.simconnect_mobiflight import DispatchHandoff, DispatchTable
+
+
+class NullDll:
+    def __getattr__(self, name):
+        return lambda *args: 0
+
+
+class BenchSimConnect:
+    """The parts of SimConnectMobiFlight that LVar requests use."""
+
+    def __init__(self, table, broadcast, handoff):
+        self.dll = NullDll()
+        self.hSimConnect = None
+        self.table = table
+        self.broadcast = broadcast
+        self._handoff = handoff
+        self.routes = {}
+        if broadcast:
+            table.fallbacks.append(self._receive)
+
+    def _receive(self, message):
+        handler = self.routes.get(message.dwRequestID)
+        if handler is not None:
+            handler(message)
+
+    def route_client_data(self, request_id, handler):
+        if self.broadcast:
+            self.routes[request_id] = handler
+        else:
+            self.table.route(SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA, request_id, handler)
+
+    def unroute_client_data(self, request_id):
+        self.routes.pop(request_id, None)
+        self.table.unroute(SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA, request_id)
+
+    def handoff(self, work):
+        if self._handoff is None:
+            work()
+        else:
+            self._handoff.put(work)
+
+
+def make_messages(vr):
+    messages = []
+    for sim_var in vr.sim_vars.values():
+        message = SIMCONNECT_RECV_CLIENT_DATA()
+        message.dwID = SIMCONNECT_RECV_ID.SIMCONNECT_RECV_ID_CLIENT_DATA
+        message.dwSize = ctypes.sizeof(message)
+        message.dwDefineID = sim_var.id
+        message.dwRequestID = sim_var.id
+        message.dwData[0] = struct.unpack("I", struct.pack("<f", sim_var.id * 0.5))[0]
+        messages.append(message)
+    # Keep the messages alive with their pointers
+    pointers = [ctypes.cast(ctypes.pointer(m), ctypes.POINTER(SIMCONNECT_RECV)) for m in messages]
+    return messages, pointers
+
+
+def run(count, rounds, broadcast, waiters=False, handoff=None):
+    table = DispatchTable()
+    vr = MobiFlightVariableRequests(BenchSimConnect(table, broadcast, handoff))
+    names = [f"(L:BENCH_{i})" for i in range(count)]
+    vr.register(names)
+    # Extra pages are normally confirmed by the WASM module.
+    for page in vr.pages:
+        if not page.ready:
+            vr.page_ready(page)
+    messages, pointers = make_messages(vr)
+    dispatch = 0
+    total = 0
+    for _ in range(rounds):
+        if waiters:
+            futures = [vr.next_value(name) for name in names]
+        start = default_timer()
+        for pointer in pointers:
+            table.dispatch(pointer)
+        dispatch += default_timer() - start
+        if handoff is not None:
+            handoff.flush()
+        total += default_timer() - start
+        if waiters:
+            assert all(future.done() for future in futures)
+    mode = "broadcast" if broadcast else "routed"
+    if waiters:
+        mode += ", handoff" if handoff is not None else ", inline"
+    rate = len(pointers) * rounds / dispatch
+    print(
+        f"{mode:>18}: {rate / 1e3:8.1f} k messages/s on the dispatch thread, "
+        f"{dispatch / rounds * 1e3:8.3f} ms dispatch, "
+        f"{total / rounds * 1e3:8.3f} ms total per update"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{count} LVars, {rounds} rounds")
+    run(count, rounds, broadcast=True)
+    run(count, rounds, broadcast=False)
+    run(count, rounds, broadcast=False, waiters=True)
+    handoff = DispatchHandoff()
+    run(count, rounds, broadcast=False, waiters=True, handoff=handoff)
+    handoff.close()
+
+
+main()
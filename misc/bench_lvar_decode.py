@@ -0,0 +1,108 @@
+"""Compare per-variable and block decoding of MobiFlight LVar updates.
+
+Runs without a simulator. Each round delivers one update of every LVar to
+`MobiFlightVariableRequests` the way the dispatch thread would, then reads
+every LVar once the way a control loop tick would.
+
+    python misc/bench_lvar_decode.py [number of lvars] [rounds]
+"""
+import ctypes
+import os
+import struct
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from SimConnect.Enum import SIMCONNECT_RECV_CLIENT_DATA
+from lib.koseng.mobiflight_variable_requests import MobiFlightVariableRequests
+
+
+class NullDll:
+    def __getattr__(self, name):
+        return lambda *args: 0
+
+
+class NullSimConnect:
+    def __init__(self):
+        self.dll = NullDll()
+        self.hSimConnect = None
+        self.routes = {}
+
+    def route_client_data(self, request_id, handler):
+        self.routes[request_id] = handler
+
+    def unroute_client_data(self, request_id):
+        self.routes.pop(request_id, None)
+
+    def handoff(self, work):
+        work()
+
+
+def make_variables(count, block_mode):
+    vr = MobiFlightVariableRequests(NullSimConnect(), block_mode=block_mode)
+    names = [f"(L:BENCH_{i})" for i in range(count)]
+    vr.register(names)
+    # Extra pages are normally confirmed by the WASM module.
+    for page in vr.pages:
+        if not page.ready:
+            vr.page_ready(page)
+    return vr, names
+
+
+def per_variable_messages(vr):
+    messages = []
+    for sim_var in vr.sim_vars.values():
+        message = SIMCONNECT_RECV_CLIENT_DATA()
+        message.dwDefineID = sim_var.id
+        message.dwRequestID = sim_var.id
+        message.dwData[0] = struct.unpack("I", struct.pack("<f", sim_var.id * 0.5))[0]
+        messages.append(message)
+    return messages
+
+
+def block_messages(vr):
+    messages = []
+    for page in vr.pages:
+        message = SIMCONNECT_RECV_CLIENT_DATA()
+        message.dwRequestID = vr.BLOCK_ID_BASE + page.index
+        values = [i * 0.5 for i in range(vr.LVARS_PER_PAGE)]
+        data = struct.pack(f"<{len(values)}f", *values)
+        ctypes.memmove(ctypes.addressof(message.dwData), data, len(data))
+        messages.append(message)
+    return messages
+
+
+def run(count, rounds, block_mode):
+    vr, names = make_variables(count, block_mode)
+    messages = block_messages(vr) if block_mode else per_variable_messages(vr)
+    receive = 0
+    read = 0
+    for _ in range(rounds):
+        start = default_timer()
+        for message in messages:
+            vr.sm.routes[message.dwRequestID](message)
+        receive += default_timer() - start
+        start = default_timer()
+        lvars = vr.snapshot()
+        for name in names:
+            lvars.get(name)
+        read += default_timer() - start
+    mode = "block" if block_mode else "per-variable"
+    print(
+        f"{mode:>12}: {len(messages):6d} messages/update, "
+        f"receive {receive / rounds * 1e3:8.3f} ms, "
+        f"read {read / rounds * 1e3:8.3f} ms per update"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f"{count} LVars, {rounds} rounds")
+    run(count, rounds, block_mode=False)
+    run(count, rounds, block_mode=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Check and time terrain lookups against synthetic SRTM tiles.
+
+Writes a 2 by 2 degree block of 3 arc second tiles with a known slope to a
+temporary directory, checks interpolated elevations against the slope, and
+times single lookups and a full lookahead along a track.
+
+    python misc/bench_terrain.py [lookups]
+"""
+import os
+import struct
+import sys
+import tempfile
+from math import radians
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_terrain import TerrainTiles, tile_name
+
+SAMPLES = 1201
+
+
+def slope(lat, lon):
+    """Rising 1000 m per degree north and 500 m per degree east."""
+    return (lat - 46) * 1000 + (lon + 123) * 500
+
+
+def write_tile(directory, south, west, elevation=slope):
+    last = SAMPLES - 1
+    rows = []
+    for row in range(SAMPLES):
+        lat = south + 1 - row / last
+        values = [round(elevation(lat, west + col / last)) for col in range(SAMPLES)]
+        rows.append(struct.pack(f">{SAMPLES}h", *values))
+    with open(os.path.join(directory, tile_name(south, west)), "wb") as f:
+        f.write(b"".join(rows))
+
+
+def main(lookups=100000):
+    with tempfile.TemporaryDirectory() as directory:
+        for south in (46, 47):
+            for west in (-123, -122):
+                write_tile(directory, south, west)
+        tiles = TerrainTiles(directory)
+
+        worst = 0
+        points = [
+            (46 + i / 98 * 1.99, -123 + (i * 37 % 98) / 98 * 1.99) for i in range(98)
+        ]
+        for lat, lon in points:
+            worst = max(worst, abs(tiles.elevation(lat, lon) - slope(lat, lon)))
+        print(f"Largest interpolation error: {worst:.2f} m")
+        print(f"Outside the tiles: {tiles.elevation(10, 10)}")
+
+        start = default_timer()
+        for i in range(lookups):
+            tiles.elevation(46.5 + (i % 1000) / 1000, -122.5)
+        elapsed = default_timer() - start
+        print(f"Lookup: {elapsed / lookups * 1e6:.2f} us")
+
+        # 16x at 250 knots for one minute, sampled every 0.25 nm
+        distance = 250 / 60 * 16
+        start = default_timer()
+        highest = tiles.highest_along_track(46.1, -122.9, radians(30), distance, 0.25)
+        elapsed = default_timer() - start
+        print(
+            f"Lookahead of {distance:.0f} nm: {elapsed * 1e3:.2f} ms, "
+            f"highest {highest[0]:.0f} m at {highest[1]:.2f} nm"
+        )
+        tiles.close()
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,93 @@
+"""Check and time rate cap zone lookups (see `sc_zones`).
+
+Scatters random polygon and circle zones with altitude bands over a 20 by
+20 degree area, checks that the grid index finds the same zones as testing
+every zone, and times a lookahead query, as made every update, for several
+numbers of zones.
+
+    python misc/bench_zones.py [queries]
+"""
+import os
+import random
+import sys
+from math import cos, pi, radians, sin
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_zones import CircleZone, PolygonZone, ZoneIndex
+
+ZONE_COUNTS = (10, 100, 1000, 10000)
+SOUTH, WEST, SIZE = 40.0, -125.0, 20.0
+# 16x at 250 knots for one minute
+LOOKAHEAD = 250 / 60 * 16
+
+
+def random_zone(rng, i):
+    lat = rng.uniform(SOUTH, SOUTH + SIZE)
+    lon = rng.uniform(WEST, WEST + SIZE)
+    radius = rng.uniform(1, 30)
+    rate = rng.choice((1, 2, 4, 8))
+    floor_ft = rng.choice((None, 0, 5000))
+    ceiling_ft = rng.choice((None, 10000, 18000))
+    if i % 2:
+        return CircleZone(f"circle {i}", rate, lat, lon, radius, floor_ft, ceiling_ft)
+    sides = rng.randint(3, 12)
+    ring = []
+    for k in range(sides):
+        angle = 2 * pi * k / sides
+        r = radius * rng.uniform(0.5, 1.0) / 60
+        ring.append([lon + r * sin(angle) / cos(radians(lat)), lat + r * cos(angle)])
+    ring.append(ring[0])
+    return PolygonZone(f"polygon {i}", rate, [[ring]], floor_ft, ceiling_ft)
+
+
+def random_query(rng):
+    return (
+        rng.uniform(SOUTH, SOUTH + SIZE),
+        rng.uniform(WEST, WEST + SIZE),
+        rng.uniform(0, 2 * pi),
+        rng.uniform(0, LOOKAHEAD),
+        rng.uniform(0, 20000),
+        rng.uniform(-150, 150),
+    )
+
+
+def main(queries=2000):
+    rng = random.Random(1)
+    failed = False
+    for count in ZONE_COUNTS:
+        zones = [random_zone(rng, i) for i in range(count)]
+        start = default_timer()
+        index = ZoneIndex(zones)
+        built = default_timer() - start
+        # One cell holding every zone tests them all
+        brute = ZoneIndex(zones, cell=360.0)
+        checks = [random_query(rng) for _ in range(queries)]
+        mismatches = 0
+        for lat, lon, track, distance, alt, climb in checks:
+            if index.ahead(lat, lon, track, distance, alt, climb) != brute.ahead(
+                lat, lon, track, distance, alt, climb
+            ):
+                mismatches += 1
+        start = default_timer()
+        hits = 0
+        for lat, lon, track, distance, alt, climb in checks:
+            hits += bool(index.ahead(lat, lon, track, distance, alt, climb))
+        indexed = (default_timer() - start) / queries
+        start = default_timer()
+        for lat, lon, track, distance, alt, climb in checks:
+            brute.ahead(lat, lon, track, distance, alt, climb)
+        every = (default_timer() - start) / queries
+        print(
+            f"{count:>6} zones: index built in {built * 1e3:6.1f} ms, "
+            f"lookahead {indexed * 1e6:7.1f} us indexed, {every * 1e6:9.1f} us "
+            f"testing every zone, {hits} of {queries} in or near a zone, "
+            f"{mismatches} different"
+        )
+        failed = failed or mismatches > 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:2]))
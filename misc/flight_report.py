@@ -0,0 +1,25 @@
+"""Print the flight report for recorded telemetry.
+
+Reports are written automatically when the program exits, see the
+[analytics] section of config.ini. This prints them again, e.g. for a
+session that did not end cleanly, or for several sessions at once.
+
+    python misc/flight_report.py flight-20240501-183000.jsonl [...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_analytics import FlightReport
+
+
+def main(paths):
+    for path in paths:
+        print(path)
+        print(FlightReport.from_file(path).format())
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
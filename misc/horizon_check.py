@@ -0,0 +1,77 @@
+"""Measure how close to the top of descent the sim pauses, with and without
+the event horizon (see `sc_horizon`).
+
+Flies the stand-in route with `pause_at_tod` on a virtual clock, see
+`virtual_flight.py`, at several maximum sim rates. Once the sim is paused the
+flight stands still, and the flight data then tells how far past (or before)
+the flight level change point or the approach time the pause landed, in
+seconds at the sim rate it paused at. Each is flown with the control loop
+started at several offsets, as polling depends on where in a tick the
+threshold is crossed.
+
+    python misc/horizon_check.py [config file]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_clock import VirtualClock
+from sc_config import ConfigWatcher
+from sc_standin import StandInConnection, StandInSimulator
+from simrate_control import SimrateController
+from virtual_flight import TIME_LIMIT, RecordingSpeaker
+
+MAX_RATES = (4, 8, 16)
+# Seconds the sim flies before the control loop starts
+OFFSETS = (0.0, 0.2, 0.4, 0.6, 0.8)
+
+
+def overshoot(controller):
+    """Sim seconds flown past the first threshold that trips the flight
+    level change guard, negative when paused before it."""
+    config = controller.config
+    fp = controller.flight_data_metrics
+    fp.update()
+    margins = []
+    if fp.target_altitude_change() != 0:
+        margins.append(fp.time_to_flc() - config.descent_safety_factor * config.max_rate)
+    if config.ete_guard:
+        margins.append(fp.aq_ete - config.min_approach_time * 60)
+    return -min(margins) if margins else None
+
+
+def fly(config_file, max_rate, event_horizon, offset):
+    """Seconds at the sim rate the pause landed after the TOD, or None."""
+    clock = VirtualClock()
+    sim = StandInSimulator(clock=clock.monotonic)
+    connection = StandInConnection(sim)
+    watcher = ConfigWatcher(config_file, clock=clock)
+    watcher.override(pause_at_tod=True, max_rate=max_rate, event_horizon=event_horizon)
+    controller = SimrateController(watcher.config, RecordingSpeaker(), clock=clock)
+    clock.sleep(offset)
+    while sim.leg < len(sim.route) and clock.monotonic() < TIME_LIMIT:
+        controller.step(connection, watcher)
+        if sim.paused:
+            sim_seconds = overshoot(controller)
+            return None if sim_seconds is None else sim_seconds / sim.sim_rate
+        controller.wait()
+    return None
+
+
+def main(config_file="config.ini"):
+    for max_rate in MAX_RATES:
+        for event_horizon in (False, True):
+            label = f"{max_rate:>2}x, {'event horizon' if event_horizon else 'polling':<13}"
+            late = [fly(config_file, max_rate, event_horizon, o) for o in OFFSETS]
+            if None in late:
+                print(f"{label}: did not pause")
+                continue
+            print(
+                f"{label}: paused {sum(late) / len(late):+6.3f} s after the TOD "
+                f"on average, from {min(late):+6.3f} to {max(late):+6.3f} s"
+            )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -10,6 +10,7 @@ class WeightManager:
         self.aq = AircraftRequests(self.sm)
         self.ae = AircraftEvents(self.sm)
         self.extra_weight = 0
+        self.messages = []
         self._request_sleep = 0.01
         self._min_request_sleep = 0.01
         self._max_request_sleep = 0.5
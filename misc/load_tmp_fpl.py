@@ -1,16 +1,36 @@
+"""Load a saved flight plan into the sim.
+
+    python misc/load_tmp_fpl.py              # the most recently saved plan
+    python misc/load_tmp_fpl.py KSEA KPDX    # the newest plan for a route
+
+Parsed plans are cached next to this script, so only new or changed plans
+are read on the next run.
+"""
 from SimConnect import *
 import logging
-from SimConnect.Enum import *
-from time import sleep
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_flightplans import FlightPlanIndex
 
 FPL_DIR = (
     os.getenv("LOCALAPPDATA")
     + "/Packages/Microsoft.FlightSimulator_8wekyb3d8bbwe/LocalState/"
 )
-plns = [f for f in os.listdir(FPL_DIR) if f.endswith(".pln")]
-plan = sorted(plns, key=lambda name: os.path.getmtime(os.path.join(FPL_DIR, name)))[-1]
-print(os.path.join(FPL_DIR, plan))
+CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flight_plans.json")
+
+index = FlightPlanIndex(FPL_DIR, cache_file=CACHE)
+index.scan()
+if len(sys.argv) > 2:
+    plan = index.by_route(sys.argv[1], sys.argv[2])
+else:
+    plan = index.latest()
+if plan is None:
+    print("No matching flight plan found.")
+    quit()
+print(f"{plan.path}: {plan.departure} to {plan.arrival}, {len(plan.waypoints)} waypoints")
 
 logging.basicConfig(level=logging.DEBUG)
 LOGGER = logging.getLogger(__name__)
@@ -18,10 +38,9 @@ LOGGER.info("START")
 sm = SimConnect()
 aq = AircraftRequests(sm)
 
-sleep(1)
+# Reading a value waits until the sim is answering requests
 title = aq.find("TITLE")
 print(title.value)
-print(sm.load_flight_plan(plan))
-sleep(2)
+print(sm.load_flight_plan(plan.path))
 sm.exit()
 quit()
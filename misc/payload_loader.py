@@ -0,0 +1,213 @@
+"""Load payload and fuel into the user aircraft in one batch.
+
+Reads every payload station, fuel tank and the weight limits in one request,
+writes the new distribution in one request and reads it back once to verify.
+
+    python misc/payload_loader.py [options]
+
+    --payload LBS       total payload to load
+    --random            a random payload, from one pilot up to the maximum
+    --fuel PERCENT      fill every tank to this percent of its capacity
+    --strategy NAME     even (default), random, forward or aft
+    --mission FILE      read the above from the [mission] section of an ini
+                        file: payload, passengers, passenger_weight, cargo,
+                        fuel, strategy
+    --standin           load a local stand-in simulator instead of MSFS
+
+Payload is reduced, with a warning, if it would take the aircraft over its
+maximum gross weight with the requested fuel.
+"""
+import argparse
+import configparser
+import os
+import random
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_batch import SimDataBatch
+
+FUEL_TANKS = [
+    "CENTER",
+    "CENTER2",
+    "CENTER3",
+    "LEFT MAIN",
+    "LEFT AUX",
+    "LEFT TIP",
+    "RIGHT MAIN",
+    "RIGHT AUX",
+    "RIGHT TIP",
+    "EXTERNAL1",
+    "EXTERNAL2",
+]
+
+
+def station_shares(strategy, count):
+    """How a payload is split between `count` stations, summing to 1."""
+    if strategy == "even":
+        weights = [1.0] * count
+    elif strategy == "random":
+        weights = [random.random() + 0.1 for _ in range(count)]
+    elif strategy == "forward":
+        weights = [count - i for i in range(count)]
+    elif strategy == "aft":
+        weights = [i + 1 for i in range(count)]
+    else:
+        raise ValueError(f"Unknown strategy {strategy}")
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+class PayloadLoader:
+    """Reads and writes payload and fuel with batched requests."""
+
+    def __init__(self, sm):
+        self.sm = sm
+        self.messages = []
+        limits = SimDataBatch(
+            sm,
+            [
+                ("PAYLOAD STATION COUNT", "Number"),
+                ("EMPTY WEIGHT", "Pounds"),
+                ("MAX GROSS WEIGHT", "Pounds"),
+                ("FUEL WEIGHT PER GALLON", "Pounds"),
+            ],
+        )
+        count, self.empty_weight, self.max_gross_weight, self.fuel_density = (
+            limits.read()
+        )
+        limits.close()
+        self.station_count = int(count)
+        stations = [
+            (f"PAYLOAD STATION WEIGHT:{i}", "Pounds")
+            for i in range(1, self.station_count + 1)
+        ]
+        capacities = SimDataBatch(
+            sm, [(f"FUEL TANK {tank} CAPACITY", "Gallons") for tank in FUEL_TANKS]
+        )
+        self.tanks = {
+            tank: capacity
+            for tank, capacity in zip(FUEL_TANKS, capacities.read())
+            if capacity > 0
+        }
+        capacities.close()
+        # Everything that is written, read back with the same definition
+        self.batch = SimDataBatch(
+            sm,
+            stations
+            + [(f"FUEL TANK {tank} QUANTITY", "Gallons") for tank in self.tanks],
+        )
+
+    def close(self):
+        self.batch.close()
+
+    def read(self):
+        """Station weights (pounds) and tank quantities (gallons)."""
+        values = self.batch.read()
+        return (
+            values[: self.station_count],
+            dict(zip(self.tanks, values[self.station_count :])),
+        )
+
+    @property
+    def maximum_payload(self):
+        return self.max_gross_weight - self.empty_weight
+
+    def load(self, payload, fuel_percent=None, strategy="even"):
+        """Write a payload distribution and fuel in one batch and verify it."""
+        stations, tanks = self.read()
+        if fuel_percent is not None:
+            tanks = {t: c * fuel_percent / 100 for t, c in self.tanks.items()}
+        fuel_weight = sum(tanks.values()) * self.fuel_density
+        available = self.maximum_payload - fuel_weight
+        if payload > available:
+            self.messages.append(
+                f"Payload reduced from {payload:.0f} to {available:.0f} lbs "
+                "to stay under the maximum gross weight."
+            )
+            payload = max(0, available)
+        if self.station_count:
+            stations = [
+                payload * share
+                for share in station_shares(strategy, self.station_count)
+            ]
+        elif payload:
+            self.messages.append("The aircraft has no payload stations.")
+        values = list(stations) + [tanks[t] for t in self.tanks]
+        self.batch.write(values)
+        loaded = self.batch.read()
+        for expected, actual in zip(values, loaded):
+            if abs(expected - actual) > 1:
+                self.messages.append(
+                    f"Verify failed: expected {expected:.1f}, read {actual:.1f}"
+                )
+                break
+        return loaded
+
+
+def read_mission(file):
+    parser = configparser.ConfigParser()
+    parser.read(file)
+    if not parser.has_section("mission"):
+        raise ValueError(f"No [mission] section in {file}")
+    mission = parser["mission"]
+    payload = mission.getfloat("payload", 0)
+    payload += mission.getint("passengers", 0) * mission.getfloat(
+        "passenger_weight", 190
+    )
+    payload += mission.getfloat("cargo", 0)
+    fuel = mission.getfloat("fuel") if "fuel" in mission else None
+    return payload, fuel, mission.get("strategy", "even")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load payload and fuel.")
+    parser.add_argument("--payload", type=float)
+    parser.add_argument("--random", action="store_true")
+    parser.add_argument("--fuel", type=float)
+    parser.add_argument(
+        "--strategy", default="even", choices=["even", "random", "forward", "aft"]
+    )
+    parser.add_argument("--mission")
+    parser.add_argument("--standin", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.standin:
+        from sc_standin import StandInSimulator
+
+        sm = StandInSimulator()
+    else:
+        from lib.koseng.simconnect_mobiflight import SimConnectMobiFlight
+
+        sm = SimConnectMobiFlight()
+
+    start = default_timer()
+    loader = PayloadLoader(sm)
+    payload, fuel, strategy = args.payload, args.fuel, args.strategy
+    if args.mission:
+        payload, fuel, strategy = read_mission(args.mission)
+    if args.random:
+        # Minimum weight is at least one pilot
+        low = random.triangular(120, 250, 150)
+        payload = random.triangular(low, loader.maximum_payload)
+    if payload is None:
+        stations, _ = loader.read()
+        payload = sum(stations)
+    loaded = loader.load(payload, fuel, strategy)
+    elapsed = default_timer() - start
+    loader.close()
+
+    stations = loaded[: loader.station_count]
+    gallons = sum(loaded[loader.station_count :])
+    print(f"Stations: {', '.join(f'{w:.0f}' for w in stations)} lbs")
+    print(f"Payload: {sum(stations):.0f} lbs")
+    print(f"Fuel: {gallons:.1f} gal, {gallons * loader.fuel_density:.0f} lbs")
+    for message in loader.messages:
+        print(message)
+    print(f"Done in {elapsed * 1000:.0f} ms")
+    sm.exit()
+
+
+if __name__ == "__main__":
+    main()
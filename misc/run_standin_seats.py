@@ -0,0 +1,54 @@
+"""Run several seats against local stand-in simulators, without MSFS.
+
+Every seat uses the given config file and flies the default stand-in route.
+The status of each seat is printed every few seconds. Announcements are
+printed instead of spoken.
+
+    python misc/run_standin_seats.py [number of seats] [seconds] [config file]
+"""
+import os
+import sys
+from time import monotonic, sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_seats import Seat, SeatSupervisor
+
+
+class PrintSpeaker:
+    def say(self, text):
+        print(f"  (says) {text}")
+
+
+def main(count=3, seconds=30.0, config_file="config.ini"):
+    seats = [Seat(f"Seat {i + 1}", config_file, 0, True) for i in range(count)]
+    supervisor = SeatSupervisor(seats, PrintSpeaker())
+    supervisor.start()
+    end = monotonic() + seconds
+    try:
+        while monotonic() < end:
+            sleep(min(5.0, max(0.0, end - monotonic())))
+            for status in supervisor.statuses():
+                rate = status["sim_rate"]
+                print(
+                    f"{status['name']:<8} {status['state']:<12} "
+                    f"rate={rate if rate is None else f'{rate:.2f}'} "
+                    f"target={status['target_rate']} wp={status['waypoint']} "
+                    f"ete={status['ete'] and int(status['ete'])}"
+                )
+            print()
+    finally:
+        sims = [worker.supervisor.handle for worker in supervisor.workers]
+        supervisor.stop()
+    for worker, sim in zip(supervisor.workers, sims):
+        counts = sim.resource_counts() if sim is not None else {}
+        print(f"{worker.seat.name}: {counts}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 3,
+        float(args[1]) if len(args) > 1 else 30.0,
+        args[2] if len(args) > 2 else "config.ini",
+    )
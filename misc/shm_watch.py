@@ -0,0 +1,61 @@
+"""Print the state the controller publishes to shared memory, as an example
+of reading it from another program (see `sc_shm`).
+
+Run the controller with `name` set in the `[shared_memory]` section, then
+
+    python misc/shm_watch.py [name]
+
+Prints a line whenever a new snapshot was published, at most every
+`INTERVAL` seconds.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_shm import DEFAULT_NAME, StateReader
+
+INTERVAL = 0.5
+
+
+def describe(state):
+    if not state["connected"]:
+        return "not connected"
+    if state["paused"]:
+        rate = "paused"
+    else:
+        rate = f"{state['sim_rate'] or 0:g}x of {state['target_rate'] or 0:g}x"
+    line = f"{rate}, limited by {state['limiting_guard'] or 'nothing'}"
+    if state["tod_time"] is not None:
+        line += f", TOD in {state['tod_time']:.0f} s"
+    if state["waypoint_ident"] is not None:
+        line += (
+            f", {state['waypoint_ident']} in {state['waypoint_distance'] or 0:.1f} nm"
+        )
+    return line
+
+
+def main(name=DEFAULT_NAME):
+    try:
+        reader = StateReader(name)
+    except FileNotFoundError:
+        print(f"Nothing is published to {name}")
+        return 1
+    with reader:
+        sequence = None
+        while True:
+            if reader.sequence() != sequence:
+                state = reader.read()
+                sequence = reader.sequence()
+                if state is not None:
+                    age = time.time() - state["updated"]
+                    print(f"{describe(state)} ({age:.1f} s ago)", flush=True)
+            try:
+                time.sleep(INTERVAL)
+            except KeyboardInterrupt:
+                return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:2]))
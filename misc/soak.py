@@ -0,0 +1,221 @@
+"""Fly the stand-in for a day with the whole controller, and fail if memory
+or SimConnect resources keep growing.
+
+Flies the stand-in route on a virtual clock (see `virtual_flight.py`) flight
+after flight, reconnecting between flights the way a restarted sim would be.
+Every `SAMPLE_INTERVAL` virtual seconds it samples:
+
+* the Python heap (tracemalloc), leaving out the stand-in's and this
+  script's own allocations
+* the resident set size, with psutil or /proc where available
+* the number of objects tracked by the garbage collector
+* data requests, definitions, client data subscriptions and LVars
+  outstanding on the stand-in, and the LVars and dispatch routes held by
+  the controller
+
+A measure grows when its lowest value in the last third of the run is above
+its lowest in the first third, after warming up, by more than its allowance
+per hour sampled. Sawtooth patterns like garbage collection do not
+count, a rising floor does. Exits with 1 if any measure grows, after printing
+where the heap grew most, and with 2 for a run too short to tell, under
+`WARM_UP` plus `MIN_SAMPLED` (10 h).
+
+    python misc/soak.py [hours] [config file]
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_clock import VirtualClock
+from sc_config import ConfigWatcher
+from sc_standin import StandInConnection, StandInSimulator
+from simrate_control import SimrateController
+
+try:
+    import psutil
+except ImportError:
+    # Optional, /proc is used on Linux without it
+    psutil = None
+
+# Virtual seconds between samples
+SAMPLE_INTERVAL = 600
+# Virtual seconds before the first sample that counts. Caches and the object
+# count settle over the first few flights.
+WARM_UP = 4 * 3600
+# Virtual seconds sampled after warming up, at least. Over fewer, the first
+# and last thirds are too close together to tell growth from a slow wave.
+MIN_SAMPLED = 6 * 3600
+# How much each measure may grow per hour, e.g. from caches filling up.
+# Counts of SimConnect resources may not grow at all.
+ALLOWANCES = {
+    "heap": 16 * 1024,
+    "rss": 1024 * 1024,
+    "objects": 200,
+}
+# Allocations by these files, this one included, are not the controller's
+IGNORED_FILES = ("*sc_standin.py", "*soak.py", tracemalloc.__file__)
+
+
+class CountingSpeaker:
+    """Counts announcements instead of keeping them, which would grow."""
+
+    def __init__(self):
+        self.said = 0
+
+    def say(self, text):
+        self.said += 1
+
+
+def rss():
+    """Resident set size in bytes, or None where it is not known."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def heap_snapshot():
+    snapshot = tracemalloc.take_snapshot()
+    return snapshot.filter_traces(
+        [tracemalloc.Filter(False, pattern) for pattern in IGNORED_FILES]
+    )
+
+
+def sample(controller, sim):
+    snapshot = heap_snapshot()
+    values = {
+        "heap": sum(stat.size for stat in snapshot.statistics("filename")),
+        "rss": rss(),
+        "objects": len(gc.get_objects()),
+    }
+    counts = sim.resource_counts()
+    for name in (
+        "data_requests",
+        "data_definitions",
+        "client_definitions",
+        "client_subscriptions",
+        "client_lvars",
+    ):
+        values[name] = counts[name]
+    values["lvar_variables"] = len(controller.flight_data_metrics.vr.sim_vars)
+    values["client_data_routes"] = len(sim._client_data_routes)
+    values["horizon_queue"] = len(controller.horizon._queue)
+    return values, snapshot
+
+
+def growth(samples, name):
+    """How much the floor of a measure rose from the first to the last third,
+    per hour sampled."""
+    samples = [s for s in samples if s[name] is not None]
+    if len(samples) < 3:
+        return None
+    values = [s[name] for s in samples]
+    third = len(values) // 3
+    hours = samples[-1]["hours"] - samples[0]["hours"]
+    return (min(values[-third:]) - min(values[:third])) / hours
+
+
+def fly(hours, config_file):
+    clock = VirtualClock()
+    sim = StandInSimulator(clock=clock.monotonic)
+    connection = StandInConnection(sim)
+    watcher = ConfigWatcher(config_file, clock=clock)
+    controller = SimrateController(watcher.config, CountingSpeaker(), clock=clock)
+    samples = []
+    baseline = None
+    flights = 1
+    next_sample = WARM_UP
+    end = hours * 3600
+    while clock.monotonic() < end:
+        controller.step(connection, watcher)
+        if connection.handle is None:
+            sim.reconnect()
+            connection.reconnect(sim)
+        else:
+            controller.wait()
+        if sim.leg >= len(sim.route):
+            flights += 1
+            sim.restart()
+            sim.disconnect()
+        if clock.monotonic() >= next_sample:
+            next_sample += SAMPLE_INTERVAL
+            if baseline is None:
+                # Taken first, so that every sample counts the objects it
+                # keeps alive
+                baseline = heap_snapshot()
+            values, _ = sample(controller, sim)
+            values["hours"] = clock.monotonic() / 3600
+            values["flights"] = flights
+            samples.append(values)
+            if len(samples) % 6 == 1:
+                print(
+                    f"{values['hours']:5.1f} h, flight {flights:3d}: "
+                    f"heap {values['heap'] / 1024:8.0f} KiB, "
+                    f"rss {(values['rss'] or 0) / 2 ** 20:6.1f} MiB, "
+                    f"{values['objects']} objects, "
+                    f"{values['data_requests']} requests, "
+                    f"{values['lvar_variables']} LVars",
+                    flush=True,
+                )
+    controller.close()
+    return samples, baseline, heap_snapshot()
+
+
+def main(hours=24.0, config_file="config.ini"):
+    shortest = (WARM_UP + MIN_SAMPLED) / 3600
+    if hours < shortest:
+        print(f"Fly at least {shortest:g} h, {WARM_UP / 3600:g} h of it warming up")
+        sys.exit(2)
+    tracemalloc.start()
+    start = default_timer()
+    samples, baseline, final = fly(hours, config_file)
+    seconds = default_timer() - start
+    print(f"{hours:g} h flown in {seconds:.0f} s, {len(samples)} samples")
+    grew = []
+    for name in samples[0]:
+        if name in ("hours", "flights"):
+            continue
+        rise = growth(samples, name)
+        if rise is None:
+            print(f"  {name:<22} not sampled")
+            continue
+        status = "ok"
+        if rise > ALLOWANCES.get(name, 0):
+            status = "grows"
+            grew.append(name)
+        print(f"  {name:<22} {status:<6} floor rose by {rise:.0f} per hour")
+    if grew:
+        print("Heap growth since warm-up, by line:")
+        for stat in final.compare_to(baseline, "lineno")[:10]:
+            print(f"  {stat}")
+    sys.exit(1 if grew else 0)
+
+
+def hours_flown(text):
+    try:
+        hours = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number of hours: {text!r}")
+    if not 0 < hours < float("inf"):
+        raise argparse.ArgumentTypeError(f"hours must be finite and above 0: {text!r}")
+    return hours
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fly the stand-in for hours and fail if resources grow."
+    )
+    parser.add_argument(
+        "hours", nargs="?", type=hours_flown, default=24.0, help="virtual hours"
+    )
+    parser.add_argument("config", nargs="?", default="config.ini", help="config file")
+    args = parser.parse_args()
+    main(args.hours, args.config)
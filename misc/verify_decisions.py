@@ -0,0 +1,135 @@
+"""Check that reusing guard verdicts never changes a decision.
+
+Flies the stand-in route on a virtual clock, see `virtual_flight.py`, with
+several configurations. Every update the controller's decision, made with
+`decision_cache`, is compared to one worked out from scratch from the same
+flight data. Then the flight is flown again without the cache, and both
+flights must make the same sim rate changes at the same times.
+
+Prints how often guards were reused, and the CPU time per update spent
+deciding, not counting simvar reads, overall and in steady cruise (no guard
+limiting the sim rate).
+
+    python misc/verify_decisions.py [config file]
+"""
+import hashlib
+import os
+import sys
+from time import process_time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flight_parameters import SimrateDiscriminator
+from sc_clock import VirtualClock
+from sc_config import ConfigWatcher
+from sc_standin import StandInConnection, StandInSimulator
+from simrate_control import SimrateController
+from virtual_flight import TIME_LIMIT, RecordingSpeaker
+
+VARIANTS = [
+    {},
+    {"waypoint_vnav": False},
+    {"danger_band": 0.0},
+    {"ete_guard": False, "max_rate": 8},
+]
+
+
+class DecisionCheck:
+    """Wraps a discriminator to time it, and to compare each decision with
+    one from a discriminator without the cache."""
+
+    def __init__(self, discriminator, reads, shadow):
+        self.discriminator = discriminator
+        self.reads = reads
+        self.shadow = shadow
+        self.decide = discriminator.get_max_sim_rate
+        self.read = reads.read
+        self.decisions = 0
+        self.mismatches = 0
+        self.seconds = 0.0
+        self.cruise_decisions = 0
+        self.cruise_seconds = 0.0
+        self._reading = 0.0
+        discriminator.get_max_sim_rate = self.get_max_sim_rate
+        reads.read = self.timed_read
+
+    def timed_read(self, *args, **kwargs):
+        start = process_time()
+        try:
+            return self.read(*args, **kwargs)
+        finally:
+            self._reading += process_time() - start
+
+    def get_max_sim_rate(self):
+        self._reading = 0.0
+        start = process_time()
+        rate = self.decide()
+        seconds = process_time() - start - self._reading
+        self.seconds += seconds
+        self.decisions += 1
+        if self.discriminator.limiting_guard is None:
+            self.cruise_seconds += seconds
+            self.cruise_decisions += 1
+        if self.shadow is not None:
+            expected = self.shadow.get_max_sim_rate()
+            decision = (rate, self.discriminator.limiting_guard, self.discriminator.messages)
+            if decision != (expected, self.shadow.limiting_guard, self.shadow.messages):
+                self.mismatches += 1
+                if self.mismatches <= 5:
+                    print(f"  Mismatch: {decision} != {expected, self.shadow.limiting_guard, self.shadow.messages}")
+        return rate
+
+
+def fly(config_file, changes, check):
+    clock = VirtualClock()
+    sim = StandInSimulator(clock=clock.monotonic)
+    connection = StandInConnection(sim)
+    watcher = ConfigWatcher(config_file, clock=clock)
+    watcher.override(**changes)
+    controller = SimrateController(watcher.config, RecordingSpeaker(), clock=clock)
+    decisions = None
+    digest = hashlib.sha256()
+    while sim.leg < len(sim.route) and clock.monotonic() < TIME_LIMIT:
+        start = clock.monotonic()
+        controller.step(connection, watcher)
+        if decisions is None and controller.flight_stability is not None:
+            shadow = None
+            if check:
+                shadow = SimrateDiscriminator(
+                    controller.flight_data_metrics,
+                    controller.config.replace(decision_cache=False),
+                )
+            decisions = DecisionCheck(controller.flight_stability, controller.reads, shadow)
+        controller.wait()
+        digest.update(f"{start:.3f} {sim.sim_rate} {sim.lat:.6f}".encode())
+    return controller.flight_stability, decisions, digest.hexdigest()[:16]
+
+
+def main(config_file="config.ini"):
+    failed = False
+    for changes in VARIANTS:
+        print(f"{changes or 'config.ini'}:")
+        cached, check, digest = fly(config_file, changes, check=True)
+        _, baseline, baseline_digest = fly(
+            config_file, dict(changes, decision_cache=False), check=False
+        )
+        guards = cached.guards_evaluated + cached.guards_reused
+        print(
+            f"  {check.decisions} decisions, {check.mismatches} different, "
+            f"guards reused {cached.guards_reused}/{guards}"
+        )
+        for label, timed in (("with reuse", check), ("without", baseline)):
+            print(
+                f"  Deciding {label}: "
+                f"{timed.seconds / timed.decisions * 1e3:.3f} ms per update, "
+                f"{timed.cruise_seconds / max(1, timed.cruise_decisions) * 1e3:.3f} ms "
+                f"in cruise ({timed.cruise_decisions} updates)"
+            )
+        same = digest == baseline_digest
+        print(f"  Flights {'identical' if same else 'DIFFER'} ({digest}, {baseline_digest})")
+        failed = failed or check.mismatches > 0 or not same
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,92 @@
+"""Fly the stand-in route with the whole controller on a virtual clock.
+
+Every sleep in the controller moves the virtual clock forward instead of
+waiting, so a flight of about an hour runs in seconds, and repeated runs
+give the same result. Prints how much faster than real time the run was and
+the flight report (see `sc_analytics`) of the first run.
+
+    python misc/virtual_flight.py [runs] [config file]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sc_clock import VirtualClock
+from sc_config import ConfigWatcher
+from sc_standin import StandInConnection, StandInSimulator
+from simrate_control import SimrateController
+
+# Give up on flights longer than this, in virtual seconds
+TIME_LIMIT = 4 * 3600
+
+
+class RecordingSpeaker:
+    def __init__(self):
+        self.said = []
+
+    def say(self, text):
+        self.said.append(text)
+
+
+def fly(config_file="config.ini", analytics_directory=None):
+    """Fly the route once. Returns the summary and a digest of every decision."""
+    clock = VirtualClock()
+    sim = StandInSimulator(clock=clock.monotonic)
+    connection = StandInConnection(sim)
+    watcher = ConfigWatcher(config_file, clock=clock)
+    if analytics_directory is not None:
+        watcher.override(analytics_directory=analytics_directory)
+    speaker = RecordingSpeaker()
+    controller = SimrateController(watcher.config, speaker, clock=clock)
+    digest = hashlib.sha256()
+    ticks = 0
+    while sim.leg < len(sim.route) and clock.monotonic() < TIME_LIMIT:
+        start = clock.monotonic()
+        controller.step(connection, watcher)
+        controller.wait()
+        status = controller.status or {}
+        digest.update(f"{start:.3f} {status.get('sim_rate')} {sim.lat:.6f}".encode())
+        ticks += 1
+    report = controller.close()
+    return {
+        "virtual_seconds": clock.monotonic(),
+        "sim_seconds": sim.sim_time,
+        "ticks": ticks,
+        "report": report,
+        "announcements": len(speaker.said),
+        "requests": sim.counters["requests"],
+        "missed": controller.scheduler.missed,
+        "digest": digest.hexdigest()[:16],
+    }
+
+
+def main(runs=1, config_file="config.ini"):
+    directory = tempfile.mkdtemp()
+    for run in range(runs):
+        start = default_timer()
+        result = fly(config_file, directory if run == 0 else None)
+        wall = default_timer() - start
+        virtual = result["virtual_seconds"]
+        print(
+            f"Run {run + 1}: {virtual / 60:.1f} min flown in {wall:.2f} s "
+            f"({virtual / wall:.0f}x real time), {result['ticks']} ticks "
+            f"({result['missed']} late), {result['requests']} requests, "
+            f"digest {result['digest']}"
+        )
+        if run == 0:
+            print(f"Announcements: {result['announcements']}")
+            print()
+            with open(result["report"]) as f:
+                print(f.read())
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 1,
+        args[1] if len(args) > 1 else "config.ini",
+    )
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from collections import Counter
+
+from sc_clock import SYSTEM_CLOCK
+
+# Longer gaps between records (e.g. while disconnected) are not counted
+MAX_GAP = 60.0
+
+
+class FlightRecorder:
+    """Appends the sim rate and the decision behind it to a JSON lines file,
+    once per control loop iteration.
+
+    Each line has the clock time `t`, the sim `rate`, the `target` rate, the
+    configured `max` rate, the limiting `guard` and whether the sim is
+    `paused`.
+    """
+
+    def __init__(self, path, clock=SYSTEM_CLOCK, flush_interval=10.0):
+        self.path = path
+        self.clock = clock
+        self.flush_interval = flush_interval
+        self._file = open(path, "a", encoding="utf-8")
+        self._next_flush = clock.monotonic() + flush_interval
+
+    def record(self, sim_rate, target_rate, max_rate, guard, paused=False):
+        now = self.clock.monotonic()
+        self._file.write(
+            json.dumps(
+                {
+                    "t": round(now, 3),
+                    "rate": sim_rate,
+                    "target": target_rate,
+                    "max": max_rate,
+                    "guard": guard,
+                    "paused": paused,
+                }
+            )
+            + "\n"
+        )
+        if now >= self._next_flush:
+            self._file.flush()
+            self._next_flush = now + self.flush_interval
+
+    def close(self):
+        self._file.close()
+
+
+def session_path(directory, name=None):
+    """A new telemetry file name in `directory`, e.g. flight-20240501-1830.jsonl"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    seat = f"-{name.replace(' ', '_')}" if name else ""
+    return os.path.join(directory, f"flight-{stamp}{seat}.jsonl")
+
+
+class FlightReport:
+    """Totals for a session, built one telemetry record at a time.
+
+    Each record's state is counted until the next record, so memory does not
+    grow with the length of the session. Time while paused counts as wall
+    time but not as sim time.
+    """
+
+    def __init__(self, max_gap=MAX_GAP):
+        self.max_gap = max_gap
+        self.wall_seconds = 0.0
+        self.sim_seconds = 0.0
+        self.paused_seconds = 0.0
+        self.gap_seconds = 0.0
+        self.records = 0
+        self.rate_changes = 0
+        self.rate_seconds = Counter()
+        # Wall seconds each guard held the target below the maximum rate,
+        # and the wall seconds that cost compared to flying at the maximum
+        self.guard_seconds = Counter()
+        self.guard_cost = Counter()
+        self._previous = None
+
+    def add(self, record):
+        previous = self._previous
+        self._previous = record
+        self.records += 1
+        if previous is None:
+            return
+        if record.get("rate") != previous.get("rate"):
+            self.rate_changes += 1
+        seconds = record["t"] - previous["t"]
+        if seconds < 0 or seconds > self.max_gap:
+            self.gap_seconds += max(0.0, seconds)
+            return
+        self.wall_seconds += seconds
+        rate = previous.get("rate")
+        if previous.get("paused") or rate is None:
+            self.paused_seconds += seconds
+            return
+        self.sim_seconds += seconds * rate
+        self.rate_seconds[rate] += seconds
+        maximum = previous.get("max")
+        target = previous.get("target")
+        if maximum and target is not None and target < maximum:
+            guard = previous.get("guard") or "unknown"
+            self.guard_seconds[guard] += seconds
+            self.guard_cost[guard] += seconds * (1 - rate / maximum)
+
+    @classmethod
+    def from_file(cls, path, max_gap=MAX_GAP):
+        report = cls(max_gap)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    report.add(json.loads(line))
+                except (ValueError, KeyError):
+                    # e.g. the last line of a session that did not end cleanly
+                    continue
+        return report
+
+    @property
+    def compression(self):
+        return self.sim_seconds / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def rate_changes_per_hour(self):
+        hours = self.wall_seconds / 3600
+        return self.rate_changes / hours if hours else 0.0
+
+    def format(self):
+        lines = [
+            f"Wall time:    {_duration(self.wall_seconds)}",
+            f"Sim time:     {_duration(self.sim_seconds)}",
+            f"Compression:  {self.compression:.2f}x",
+            f"Paused:       {_duration(self.paused_seconds)}",
+            f"Rate changes: {self.rate_changes} ({self.rate_changes_per_hour:.1f} per hour)",
+        ]
+        if self.gap_seconds:
+            lines.append(f"Not recorded: {_duration(self.gap_seconds)}")
+        lines += ["", "Time at each sim rate:"]
+        for rate, seconds in sorted(self.rate_seconds.items()):
+            share = seconds / self.wall_seconds if self.wall_seconds else 0
+            lines.append(f"  {rate:>5g}x  {_duration(seconds)}  {share:6.1%}")
+        lines += ["", "Guards holding the sim below the maximum rate:"]
+        if not self.guard_seconds:
+            lines.append("  none")
+        for guard, cost in self.guard_cost.most_common():
+            lines.append(
+                f"  {guard:<22} {_duration(self.guard_seconds[guard])} held, "
+                f"{_duration(cost)} lost"
+            )
+        return "\n".join(lines)
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def write_report(telemetry_path):
+    """Write the report for a telemetry file next to it. Returns its path."""
+    report = FlightReport.from_file(telemetry_path)
+    path = os.path.splitext(telemetry_path)[0] + ".txt"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(report.format() + "\n")
+    return path
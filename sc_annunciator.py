@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pyttsx3
+
+try:
+    import winsound
+except ImportError:
+    # Windows only
+    winsound = None
+
+
+def play_wav(data):
+    """Play a WAV file held in memory, until it ends."""
+    winsound.PlaySound(data, winsound.SND_MEMORY | winsound.SND_NODEFAULT)
+
+
+class Annunciator:
+    """Speaks announcements from audio synthesized once per phrase.
+
+    A phrase is synthesized to a WAV buffer the first time it is said, or
+    ahead of time by `prepare`, and played from memory after that. The last
+    `max_phrases` buffers are kept. With a `cache_directory` they are also
+    saved to disk, keyed by the platform, voice and phrase, so a later run
+    plays them without loading the engine at all.
+
+    Without a way to play audio from memory (`winsound` is Windows only),
+    phrases are spoken by the engine as they are said. Shared between threads
+    like `Speaker`, with announcements serialised.
+    """
+
+    def __init__(
+        self,
+        cache_directory=None,
+        voice="",
+        engine_factory=pyttsx3.init,
+        play=None,
+        max_phrases=64,
+    ):
+        self.cache_directory = cache_directory
+        self.voice = voice
+        self.max_phrases = max_phrases
+        self._engine_factory = engine_factory
+        self._play = play if play is not None else (play_wav if winsound else None)
+        self._engine = None
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self._prepare_lock = threading.Lock()
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+
+    def say(self, text):
+        with self._lock:
+            if self._play is not None:
+                try:
+                    self._play(self._buffer(text))
+                    return
+                except (OSError, RuntimeError) as e:
+                    logging.info("Speaking %r directly: %s", text, e)
+            engine = self._get_engine()
+            engine.say(text)
+            engine.runAndWait()
+
+    def prepare(self, phrases):
+        """Synthesize `phrases` in the background, so the first announcement
+        of each is as quick as the rest."""
+        if self._play is None:
+            return
+        phrases = list(phrases)
+        thread = threading.Thread(
+            target=self._prepare, args=(phrases,), name="annunciator", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _prepare(self, phrases):
+        with self._prepare_lock:
+            for text in phrases:
+                with self._lock:
+                    try:
+                        self._buffer(text)
+                    except (OSError, RuntimeError) as e:
+                        logging.info("Could not prepare %r: %s", text, e)
+            with self._lock:
+                # Only loaded again for a phrase nobody prepared
+                self._engine = None
+
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = self._engine_factory()
+            if self.voice:
+                self._engine.setProperty("voice", self.voice)
+        return self._engine
+
+    def _buffer(self, text):
+        data = self._buffers.get(text)
+        if data is not None:
+            self._buffers.move_to_end(text)
+            return data
+        path = self._cache_path(text)
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            data = self._synthesize(text)
+            if path is not None:
+                self._write(path, data)
+        self._buffers[text] = data
+        if len(self._buffers) > self.max_phrases:
+            self._buffers.popitem(last=False)
+        return data
+
+    def _cache_path(self, text):
+        if not self.cache_directory:
+            return None
+        # The platform decides the text-to-speech driver
+        key = "\0".join((sys.platform, self.voice, text))
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_directory, f"{name}.wav")
+
+    def _synthesize(self, text):
+        engine = self._get_engine()
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with open(path, "rb") as f:
+                data = f.read()
+        finally:
+            os.remove(path)
+        if not data:
+            raise RuntimeError(f"No audio synthesized for {text!r}")
+        return data
+
+    @staticmethod
+    def _write(path, data):
+        # Written whole or not at all, for other instances reading the cache
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError as e:
+            logging.info("Could not cache %s: %s", path, e)
@@ -0,0 +1,94 @@
+import ctypes
+import threading
+
+from SimConnect.Enum import (
+    SIMCONNECT_DATATYPE,
+    SIMCONNECT_SIMOBJECT_TYPE,
+    SIMCONNECT_UNUSED,
+)
+
+
+class SimDataBatchError(Exception):
+    pass
+
+
+class SimDataBatch:
+    """Several numeric simvars in one data definition.
+
+    All values are read with one request and written with one
+    SetDataOnSimObject, instead of a round trip per simvar as with
+    `AircraftRequests`. Needs a connection that routes data by request id,
+    like `SimConnectMobiFlight`.
+
+    `definitions` are (name, unit) pairs, e.g. ("PAYLOAD STATION WEIGHT:1",
+    "Pounds").
+    """
+
+    def __init__(self, sm, definitions):
+        self.sm = sm
+        self.definitions = list(definitions)
+        self.definition_id = sm.new_def_id()
+        self.request_id = sm.new_request_id()
+        self._values = None
+        self._received = threading.Event()
+        self._array = ctypes.c_double * len(self.definitions)
+        for name, unit in self.definitions:
+            err = sm.dll.AddToDataDefinition(
+                sm.hSimConnect,
+                self.definition_id.value,
+                name.encode("ascii"),
+                unit.encode("ascii"),
+                SIMCONNECT_DATATYPE.SIMCONNECT_DATATYPE_FLOAT64,
+                0,
+                SIMCONNECT_UNUSED,
+            )
+            if not sm.IsHR(err, 0):
+                raise SimDataBatchError(f"Could not define {name} ({unit})")
+        sm.register_simobject_data_handler(self.request_id.value, self._handle)
+
+    def close(self):
+        self.sm.unregister_simobject_data_handler(self.request_id.value)
+        self.sm.dll.ClearDataDefinition(self.sm.hSimConnect, self.definition_id.value)
+
+    def _handle(self, data):
+        # Only valid during the callback, so copy out
+        values = self._array.from_address(ctypes.addressof(data.dwData))
+        self._values = list(values)
+        self._received.set()
+
+    def read(self, timeout=1.0):
+        """All values, in definition order."""
+        self._received.clear()
+        self.sm.dll.RequestDataOnSimObjectType(
+            self.sm.hSimConnect,
+            self.request_id.value,
+            self.definition_id.value,
+            0,
+            SIMCONNECT_SIMOBJECT_TYPE.SIMCONNECT_SIMOBJECT_TYPE_USER,
+        )
+        if not self._received.wait(timeout):
+            raise SimDataBatchError("Timed out waiting for data")
+        return self._values
+
+    def read_dict(self, timeout=1.0):
+        return dict(zip((name for name, _ in self.definitions), self.read(timeout)))
+
+    def write(self, values):
+        """Set all values, in definition order."""
+        values = list(values)
+        if len(values) != len(self.definitions):
+            raise SimDataBatchError(
+                f"Expected {len(self.definitions)} values, got {len(values)}"
+            )
+        data = self._array(*values)
+        err = self.sm.dll.SetDataOnSimObject(
+            self.sm.hSimConnect,
+            self.definition_id.value,
+            SIMCONNECT_SIMOBJECT_TYPE.SIMCONNECT_SIMOBJECT_TYPE_USER,
+            0,
+            0,
+            ctypes.sizeof(data),
+            ctypes.cast(data, ctypes.c_void_p),
+        )
+        if not self.sm.IsHR(err, 0):
+            raise SimDataBatchError("Could not set data")
@@ -0,0 +1,53 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class SystemClock:
+    """Real time, as used when flying."""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def held(self):
+        """A section that nothing run while sleeping may interrupt, see
+        `sc_horizon.EventHorizon`. Nothing runs while sleeping here."""
+        return nullcontext()
+
+
+class VirtualClock:
+    """Time that only passes when something sleeps.
+
+    `sleep` returns at once after moving the clock forward, so a control loop
+    against a stand-in simulator (see `sc_standin`) runs as fast as it can
+    compute, and the same inputs always give the same run. Give the stand-in
+    `clock=virtual_clock.monotonic` so it flies by the same time.
+
+    All sleepers share one timeline, so runs are only deterministic with a
+    single thread sleeping on the clock.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        return self._now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
+
+    def advance(self, seconds):
+        """Move time forward without anything sleeping."""
+        self.sleep(seconds)
+
+    def held(self):
+        return nullcontext()
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -1,108 +1,375 @@
 import configparser
+import os
+from collections import namedtuple
+
+from sc_clock import SYSTEM_CLOCK
 
 
 class SimrateControlConfigError(Exception):
     pass
 
 
+# One typed config value. `minimum`/`maximum` of None mean unbounded.
+ConfigOption = namedtuple(
+    "ConfigOption", "name section option type default minimum maximum"
+)
+
+OPTIONS = [
+    ConfigOption("annunciation", "simrate", "annunciation", bool, True, None, None),
+    ConfigOption(
+        "decelerate_on_simconnect_error",
+        "simrate",
+        "decelerate_on_simconnect_error",
+        bool,
+        True,
+        None,
+        None,
+    ),
+    # Values higher than 16 are ignored by the sim
+    ConfigOption("max_rate", "simrate", "max_rate", float, 4.0, 0.25, 16.0),
+    ConfigOption("min_rate", "simrate", "min_rate", float, 1.0, 0.25, 16.0),
+    ConfigOption("cautious_rate", "simrate", "cautious_rate", float, 2.0, 0.25, 16.0),
+    ConfigOption("set_barometer", "simrate", "set_barometer", bool, True, None, None),
+    ConfigOption("set_mixture", "simrate", "set_mixture", bool, True, None, None),
+    ConfigOption("min_vsi", "stability", "min_vsi", int, -1250, None, 0),
+    ConfigOption("max_vsi", "stability", "max_vsi", int, 1250, 0, None),
+    ConfigOption("max_bank", "stability", "max_bank", int, 20, 0, 90),
+    ConfigOption("max_pitch", "stability", "max_pitch", int, 10, 0, 90),
+    # seconds
+    ConfigOption("waypoint_buffer", "stability", "waypoint_buffer", int, 15, 0, None),
+    # degrees of course change at a waypoint flown through at full rate
+    ConfigOption(
+        "waypoint_straight_angle",
+        "stability",
+        "waypoint_straight_angle",
+        float,
+        5.0,
+        0,
+        180,
+    ),
+    # degrees of course change that get the whole waypoint buffer
+    ConfigOption(
+        "waypoint_full_buffer_angle",
+        "stability",
+        "waypoint_full_buffer_angle",
+        float,
+        45.0,
+        0,
+        180,
+    ),
+    # nm
+    ConfigOption(
+        "minimum_waypoint_distance",
+        "stability",
+        "minimum_waypoint_distance",
+        float,
+        2.0,
+        0,
+        None,
+    ),
+    # ft
+    ConfigOption("min_agl_cruise", "stability", "min_agl_cruise", int, 1450, 0, None),
+    # These values relate to approach detection
+    # ft
+    ConfigOption(
+        "min_agl_descent", "stability", "min_agl_descent", int, 3050, 0, None
+    ),
+    # nm
+    ConfigOption(
+        "destination_distance",
+        "stability",
+        "destination_distance",
+        float,
+        12.0,
+        0,
+        None,
+    ),
+    # minutes
+    ConfigOption(
+        "min_approach_time", "stability", "min_approach_time", int, 7, 0, None
+    ),
+    ConfigOption(
+        "degrees_of_descent", "stability", "degrees_of_descent", float, -3.0, -90, 0
+    ),
+    ConfigOption("angle_of_climb", "stability", "angle_of_climb", float, 5.0, 0, 90),
+    ConfigOption(
+        "decel_for_climb", "stability", "decel_for_climb", bool, True, None, None
+    ),
+    ConfigOption(
+        "descent_safety_factor",
+        "stability",
+        "descent_safety_factor",
+        float,
+        15.0,
+        0,
+        None,
+    ),
+    ConfigOption(
+        "ap_nav_guarded", "stability", "nav_mode_guarded", bool, True, None, None
+    ),
+    ConfigOption(
+        "ap_approach_hold_guarded",
+        "stability",
+        "approach_hold_guarded",
+        bool,
+        True,
+        None,
+        None,
+    ),
+    ConfigOption(
+        "check_cruise_configuration",
+        "stability",
+        "check_cruise_configuration",
+        bool,
+        True,
+        None,
+        None,
+    ),
+    ConfigOption("ete_guard", "stability", "ete_guarded", bool, True, None, None),
+    ConfigOption("waypoint_vnav", "stability", "waypoint_vnav", bool, True, None, None),
+    ConfigOption("pause_at_tod", "stability", "pause_at_tod", bool, False, None, None),
+    ConfigOption(
+        "altitude_change_tolerance",
+        "metrics",
+        "altitude_change_tolerance",
+        int,
+        100,
+        0,
+        None,
+    ),
+    ConfigOption(
+        "waypoint_minimum_agl", "metrics", "waypoint_minimum_agl", int, 1000, 0, None
+    ),
+    ConfigOption(
+        "lvar_block_mode", "mobiflight", "lvar_block_mode", bool, False, None, None
+    ),
+    ConfigOption(
+        "profile_directory",
+        "aircraft",
+        "profile_directory",
+        str,
+        "profiles",
+        None,
+        None,
+    ),
+    # An empty directory disables the terrain lookahead
+    ConfigOption("terrain_directory", "terrain", "directory", str, "", None, None),
+    # minutes at 1x, multiplied by the sim rate
+    ConfigOption("terrain_lookahead", "terrain", "lookahead", float, 1.0, 0, 60),
+    # nm
+    ConfigOption(
+        "terrain_sample_spacing", "terrain", "sample_spacing", float, 0.25, 0.01, 10
+    ),
+    ConfigOption("terrain_cache_tiles", "terrain", "cache_tiles", int, 16, 1, None),
+    # An empty directory disables the flight plan index
+    ConfigOption(
+        "flight_plan_directory", "flightplans", "directory", str, "", None, None
+    ),
+    # seconds between directory scans
+    ConfigOption(
+        "flight_plan_interval", "flightplans", "interval", float, 2.0, 0.1, None
+    ),
+    ConfigOption("dashboard", "dashboard", "enabled", bool, False, None, None),
+    ConfigOption(
+        "dashboard_host", "dashboard", "host", str, "127.0.0.1", None, None
+    ),
+    ConfigOption("dashboard_port", "dashboard", "port", int, 8765, 0, 65535),
+    # seconds
+    ConfigOption(
+        "display_interval", "metrics", "display_interval", float, 1.0, 0, None
+    ),
+    # seconds
+    ConfigOption("read_deadline", "reads", "deadline", float, 2.0, 0.1, None),
+    ConfigOption("breaker_failures", "reads", "breaker_failures", int, 3, 1, None),
+    # seconds
+    ConfigOption("breaker_reset", "reads", "breaker_reset", float, 30.0, 0, None),
+    ConfigOption(
+        "annunciation_cache", "simrate", "annunciation_cache", str, "", None, None
+    ),
+    ConfigOption(
+        "annunciation_voice", "simrate", "annunciation_voice", str, "", None, None
+    ),
+    ConfigOption("analytics_directory", "analytics", "directory", str, "", None, None),
+    ConfigOption("decision_cache", "stability", "decision_cache", bool, True, None, None),
+    # seconds
+    ConfigOption("danger_band", "stability", "danger_band", float, 5.0, 0, None),
+    ConfigOption("event_horizon", "stability", "event_horizon", bool, True, None, None),
+    # seconds
+    ConfigOption("horizon_drift", "stability", "horizon_drift", float, 0.2, 0, None),
+    # seconds
+    ConfigOption("rate_settle", "simrate", "rate_settle", float, 0.5, 0, None),
+    ConfigOption("loop_min_period", "loop", "min_period", float, 0.25, 0.01, None),
+    ConfigOption("loop_max_period", "loop", "max_period", float, 2.0, 0.01, None),
+    # sim seconds
+    ConfigOption("loop_sim_seconds", "loop", "sim_seconds", float, 4.0, 0, None),
+    ConfigOption("shared_memory", "shared_memory", "name", str, "", None, None),
+    # An empty file disables rate cap zones
+    ConfigOption("zones_file", "zones", "file", str, "", None, None),
+    # minutes at 1x, multiplied by the sim rate
+    ConfigOption("zones_lookahead", "zones", "lookahead", float, 1.0, 0, 60),
+    # Empty accepts commands without a token
+    ConfigOption("dashboard_token", "dashboard", "token", str, "", None, None),
+]
+
+_OPTIONS_BY_NAME = {o.name: o for o in OPTIONS}
+
+
 class SimrateControlConfig:
-    def __init__(self, file=None):
-        if file is None:
-            self.max_vsi = 2000
-            self.min_vsi = -2000
-            self.max_bank = 20
-            self.max_pitch = 10
-            self.waypoint_buffer = 40  # seconds
-            self.min_agl_cruise = 1000  # ft
-
-            # These values relate to approach detection
-            self.min_agl_descent = 3000  # ft
-            self.destination_distance = 10  # nm
-            self.min_approach_time = 7  # minutes
-            # Top of descent is estimated as
-            # ((altitude agl)/final_approach)**descent_safety_factor
-            # where ** is the exponentiation operator.
-            # self.final_approach = 500 # fpm
-            self.degrees_of_descent = 3
-            self.descent_safety_factor = 1.0
-            self.pause_at_tod = False
-        else:
-            self._config = configparser.ConfigParser()
-            self._config.read("config.ini")
-            if self._config.sections() == []:
-                raise SimrateControlConfigError
-
-            self.annunciation = self._config.getboolean("simrate", "annunciation")
-            self.decelerate_on_simconnect_error = self._config.getboolean(
-                "simrate", "decelerate_on_simconnect_error"
-            )
-            self.max_rate = float(self._config["simrate"]["max_rate"])
-            self.min_rate = float(self._config["simrate"]["min_rate"])
-            self.cautious_rate = float(self._config["simrate"]["cautious_rate"])
-            self.set_barometer = self._config.getboolean("simrate", "set_barometer")
-            self.set_mixture = self._config.getboolean("simrate", "set_mixture")
-
-            self.min_vsi = int(self._config["stability"]["min_vsi"])
-            self.max_vsi = int(self._config["stability"]["max_vsi"])
-            self.max_bank = int(self._config["stability"]["max_bank"])
-            self.max_pitch = int(self._config["stability"]["max_pitch"])
-            self.waypoint_buffer = int(
-                self._config["stability"]["waypoint_buffer"]
-            )  # seconds
-            self.minimum_waypoint_distance = float(
-                self._config["stability"]["minimum_waypoint_distance"]
-            )  # nm
-            self.min_agl_cruise = int(self._config["stability"]["min_agl_cruise"])  # ft
-
-            # These values relate to approach detection
-            self.min_agl_descent = int(
-                self._config["stability"]["min_agl_descent"]
-            )  # ft
-            self.destination_distance = float(
-                self._config["stability"]["destination_distance"]
-            )  # nm
-            self.min_approach_time = int(
-                self._config["stability"]["min_approach_time"]
-            )  # minutes
-            # Top of descent is estimated as
-            # ((altitude agl)/final_approach)**descent_safety_factor
-            # where ** is the exponentiation operator.
-            # self.final_approach = int(self._config['stability']['final_approach']) # fpm
-            self.degrees_of_descent = float(
-                self._config["stability"]["degrees_of_descent"]
-            )
-            self.angle_of_climb = float(self._config["stability"]["angle_of_climb"])
-            self.decel_for_climb = self._config["stability"].getboolean(
-                "decel_for_climb"
-            )
-            self.descent_safety_factor = float(
-                self._config["stability"]["descent_safety_factor"]
-            )
-            self.ap_nav_guarded = self._config.getboolean(
-                "stability", "nav_mode_guarded"
-            )
+    """Immutable, validated configuration.
 
-            self.ap_approach_hold_guarded = self._config.getboolean(
-                "stability", "approach_hold_guarded"
-            )
-            self.check_cruise_configuration = self._config.getboolean(
-                "stability", "check_cruise_configuration"
-            )
+    Every value is converted and range checked once when the config is
+    built. Use `replace` to get a changed copy.
+    """
 
-            self.ete_guard = self._config.getboolean(
-                "stability", "ete_guarded"
-            )
+    def __init__(self, file=None, **changes):
+        values = {o.name: o.default for o in OPTIONS}
+        if file is not None:
+            values.update(self._read(file))
+        values.update(changes)
+        self._validate(values)
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "file", file)
 
-            self.waypoint_vnav = self._config.getboolean("stability", "waypoint_vnav")
+    def __setattr__(self, name, value):
+        raise AttributeError(f"SimrateControlConfig is read only ({name})")
 
-            self.pause_at_tod = self._config.getboolean("stability", "pause_at_tod")
+    def __eq__(self, other):
+        return isinstance(other, SimrateControlConfig) and self.values() == (
+            other.values()
+        )
 
-            self.altitude_change_tolerance = int(
-                self._config["metrics"]["altitude_change_tolerance"]
-            )
-            self.waypoint_minimum_agl = int(
-                self._config["metrics"]["waypoint_minimum_agl"]
+    def values(self):
+        return {o.name: getattr(self, o.name) for o in OPTIONS}
+
+    def replace(self, **changes):
+        """A copy of this config with some values changed."""
+        values = self.values()
+        values.update(changes)
+        config = SimrateControlConfig(**values)
+        object.__setattr__(config, "file", self.file)
+        return config
+
+    @staticmethod
+    def _read(file):
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(file)
+        except configparser.Error as e:
+            raise SimrateControlConfigError(str(e))
+        if parser.sections() == []:
+            raise SimrateControlConfigError(f"No configuration found in {file}")
+
+        values = {}
+        for o in OPTIONS:
+            if not parser.has_option(o.section, o.option):
+                continue
+            try:
+                if o.type is bool:
+                    values[o.name] = parser.getboolean(o.section, o.option)
+                else:
+                    values[o.name] = o.type(parser.get(o.section, o.option))
+            except ValueError as e:
+                raise SimrateControlConfigError(f"[{o.section}] {o.option}: {e}")
+
+        if values.get("pause_at_tod"):
+            values["waypoint_vnav"] = False
+        return values
+
+    @staticmethod
+    def _validate(values):
+        for name, value in values.items():
+            o = _OPTIONS_BY_NAME.get(name)
+            if o is None:
+                raise SimrateControlConfigError(f"Unknown option {name}")
+            if o.type is float and isinstance(value, int) and not isinstance(
+                value, bool
+            ):
+                value = values[name] = float(value)
+            if not isinstance(value, o.type):
+                raise SimrateControlConfigError(
+                    f"[{o.section}] {o.option}: expected {o.type.__name__}"
+                )
+            if o.minimum is not None and value < o.minimum:
+                raise SimrateControlConfigError(
+                    f"[{o.section}] {o.option}: {value} is below {o.minimum}"
+                )
+            if o.maximum is not None and value > o.maximum:
+                raise SimrateControlConfigError(
+                    f"[{o.section}] {o.option}: {value} is above {o.maximum}"
+                )
+        if values["min_rate"] > values["max_rate"]:
+            raise SimrateControlConfigError("min_rate is above max_rate")
+        if values["min_vsi"] >= values["max_vsi"]:
+            raise SimrateControlConfigError("min_vsi must be below max_vsi")
+        if values["waypoint_straight_angle"] > values["waypoint_full_buffer_angle"]:
+            raise SimrateControlConfigError(
+                "waypoint_straight_angle is above waypoint_full_buffer_angle"
             )
+        if values["loop_min_period"] > values["loop_max_period"]:
+            raise SimrateControlConfigError("min_period is above max_period")
+
+
+class ConfigWatcher:
+    """Reloads the config file when its modification time changes.
+
+    `poll` is meant to be called between control loop ticks, so a new config
+    only takes effect at a tick boundary. A file that fails to load leaves the
+    last good config active and sets `error`.
+
+    Changes made while running (e.g. key bindings) are kept as overrides on
+    top of the file, until the file itself changes that option.
+    """
+
+    def __init__(self, file, interval=1.0, clock=SYSTEM_CLOCK):
+        self.file = file
+        self.clock = clock
+        self.interval = interval
+        self.error = None
+        self.overrides = {}
+        self._mtime = self._stat()
+        self._base = SimrateControlConfig(file)
+        self.config = self._base
+        self._next_check = clock.monotonic() + interval
+
+    def _stat(self):
+        try:
+            return os.stat(self.file).st_mtime_ns
+        except OSError:
+            return None
+
+    def override(self, **changes):
+        """Apply changes made while running and return the new config."""
+        config = self._base.replace(**self.overrides, **changes)
+        self.overrides.update(changes)
+        self.config = config
+        return config
 
-            if self.pause_at_tod:
-                self.waypoint_vnav = False
+    def poll(self):
+        """Return a newly loaded config, or None if nothing changed."""
+        now = self.clock.monotonic()
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.interval
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        try:
+            base = SimrateControlConfig(self.file)
+            overrides = {
+                name: value
+                for name, value in self.overrides.items()
+                if getattr(base, name) == getattr(self._base, name)
+            }
+            config = base.replace(**overrides)
+        except SimrateControlConfigError as e:
+            self.error = str(e)
+            return None
+        self._base = base
+        self.overrides = overrides
+        self.error = None
+        if config == self.config:
+            return None
+        self.config = config
+        return config
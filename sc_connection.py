@@ -0,0 +1,114 @@
+import logging
+import random
+import threading
+from enum import Enum, auto
+
+from lib.koseng.simconnect_mobiflight import SimConnectMobiFlight
+
+
+class ConnectionState(Enum):
+    DISCONNECTED = auto()
+    CONNECTING = auto()
+    CONNECTED = auto()
+
+
+class ConnectionSupervisor:
+    """Keeps a SimConnect connection open from a background thread.
+
+    Failed attempts are retried with exponential backoff and jitter. The
+    current handle, state and a generation counter (incremented for every new
+    connection) are published as attributes for the control loop to poll.
+    """
+
+    def __init__(
+        self,
+        factory=SimConnectMobiFlight,
+        min_backoff=0.5,
+        max_backoff=30.0,
+        jitter=0.25,
+        check_interval=1.0,
+    ):
+        self._factory = factory
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.check_interval = check_interval
+        self.state = ConnectionState.DISCONNECTED
+        self.handle = None
+        self.generation = 0
+        self.attempts = 0
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="simconnect-supervisor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._close(self.handle)
+        self.handle = None
+        self.state = ConnectionState.DISCONNECTED
+
+    def connection_lost(self, handle, error=None):
+        """Report that `handle` failed. A new connection is made in the background."""
+        if handle is None or handle is not self.handle:
+            return
+        logging.info("SimConnect connection lost: %s", error)
+        self.last_error = error
+        self.handle = None
+        self.state = ConnectionState.DISCONNECTED
+        self._close(handle)
+        self._wake.set()
+
+    def _close(self, handle):
+        if handle is None:
+            return
+        try:
+            handle.exit()
+        except Exception as e:
+            logging.debug("Closing SimConnect handle failed: %s", e)
+
+    def _backoff(self, attempt):
+        delay = min(self.max_backoff, self.min_backoff * 2 ** attempt)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _run(self):
+        failures = 0
+        while not self._stopping:
+            handle = self.handle
+            if handle is not None:
+                # The sim sets `quit` when it shuts down.
+                if getattr(handle, "quit", 0):
+                    self.connection_lost(handle, "Simulator quit")
+                    continue
+                self._wake.wait(self.check_interval)
+                self._wake.clear()
+                continue
+
+            self.state = ConnectionState.CONNECTING
+            self.attempts += 1
+            try:
+                handle = self._factory()
+            except Exception as e:
+                self.last_error = e
+                self.state = ConnectionState.DISCONNECTED
+                self._wake.wait(self._backoff(failures))
+                self._wake.clear()
+                failures += 1
+                continue
+            failures = 0
+            if self._stopping:
+                self._close(handle)
+                break
+            self.generation += 1
+            self.handle = handle
+            self.state = ConnectionState.CONNECTED
+            logging.info("SimConnect connected (generation %s)", self.generation)
@@ -21,6 +21,7 @@ class CursesCommands(Enum):
     MAX_SIMRATE_4 = auto()
     MAX_SIMRATE_8 = auto()
     MAX_SIMRATE_16 = auto()
+    NEXT_SEAT = auto()
 
 
 class ScCurses:
@@ -176,26 +177,82 @@ Messages:
         self._messages = []
         self._screen.clear()
         self.write_layout()
-        if k == ord("q") or k == 3:
-            return CursesCommands.QUIT
-        elif k == ord("p"):
-            return CursesCommands.TOGGLE_ACCEL
-        elif k == ord("w"):
-            return CursesCommands.TOGGLE_VNAV_GUARD
-        elif k == ord("l"):
-            return CursesCommands.TOGGLE_LNAV_GUARD
-        elif k == ord("r"):
-            return CursesCommands.UNPAUSE
-        elif k == ord("0"):
-            return CursesCommands.PAUSE
-        elif k == ord("1"):
-            return CursesCommands.MAX_SIMRATE_1
-        elif k == ord("2"):
-            return CursesCommands.MAX_SIMRATE_2
-        elif k == ord("3"):
-            return CursesCommands.MAX_SIMRATE_4
-        elif k == ord("4"):
-            return CursesCommands.MAX_SIMRATE_8
-        elif k == ord("5"):
-            return CursesCommands.MAX_SIMRATE_16
-        return CursesCommands.NORMAL
+        return read_command(k)
+
+
+def read_command(k):
+    """The command bound to key `k`."""
+    if k == ord("q") or k == 3:
+        return CursesCommands.QUIT
+    elif k == ord("p"):
+        return CursesCommands.TOGGLE_ACCEL
+    elif k == ord("w"):
+        return CursesCommands.TOGGLE_VNAV_GUARD
+    elif k == ord("l"):
+        return CursesCommands.TOGGLE_LNAV_GUARD
+    elif k == ord("r"):
+        return CursesCommands.UNPAUSE
+    elif k == ord("0"):
+        return CursesCommands.PAUSE
+    elif k == ord("1"):
+        return CursesCommands.MAX_SIMRATE_1
+    elif k == ord("2"):
+        return CursesCommands.MAX_SIMRATE_2
+    elif k == ord("3"):
+        return CursesCommands.MAX_SIMRATE_4
+    elif k == ord("4"):
+        return CursesCommands.MAX_SIMRATE_8
+    elif k == ord("5"):
+        return CursesCommands.MAX_SIMRATE_16
+    elif k == ord("\t"):
+        return CursesCommands.NEXT_SEAT
+    return CursesCommands.NORMAL
+
+
+class ScSeatsCurses:
+    """Aggregated status of several seats, one line per seat.
+
+    Commands apply to the selected seat, Tab selects the next one.
+    """
+
+    def __init__(self, screen) -> None:
+        self._screen = screen
+        self._screen.nodelay(True)
+        self._messages = []
+        self.write_layout()
+
+    def write_layout(self):
+        self._screen.addstr(0, 0, "Get-there-itis Simrate Control - Seats")
+        self._screen.addstr(
+            1, 0, "  Seat          Connection    Rate  Target  Next WP   ETE"
+        )
+
+    def write_seat(self, row, status, selected=False):
+        line = 2 + row
+        marker = ">" if selected else " "
+        self._screen.addstr(line, 0, f"{marker} {status['name'][:12]}")
+        self._screen.addstr(line, 16, status["state"][:12])
+        if status["sim_rate"] is not None:
+            self._screen.addstr(line, 30, f"{status['sim_rate']:.2f}x")
+        if status["target_rate"] is not None:
+            self._screen.addstr(line, 38, f"{int(status['target_rate'])}x")
+        if status["waypoint"]:
+            self._screen.addstr(line, 44, str(status["waypoint"])[:8])
+        if status["ete"] is not None:
+            td = timedelta(seconds=int(min(24 * 3600 - 1, max(0, status["ete"]))))
+            self._screen.addstr(line, 54, str(td))
+
+    def write_messages(self, messages: list):
+        self._messages += messages
+
+    def update(self, rows):
+        i = rows + 3
+        self._screen.addstr(i, 0, "Messages:")
+        for m in list(OrderedDict.fromkeys(self._messages))[: curses.LINES - i - 2]:
+            i += 1
+            self._screen.addstr(i, 0, f"{m}"[: curses.COLS - 1])
+        k = self._screen.getch()
+        self._messages = []
+        self._screen.clear()
+        self.write_layout()
+        return read_command(k)
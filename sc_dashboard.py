@@ -0,0 +1,343 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import isfinite
+
+from sc_curses import CursesCommands
+
+# Commands a viewer may send, the same as the curses key bindings
+DASHBOARD_COMMANDS = {
+    c.name: c
+    for c in CursesCommands
+    if c
+    not in (CursesCommands.QUIT, CursesCommands.NORMAL, CursesCommands.NEXT_SEAT)
+}
+
+
+# Host names that only reach this computer
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+# The header a viewer sends the token in, see `Dashboard`
+TOKEN_HEADER = "X-Dashboard-Token"
+
+
+# Compares unequal to any published value
+_MISSING = object()
+
+
+def _json_value(value):
+    if isinstance(value, float):
+        return round(value, 2) if isfinite(value) else None
+    return value
+
+
+class Dashboard:
+    """A local web page showing each seat's status, updated by server-sent events.
+
+    The control loop calls `publish` with the status of a tick. Only the
+    values that changed are kept, and every viewer is served from its own
+    thread, so the control loop never waits on a viewer.
+
+    Commands are only taken for the `seats` given (any seat if None), as
+    JSON from a page of the dashboard itself. Bound to a loopback address,
+    the request must name it as the host. With a `token`, commands must
+    carry it in the TOKEN_HEADER, which the page sends when opened as
+    `http://host:port/?token=...`.
+    """
+
+    # Deltas kept for viewers catching up, older viewers get a snapshot
+    HISTORY = 256
+    KEEPALIVE = 15.0
+
+    def __init__(self, host="127.0.0.1", port=8765, seats=None, token=""):
+        self.host = host
+        self.port = port
+        self.seats = None if seats is None else set(seats)
+        self.token = token
+        self.version = 0
+        self._state = {}
+        self._changes = deque(maxlen=self.HISTORY)
+        self._changed = threading.Condition()
+        self._commands = {}
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        dashboard = self
+
+        class Handler(DashboardRequestHandler):
+            pass
+
+        Handler.dashboard = dashboard
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="dashboard", daemon=True
+        )
+        self._thread.start()
+        logging.info("Dashboard at http://%s:%s/", self.host, self.port)
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        with self._changed:
+            # Wake the event streams so they notice the shutdown
+            self._changed.notify_all()
+        self._server = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def publish(self, seat, status, messages=()):
+        """Record a seat's status. Returns the changed values."""
+        status = {k: _json_value(v) for k, v in (status or {}).items()}
+        status["messages"] = list(messages)
+        with self._changed:
+            current = self._state.setdefault(seat, {})
+            delta = {k: v for k, v in status.items() if current.get(k, _MISSING) != v}
+            if not delta:
+                return delta
+            current.update(delta)
+            self.version += 1
+            self._changes.append((self.version, seat, delta))
+            self._changed.notify_all()
+        return delta
+
+    def snapshot(self):
+        with self._changed:
+            return self.version, {seat: dict(s) for seat, s in self._state.items()}
+
+    def changes_since(self, version, timeout=None):
+        """Changes after `version`, waiting up to `timeout` for some.
+
+        Returns the new version and a list of (seat, delta), or None for the
+        changes when they are no longer kept and a snapshot is needed.
+        """
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.version > version or self._server is None, timeout
+            )
+            if self.version == version:
+                return version, []
+            if not self._changes or self._changes[0][0] > version + 1:
+                return self.version, None
+            return self.version, [
+                (seat, delta) for v, seat, delta in self._changes if v > version
+            ]
+
+    def command(self, seat, name):
+        command = DASHBOARD_COMMANDS.get(name)
+        if command is None or (self.seats is not None and seat not in self.seats):
+            return False
+        self._commands.setdefault(seat, queue.SimpleQueue()).put(command)
+        return True
+
+    def next_command(self, seat):
+        """The next command sent for `seat` from a viewer, or None."""
+        commands = self._commands.get(seat)
+        if commands is None:
+            return None
+        try:
+            return commands.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class DashboardRequestHandler(BaseHTTPRequestHandler):
+    dashboard: Dashboard = None
+
+    def log_message(self, format, *args):
+        logging.debug("dashboard: " + format, *args)
+
+    def _send(self, code, body, content_type="application/json"):
+        body = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/" or self.path.startswith("/?"):
+            self._send(200, DASHBOARD_PAGE, "text/html; charset=utf-8")
+        elif self.path == "/state":
+            version, state = self.dashboard.snapshot()
+            self._send(200, json.dumps({"version": version, "seats": state}))
+        elif self.path == "/events":
+            self._stream()
+        else:
+            self._send(404, json.dumps({"error": "not found"}))
+
+    def _command_refused(self):
+        """Why a command request is refused, or None to take it. Keeps other
+        web pages open in the viewer's browser from sending commands."""
+        dashboard = self.dashboard
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            return 415, "commands must be JSON"
+        host = self.headers.get("Host", "")
+        origin = self.headers.get("Origin")
+        if origin is not None and origin != f"http://{host}":
+            return 403, "commands must come from the dashboard page"
+        if dashboard.host in LOOPBACK_HOSTS:
+            name = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+            if name.strip("[]") not in LOOPBACK_HOSTS:
+                return 403, "unexpected host"
+        if dashboard.token and not hmac.compare_digest(
+            self.headers.get(TOKEN_HEADER, "").encode(), dashboard.token.encode()
+        ):
+            return 403, "wrong or missing token"
+        return None
+
+    def do_POST(self):
+        if self.path != "/command":
+            self._send(404, json.dumps({"error": "not found"}))
+            return
+        refused = self._command_refused()
+        if refused is not None:
+            code, reason = refused
+            self._send(code, json.dumps({"accepted": False, "error": reason}))
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            accepted = self.dashboard.command(body["seat"], body["command"])
+        except (ValueError, KeyError, TypeError):
+            accepted = False
+        if accepted:
+            self._send(202, json.dumps({"accepted": True}))
+        else:
+            self._send(400, json.dumps({"accepted": False}))
+
+    def _event(self, name, data, version):
+        self.wfile.write(
+            f"event: {name}\nid: {version}\ndata: {json.dumps(data)}\n\n".encode()
+        )
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        dashboard = self.dashboard
+        try:
+            version, state = dashboard.snapshot()
+            self._event("snapshot", state, version)
+            self.wfile.flush()
+            while dashboard.running:
+                new_version, changes = dashboard.changes_since(
+                    version, dashboard.KEEPALIVE
+                )
+                if changes is None:
+                    new_version, state = dashboard.snapshot()
+                    self._event("snapshot", state, new_version)
+                elif changes:
+                    for seat, delta in changes:
+                        self._event("delta", {"seat": seat, "changes": delta}, new_version)
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+                version = new_version
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Simrate Control</title>
+<style>
+body { font-family: monospace; background: #111; color: #ddd; margin: 1em; }
+.seat { border: 1px solid #444; padding: 0.5em 1em; margin-bottom: 1em; }
+.seat h2 { margin: 0.2em 0; }
+.rate { font-size: 2em; }
+table td { padding: 0 1em 0 0; }
+button { margin: 0.2em; padding: 0.5em; }
+.messages { color: #fc6; white-space: pre-line; }
+</style>
+</head>
+<body>
+<h1>Get-there-itis Simrate Control</h1>
+<div id="seats"></div>
+<script>
+const FIELDS = [
+  ["limiting_guard", "Limiting guard"], ["ap_mode", "AP mode"],
+  ["pitch", "Pitch"], ["bank", "Bank"], ["alt", "Alt"], ["agl", "AGL"],
+  ["ground_alt", "Ground alt"], ["ground_speed", "G. speed"],
+  ["waypoint_ident", "Waypoint"], ["waypoint_distance", "WP distance"],
+  ["waypoint_direction", "WP direction"], ["waypoint_alt", "Waypoint alt"],
+  ["vspeed", "VS"], ["needed_vspeed", "Needed VS"],
+  ["target_vspeed", "Target VS"], ["target_slope", "Target slope"],
+  ["tod_distance", "FLC distance"], ["tod_time", "FLC time"], ["ete", "ETE"],
+  ["tick_period", "Update period"], ["tick_jitter", "Update jitter"],
+  ["missed_ticks", "Missed updates"], ["events", "Events sent"],
+];
+const COMMANDS = [
+  ["TOGGLE_ACCEL", "Toggle acceleration"], ["PAUSE", "Pause"],
+  ["UNPAUSE", "Unpause"], ["TOGGLE_VNAV_GUARD", "Toggle VNAV guard"],
+  ["TOGGLE_LNAV_GUARD", "Toggle LNAV guard"], ["TOGGLE_ETE_GUARD", "Toggle ETE guard"],
+  ["MAX_SIMRATE_1", "Max 1x"], ["MAX_SIMRATE_2", "Max 2x"], ["MAX_SIMRATE_4", "Max 4x"],
+  ["MAX_SIMRATE_8", "Max 8x"], ["MAX_SIMRATE_16", "Max 16x"],
+];
+let seats = {};
+
+function escape(v) {
+  return String(v).replace(/[&<>"]/g, (c) => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})[c]);
+}
+
+function send(seat, command) {
+  fetch("/command", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "X-Dashboard-Token": new URLSearchParams(location.search).get("token") || "",
+    },
+    body: JSON.stringify({seat, command}),
+  });
+}
+
+function render() {
+  const root = document.getElementById("seats");
+  root.innerHTML = "";
+  for (const [name, s] of Object.entries(seats)) {
+    const div = document.createElement("div");
+    div.className = "seat";
+    const rate = (v) => v === undefined || v === null ? "-" : escape(v) + "x";
+    let html = `<h2></h2><div class="rate">${rate(s.sim_rate)} / ${rate(s.target_rate)} / ${rate(s.max_rate)}</div><table>`;
+    for (const [key, label] of FIELDS) {
+      html += `<tr><td>${label}</td><td>${s[key] === undefined || s[key] === null ? "-" : escape(s[key])}</td></tr>`;
+    }
+    html += `</table><div class="messages"></div><div class="buttons"></div>`;
+    div.innerHTML = html;
+    div.querySelector("h2").textContent = name;
+    div.querySelector(".messages").textContent = (s.messages || []).join("\\n");
+    for (const [command, label] of COMMANDS) {
+      const b = document.createElement("button");
+      b.textContent = label;
+      b.onclick = () => send(name, command);
+      div.querySelector(".buttons").appendChild(b);
+    }
+    root.appendChild(div);
+  }
+}
+
+const events = new EventSource("/events");
+events.addEventListener("snapshot", (e) => { seats = JSON.parse(e.data); render(); });
+events.addEventListener("delta", (e) => {
+  const d = JSON.parse(e.data);
+  seats[d.seat] = Object.assign(seats[d.seat] || {}, d.changes);
+  render();
+});
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,82 @@
+import logging
+from collections import Counter
+
+from sc_clock import SYSTEM_CLOCK
+
+
+class EventDispatcher:
+    """Sends SimConnect events in batches.
+
+    Events queued for one sim rate change are sent back to back by `flush`,
+    each at most once per batch. Batches are spaced at least
+    `min_batch_interval` seconds apart. `counts` holds the number of times
+    each event was sent and `skipped` the number of times it was found
+    unnecessary.
+    """
+
+    def __init__(self, aircraft_events, min_batch_interval=0.25, clock=SYSTEM_CLOCK):
+        self.min_batch_interval = min_batch_interval
+        self.clock = clock
+        self.counts = Counter()
+        self.skipped = Counter()
+        self.batches = 0
+        self._batch = []
+        self._last_flush = None
+        self.rebind(aircraft_events)
+
+    def rebind(self, aircraft_events):
+        self._ae = aircraft_events
+        self._events = {}
+
+    def _event(self, name):
+        event = self._events.get(name)
+        if event is None:
+            event = self._events[name] = self._ae.find(name)
+        return event
+
+    def queue(self, name):
+        if name not in self._batch:
+            self._batch.append(name)
+
+    def skip(self, name):
+        self.skipped[name] += 1
+
+    def flush(self):
+        if not self._batch:
+            return
+        # Nothing else may queue events while this batch waits its turn
+        with self.clock.held():
+            if self._last_flush is not None:
+                wait = (
+                    self._last_flush + self.min_batch_interval - self.clock.monotonic()
+                )
+                if wait > 0:
+                    self.clock.sleep(wait)
+            batch, self._batch = self._batch, []
+            for name in batch:
+                self._event(name)()
+                self.counts[name] += 1
+            self._last_flush = self.clock.monotonic()
+        self.batches += 1
+        logging.info("Sent events %s", ", ".join(batch))
+
+    def send(self, name):
+        """Send a single event right away."""
+        self.queue(name)
+        self.flush()
+
+    def summary(self):
+        """Each event sent and how often, then the ones skipped, e.g.
+        "SIM_RATE_INCR 12, BAROMETRIC 2, skipped BAROMETRIC 10"."""
+        parts = [f"{name} {count}" for name, count in self.counts.most_common()]
+        parts += [
+            f"skipped {name} {count}" for name, count in self.skipped.most_common()
+        ]
+        return ", ".join(parts) or "none"
+
+    def stats(self):
+        return {
+            "events_sent": sum(self.counts.values()),
+            "event_batches": self.batches,
+            "events": self.summary(),
+        }
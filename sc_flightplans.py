@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+
+class FlightPlanError(Exception):
+    pass
+
+
+# Altitude in feet
+PlanWaypoint = namedtuple("PlanWaypoint", "ident lat lon alt")
+
+# `mtime` is in nanoseconds. `waypoints` is a tuple of PlanWaypoint.
+FlightPlan = namedtuple(
+    "FlightPlan", "path mtime size title departure arrival waypoints"
+)
+
+# e.g. N47° 26' 56.40",W122° 18' 33.60",+000433.00
+_POSITION = re.compile(
+    r"\s*([NS])\s*(\d+)\D+(\d+)\D+([\d.]+)\D*,\s*([EW])\s*(\d+)\D+(\d+)\D+([\d.]+)\D*,\s*([-+\d.]+)"
+)
+
+
+def parse_position(text):
+    """lat, lon and altitude in feet from a .pln WorldPosition."""
+    m = _POSITION.match(text or "")
+    if m is None:
+        raise FlightPlanError(f"Bad position {text!r}")
+    lat = int(m[2]) + int(m[3]) / 60 + float(m[4]) / 3600
+    lon = int(m[6]) + int(m[7]) / 60 + float(m[8]) / 3600
+    return (
+        -lat if m[1] == "S" else lat,
+        -lon if m[5] == "W" else lon,
+        float(m[9]),
+    )
+
+
+def parse_plan(path, mtime=0, size=0):
+    """Parse an MSFS .pln file."""
+    try:
+        root = ElementTree.parse(path).getroot()
+    except (ElementTree.ParseError, OSError) as e:
+        raise FlightPlanError(f"{path}: {e}")
+    plan = root.find("FlightPlan.FlightPlan")
+    if plan is None:
+        raise FlightPlanError(f"{path}: not a flight plan")
+    waypoints = []
+    for wp in plan.iter("ATCWaypoint"):
+        lat, lon, alt = parse_position(wp.findtext("WorldPosition"))
+        waypoints.append(PlanWaypoint(wp.get("id", ""), lat, lon, alt))
+    return FlightPlan(
+        path,
+        mtime,
+        size,
+        plan.findtext("Title", ""),
+        plan.findtext("DepartureID", ""),
+        plan.findtext("DestinationID", ""),
+        tuple(waypoints),
+    )
+
+
+class FlightPlanIndex:
+    """An in-memory index of the .pln files in a directory.
+
+    `scan` only stats the directory with `os.scandir` and parses new or
+    changed files, so rescanning thousands of unchanged plans is cheap. With a
+    `cache_file`, parsed plans are also kept across restarts. `start` rescans
+    every `interval` seconds from a background thread. Polling is used since
+    the standard library has no portable directory change notification.
+    """
+
+    def __init__(self, directory, interval=2.0, cache_file=None):
+        self.directory = directory
+        self.interval = interval
+        self.cache_file = cache_file
+        self.errors = {}
+        # Incremented on every change to the index
+        self.version = 0
+        self._plans = {}
+        self._by_route = {}
+        self._by_mtime = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load_cache()
+
+    def __len__(self):
+        return len(self._plans)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="flight-plan-index", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                self.scan()
+            except OSError as e:
+                logging.info("Flight plan scan failed: %s", e)
+            if self._stop.wait(self.interval):
+                break
+
+    def scan(self):
+        """Update the index from the directory. Returns the number of changed plans."""
+        seen = set()
+        changed = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(".pln") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                seen.add(entry.path)
+                plan = self._plans.get(entry.path)
+                if plan is not None and (plan.mtime, plan.size) == (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                ):
+                    continue
+                if self.errors.get(entry.path) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    changed.append(
+                        parse_plan(entry.path, stat.st_mtime_ns, stat.st_size)
+                    )
+                    self.errors.pop(entry.path, None)
+                except FlightPlanError as e:
+                    logging.info("Skipping flight plan: %s", e)
+                    self.errors[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        removed = [path for path in self._plans if path not in seen]
+        if changed or removed:
+            with self._lock:
+                for path in removed:
+                    self._remove(path)
+                for plan in changed:
+                    self._remove(plan.path)
+                    self._add(plan)
+                self._sort()
+            self._save_cache()
+        return len(changed) + len(removed)
+
+    @staticmethod
+    def _route(plan):
+        return (plan.departure.upper(), plan.arrival.upper())
+
+    def _add(self, plan):
+        self._plans[plan.path] = plan
+        route = self._by_route.setdefault(self._route(plan), [])
+        route.append(plan)
+        route.sort(key=lambda p: p.mtime)
+
+    def _remove(self, path):
+        plan = self._plans.pop(path, None)
+        if plan is None:
+            return
+        route = self._by_route[self._route(plan)]
+        route.remove(plan)
+        if not route:
+            del self._by_route[self._route(plan)]
+
+    def _sort(self):
+        self._by_mtime = sorted(
+            self._plans.values(), key=lambda p: p.mtime, reverse=True
+        )
+        self.version += 1
+
+    def latest(self):
+        """The most recently written plan, or None."""
+        plans = self._by_mtime
+        return plans[0] if plans else None
+
+    def by_route(self, departure, arrival):
+        """The most recently written plan from `departure` to `arrival`, or None."""
+        with self._lock:
+            plans = self._by_route.get((departure.upper(), arrival.upper()))
+            return plans[-1] if plans else None
+
+    def recent(self, count=10):
+        """The `count` most recently written plans, newest first."""
+        return self._by_mtime[:count]
+
+    def _load_cache(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                for item in json.load(f):
+                    waypoints = tuple(PlanWaypoint(*w) for w in item.pop("waypoints"))
+                    self._add(FlightPlan(waypoints=waypoints, **item))
+        except (OSError, ValueError, TypeError) as e:
+            logging.info("Ignoring flight plan cache: %s", e)
+            self._plans.clear()
+            self._by_route.clear()
+        self._sort()
+
+    def _save_cache(self):
+        if self.cache_file is None:
+            return
+        with self._lock:
+            plans = [p._asdict() for p in self._plans.values()]
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(plans, f)
+        except OSError as e:
+            logging.info("Could not write the flight plan cache: %s", e)
@@ -0,0 +1,137 @@
+import heapq
+from contextlib import contextmanager
+from itertools import count
+
+from sc_clock import SYSTEM_CLOCK
+
+# The event names, see `SimrateDiscriminator.upcoming_events`
+EVENTS = ("waypoint", "flight level change", "approach")
+
+
+class HorizonEvent:
+    """An event predicted to happen at clock time `due`, after which the sim
+    should run at `rate` at most. A rate of 0 pauses the sim."""
+
+    def __init__(self, name, due, rate):
+        self.name = name
+        self.due = due
+        self.rate = rate
+
+    def __repr__(self):
+        return f"HorizonEvent({self.name!r}, {self.due:.3f}, {self.rate})"
+
+
+class EventHorizon:
+    """A clock that fires predicted events on time while sleeping.
+
+    Events are planned, by name, a number of seconds ahead and kept in a
+    heap by the clock time they are due. Whatever sleeps on this clock wakes
+    up when the next event is due and hands it to `fire`, so an event lands
+    on time even in the middle of a control loop iteration. Sleeps within
+    `held` just sleep, the events due meanwhile fire at the next sleep
+    outside it.
+
+    Planning an event again only moves it when the prediction drifted more
+    than `drift` seconds. A fired event stays in `fired` while it is still
+    predicted to be due (within `drift`), and `limit` is the one with the
+    lowest rate. It is forgotten when the prediction moves away, or the event
+    is no longer predicted at all.
+    """
+
+    def __init__(self, clock=SYSTEM_CLOCK, drift=0.2, fire=None):
+        self.clock = clock
+        self.drift = drift
+        self.fire = fire
+        # name: HorizonEvent, not fired yet
+        self.planned = {}
+        self.fired = {}
+        # (due, sequence, name), with entries for moved events left behind
+        self._queue = []
+        self._sequence = count()
+        self._holds = 0
+        # Events moved because their prediction drifted
+        self.replanned = 0
+
+    def monotonic(self):
+        return self.clock.monotonic()
+
+    def sleep(self, seconds):
+        end = self.clock.monotonic() + seconds
+        while not self._holds:
+            due = self.next_due()
+            if due is None or due > end:
+                break
+            self.clock.sleep(max(0.0, due - self.clock.monotonic()))
+            self.fire_due()
+        self.clock.sleep(max(0.0, end - self.clock.monotonic()))
+
+    @contextmanager
+    def held(self):
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+
+    def plan(self, name, seconds, rate):
+        """Expect event `name` in `seconds`, or not at all for None."""
+        if seconds is None:
+            self.cancel(name)
+            return
+        seconds = max(0.0, seconds)
+        fired = self.fired.get(name)
+        if fired is not None:
+            if seconds <= self.drift:
+                fired.rate = rate
+                return
+            del self.fired[name]
+            self.replanned += 1
+        due = self.clock.monotonic() + seconds
+        event = self.planned.get(name)
+        if event is not None:
+            if abs(due - event.due) <= self.drift:
+                event.rate = rate
+                return
+            self.replanned += 1
+        self.planned[name] = HorizonEvent(name, due, rate)
+        heapq.heappush(self._queue, (due, next(self._sequence), name))
+
+    def cancel(self, name):
+        self.planned.pop(name, None)
+        self.fired.pop(name, None)
+
+    def clear(self):
+        self.planned.clear()
+        self.fired.clear()
+        self._queue = []
+
+    def limit(self):
+        """The fired event with the lowest rate, or None."""
+        return min(self.fired.values(), key=lambda event: event.rate, default=None)
+
+    def next_due(self):
+        """The clock time the next event is due, or None."""
+        queue = self._queue
+        while queue:
+            due, _, name = queue[0]
+            event = self.planned.get(name)
+            if event is not None and event.due == due:
+                return due
+            heapq.heappop(queue)
+        return None
+
+    def fire_due(self):
+        """Fire the events that are due. Returns them."""
+        fired = []
+        with self.held():
+            now = self.clock.monotonic()
+            while True:
+                due = self.next_due()
+                if due is None or due > now:
+                    break
+                _, _, name = heapq.heappop(self._queue)
+                event = self.fired[name] = self.planned.pop(name)
+                fired.append(event)
+                if self.fire is not None:
+                    self.fire(event)
+        return fired
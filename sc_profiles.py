@@ -0,0 +1,117 @@
+import configparser
+import os
+
+
+class AircraftProfileError(Exception):
+    pass
+
+
+def _lines(value):
+    return [line.strip() for line in value.splitlines() if line.strip()]
+
+
+class AircraftProfile:
+    """Aircraft specific overrides for the simvars the controller relies on.
+
+    `*_lvars` are summed and either replace the standard simvar ("replace")
+    or are added to it ("add"). `ete_source` picks the GPS ETE, the ETE
+    derived from `ete_distance_lvar`, or the larger of both ("max").
+    """
+
+    COMBINE_MODES = ("replace", "add")
+    ETE_SOURCES = ("gps", "lvar", "max")
+
+    def __init__(self, name="default", parser=None):
+        self.name = name
+        self.titles = []
+        self.ap_master_lvars = []
+        self.ap_master_combine = "replace"
+        self.nav_mode_lvars = []
+        self.nav_mode_combine = "replace"
+        # Workaround for the WT avionics framework ETE. See issue #40
+        self.ete_source = "max"
+        self.ete_distance_lvar = "(L:WT1000_LNav_Destination_Dis)"
+        self.check_flaps = True
+        self.check_landing_lights = True
+        self.extra_lvars = []
+        if parser is not None:
+            self._load(parser)
+        self.lvars = list(
+            dict.fromkeys(
+                self.ap_master_lvars
+                + self.nav_mode_lvars
+                + ([self.ete_distance_lvar] if self.ete_source != "gps" else [])
+                + self.extra_lvars
+            )
+        )
+
+    def _load(self, parser):
+        try:
+            profile = parser["profile"]
+            self.titles = _lines(profile.get("titles", ""))
+            self.ap_master_lvars = _lines(profile.get("ap_master_lvars", ""))
+            self.ap_master_combine = profile.get(
+                "ap_master_combine", self.ap_master_combine
+            )
+            self.nav_mode_lvars = _lines(profile.get("nav_mode_lvars", ""))
+            self.nav_mode_combine = profile.get(
+                "nav_mode_combine", self.nav_mode_combine
+            )
+            self.ete_source = profile.get("ete_source", self.ete_source)
+            self.ete_distance_lvar = profile.get(
+                "ete_distance_lvar", self.ete_distance_lvar
+            )
+            self.check_flaps = profile.getboolean("check_flaps", self.check_flaps)
+            self.check_landing_lights = profile.getboolean(
+                "check_landing_lights", self.check_landing_lights
+            )
+            self.extra_lvars = _lines(profile.get("lvars", ""))
+        except (KeyError, ValueError) as e:
+            raise AircraftProfileError(f"{self.name}: {e}")
+        if not self.titles:
+            raise AircraftProfileError(f"{self.name}: no titles")
+        for combine in (self.ap_master_combine, self.nav_mode_combine):
+            if combine not in self.COMBINE_MODES:
+                raise AircraftProfileError(f"{self.name}: bad combine '{combine}'")
+        if self.ete_source not in self.ETE_SOURCES:
+            raise AircraftProfileError(
+                f"{self.name}: bad ete_source '{self.ete_source}'"
+            )
+
+    def matches(self, title):
+        return any(t in title for t in self.titles)
+
+    def __str__(self):
+        return self.name
+
+
+class AircraftProfileRegistry:
+    """Profiles loaded from every *.ini in a directory, in file name order.
+
+    A title is matched against the profiles once and the result is cached,
+    so repeated lookups for the same aircraft are a dictionary lookup.
+    """
+
+    def __init__(self, directory=None):
+        self.default = AircraftProfile()
+        self.profiles = []
+        self._by_title = {}
+        if directory is not None and os.path.isdir(directory):
+            for file in sorted(os.listdir(directory)):
+                if file.endswith(".ini"):
+                    self.profiles.append(self._read(os.path.join(directory, file)))
+
+    def _read(self, path):
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(path)
+        except configparser.Error as e:
+            raise AircraftProfileError(f"{path}: {e}")
+        return AircraftProfile(os.path.splitext(os.path.basename(path))[0], parser)
+
+    def resolve(self, title):
+        profile = self._by_title.get(title)
+        if profile is None:
+            profile = next((p for p in self.profiles if p.matches(title)), self.default)
+            self._by_title[title] = profile
+        return profile
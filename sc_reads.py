@@ -0,0 +1,138 @@
+from sys import maxsize
+
+from sc_clock import SYSTEM_CLOCK
+
+
+class CircuitBreaker:
+    """Stops requesting a variable that keeps failing.
+
+    Opens after `failures` failed reads in a row. While open no requests are
+    made, until `reset` seconds later a single trial read is let through. A
+    successful read closes it again.
+    """
+
+    def __init__(self, failures=3, reset=30.0):
+        self.failures = failures
+        self.reset = reset
+        self.count = 0
+        self.opened = None
+
+    @property
+    def open(self):
+        return self.opened is not None
+
+    def allow(self, now):
+        return self.opened is None or now - self.opened >= self.reset
+
+    def success(self):
+        self.count = 0
+        self.opened = None
+
+    def failure(self, now):
+        self.count += 1
+        if self.count >= self.failures:
+            self.opened = now
+
+
+class SimvarReads:
+    """Simvar reads bounded by a deadline, falling back to the last good value.
+
+    A read retries with a growing pause until a value arrives, `retries` runs
+    out or the deadline passes. The deadline is shared by every read between
+    `start_tick` and `end_tick`. Outside a tick each read gets its own.
+    A failed read returns the last good value, and `read` returns its age in
+    seconds along with it. Every variable has a `CircuitBreaker`.
+
+    `request(name)` makes one attempt and returns None on failure.
+    """
+
+    def __init__(
+        self,
+        clock=SYSTEM_CLOCK,
+        deadline=2.0,
+        breaker_failures=3,
+        breaker_reset=30.0,
+        request_sleep=0.05,
+        min_request_sleep=0.01,
+        max_request_sleep=0.5,
+    ):
+        self.clock = clock
+        self.deadline = deadline
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self._request_sleep = request_sleep
+        self._min_request_sleep = min_request_sleep
+        self._max_request_sleep = max_request_sleep
+        # name: (value, monotonic time read)
+        self.last_good = {}
+        self.breakers = {}
+        self.requests = 0
+        # Retries made by the last read
+        self.retries = 0
+        self._tick_deadline = None
+
+    def reconfigure(self, deadline, breaker_failures, breaker_reset):
+        self.deadline = deadline
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        for breaker in self.breakers.values():
+            breaker.failures = breaker_failures
+            breaker.reset = breaker_reset
+
+    def start_tick(self):
+        self._tick_deadline = self.clock.monotonic() + self.deadline
+
+    def end_tick(self):
+        self._tick_deadline = None
+
+    def breaker(self, name):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(
+                self.breaker_failures, self.breaker_reset
+            )
+        return breaker
+
+    def read(self, name, request, retries=maxsize):
+        """(value, age) for `name`. The age is 0 for a fresh value, and the
+        value None if it has never been read."""
+        now = self.clock.monotonic()
+        deadline = self._tick_deadline
+        if deadline is None:
+            deadline = now + self.deadline
+        breaker = self.breaker(name)
+        value = None
+        self.retries = 0
+        if breaker.allow(now):
+            # A trial read of an open breaker gets a single attempt
+            attempts = 0 if breaker.open else retries
+            value = self._request(name, request, attempts, deadline)
+            if value is None:
+                breaker.failure(self.clock.monotonic())
+            else:
+                breaker.success()
+        now = self.clock.monotonic()
+        if value is not None:
+            self.last_good[name] = (value, now)
+            return value, 0.0
+        value, time = self.last_good.get(name, (None, now))
+        return value, now - time
+
+    def _request(self, name, request, retries, deadline):
+        # PySimConnect seems to crash the sim if requests happen too fast.
+        self.clock.sleep(self._request_sleep)
+        self.requests += 1
+        value = request(name)
+        i = 0
+        while value is None and i < retries:
+            pause = min(self._request_sleep + 0.05 * (i + 1), self._max_request_sleep)
+            if self.clock.monotonic() + pause > deadline:
+                break
+            i += 1
+            self._request_sleep = pause
+            self.clock.sleep(self._request_sleep)
+            self.requests += 1
+            value = request(name)
+        self._request_sleep = max(self._min_request_sleep, self._request_sleep - 0.01)
+        self.retries = i
+        return value
@@ -0,0 +1,61 @@
+from collections import deque
+
+from sc_clock import SYSTEM_CLOCK
+
+
+class TickScheduler:
+    """Starts control loop iterations on deadlines a period apart.
+
+    Each deadline is the previous one plus the period, not the end of the
+    last iteration plus the period, so the time an iteration takes does not
+    add up into drift. An iteration that ends after the next deadline is a
+    missed deadline, and the next one starts right away. A schedule more
+    than a period behind starts over from then instead of catching up.
+
+    How late each iteration started, its jitter, is kept for the last
+    `window` iterations.
+    """
+
+    def __init__(self, clock=SYSTEM_CLOCK, window=100):
+        self.clock = clock
+        self.period = None
+        self.deadline = None
+        self.ticks = 0
+        self.missed = 0
+        self.late = deque(maxlen=window)
+
+    def reset(self):
+        """Start a new schedule at the next `wait`, e.g. after a pause in
+        the loop that was not an iteration overrunning."""
+        self.deadline = None
+
+    def wait(self, period):
+        """Sleep until the next deadline, `period` seconds after the last."""
+        self.period = period
+        now = self.clock.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        else:
+            self.deadline += period
+            if self.deadline > now:
+                self.clock.sleep(self.deadline - now)
+            else:
+                self.missed += 1
+        start = self.clock.monotonic()
+        self.late.append(start - self.deadline)
+        if self.deadline < start - period:
+            self.deadline = start
+        self.ticks += 1
+
+    def stats(self):
+        """The period, the mean and largest jitter in seconds and the missed
+        deadlines."""
+        late = self.late
+        if not late:
+            return {"tick_period": self.period, "missed_ticks": self.missed}
+        return {
+            "tick_period": self.period,
+            "tick_jitter": round(sum(late) / len(late), 4),
+            "tick_jitter_max": round(max(late), 4),
+            "missed_ticks": self.missed,
+        }
@@ -0,0 +1,265 @@
+import configparser
+import functools
+import logging
+import queue
+import threading
+from collections import namedtuple
+from time import sleep
+
+from lib.koseng.simconnect_mobiflight import SimConnectMobiFlight
+from sc_clock import SYSTEM_CLOCK
+from sc_config import ConfigWatcher
+from sc_connection import ConnectionSupervisor
+from sc_curses import CursesCommands, ScSeatsCurses
+from sc_dashboard import Dashboard
+from sc_standin import StandInSimulator
+from simrate_control import (
+    SimrateController,
+    Speaker,
+    make_speaker,
+    start_flight_plans,
+)
+
+
+class SeatConfigError(Exception):
+    pass
+
+
+# One simulator managed by the supervisor. `config_index` selects the
+# SimConnect.cfg section to connect with, `standin` flies a local
+# `StandInSimulator` instead of connecting to a sim.
+Seat = namedtuple("Seat", "name config_file config_index standin")
+
+
+def read_seats(file):
+    """Read the seats, one per section, from an ini file."""
+    parser = configparser.ConfigParser()
+    try:
+        parser.read(file)
+    except configparser.Error as e:
+        raise SeatConfigError(str(e))
+    if parser.sections() == []:
+        raise SeatConfigError(f"No seats found in {file}")
+    seats = []
+    for name in parser.sections():
+        try:
+            seats.append(
+                Seat(
+                    name,
+                    parser.get(name, "config", fallback="config.ini"),
+                    parser.getint(name, "simconnect_index", fallback=0),
+                    parser.getboolean(name, "standin", fallback=False),
+                )
+            )
+        except ValueError as e:
+            raise SeatConfigError(f"[{name}] {e}")
+    return seats
+
+
+def seat_factory(seat):
+    """The connection factory for a seat's supervisor."""
+    if seat.standin:
+        return functools.partial(StandInSimulator, title=f"Stand-in {seat.name}")
+    return functools.partial(SimConnectMobiFlight, config_index=seat.config_index)
+
+
+class SeatWorker:
+    """Runs the control loop for one seat on its own thread.
+
+    Each seat has its own config, connection supervisor and controller, so
+    a seat that fails or disconnects does not affect the others.
+    """
+
+    def __init__(
+        self,
+        seat,
+        speaker,
+        factory=None,
+        dashboard=None,
+        flight_plans=None,
+        clock=SYSTEM_CLOCK,
+    ):
+        self.seat = seat
+        self.dashboard = dashboard
+        self.clock = clock
+        self.config_watcher = ConfigWatcher(seat.config_file, clock=clock)
+        self.controller = SimrateController(
+            self.config_watcher.config, speaker, seat.name, flight_plans, clock
+        )
+        self.supervisor = ConnectionSupervisor(
+            factory if factory is not None else seat_factory(seat)
+        )
+        self.error = None
+        self._commands = queue.SimpleQueue()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self.supervisor.start()
+        self._thread = threading.Thread(
+            target=self._run, name=f"seat-{self.seat.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join()
+        self.supervisor.stop()
+
+    def send(self, command):
+        """Queue a command for the seat's next iteration."""
+        self._commands.put(command)
+
+    def _command(self):
+        try:
+            return self._commands.get_nowait()
+        except queue.Empty:
+            pass
+        if self.dashboard is not None:
+            return self.dashboard.next_command(self.seat.name)
+        return None
+
+    def _publish(self):
+        if self.dashboard is None:
+            return
+        status = dict(self.controller.status or {}) if self.controller.ready else {}
+        status["state"] = self.supervisor.state.name.lower()
+        self.dashboard.publish(self.seat.name, status, self.controller.messages)
+
+    def _run(self):
+        controller = self.controller
+        while not self._stopping:
+            try:
+                connected = controller.step(
+                    self.supervisor, self.config_watcher, self._command()
+                )
+                self._publish()
+                if not connected:
+                    self.clock.sleep(0.1)
+                    continue
+                self.error = None
+            except Exception as e:
+                # Keep the other seats running
+                logging.exception("Seat %s failed", self.seat.name)
+                self.error = e
+                self.clock.sleep(1)
+                continue
+            controller.wait()
+        if controller.ready:
+            try:
+                controller.srm.unpause()
+                controller.stop()
+            except Exception as e:
+                logging.info("Seat %s did not stop cleanly: %s", self.seat.name, e)
+        controller.close()
+
+    def status(self):
+        """A summary of the seat for status views."""
+        controller = self.controller
+        connected = controller.ready
+        # Only what the seat's own thread has read, never a new request
+        status = controller.status or {}
+        messages = list(controller.messages)
+        if self.error is not None:
+            messages.append(f"Error: {self.error}")
+        return {
+            "name": self.seat.name,
+            "state": self.supervisor.state.name.lower(),
+            "sim_rate": controller.srm.sim_rate if connected else None,
+            "target_rate": controller.target_rate if connected else None,
+            "waypoint": status.get("waypoint_ident") if connected else None,
+            "ete": status.get("ete") if connected else None,
+            "accelerating": controller.accelerating,
+            "messages": messages,
+        }
+
+
+class SeatSupervisor:
+    """Manages a worker per seat, sharing one text-to-speech engine, one
+    dashboard and one flight plan index."""
+
+    def __init__(
+        self,
+        seats,
+        speaker=None,
+        factories=None,
+        dashboard=None,
+        flight_plans=None,
+        clock=SYSTEM_CLOCK,
+    ):
+        self.speaker = speaker if speaker is not None else Speaker()
+        self.dashboard = dashboard
+        self.flight_plans = flight_plans
+        factories = factories or {}
+        self.workers = [
+            SeatWorker(
+                seat,
+                self.speaker,
+                factories.get(seat.name),
+                dashboard=dashboard,
+                flight_plans=flight_plans,
+                clock=clock,
+            )
+            for seat in seats
+        ]
+
+    def start(self):
+        if self.dashboard is not None:
+            self.dashboard.start()
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker._stopping = True
+        for worker in self.workers:
+            worker.stop()
+        if self.dashboard is not None:
+            self.dashboard.stop()
+        if self.flight_plans is not None:
+            self.flight_plans.stop()
+
+    def statuses(self):
+        return [worker.status() for worker in self.workers]
+
+
+def seats_main(stdscr, seats_file="seats.ini"):
+    ui = ScSeatsCurses(stdscr)
+    seats = read_seats(seats_file)
+    # The dashboard and flight plan settings come from the first seat's config
+    config = ConfigWatcher(seats[0].config_file).config
+    dashboard = None
+    if config.dashboard:
+        dashboard = Dashboard(
+            config.dashboard_host,
+            config.dashboard_port,
+            [seat.name for seat in seats],
+            config.dashboard_token,
+        )
+    supervisor = SeatSupervisor(
+        seats,
+        make_speaker(config),
+        dashboard=dashboard,
+        flight_plans=start_flight_plans(config),
+    )
+    supervisor.start()
+    selected = 0
+    try:
+        while True:
+            statuses = supervisor.statuses()
+            for row, status in enumerate(statuses):
+                ui.write_seat(row, status, row == selected)
+                ui.write_messages([f"{status['name']}: {m}" for m in status["messages"]])
+            command = ui.update(len(statuses))
+            if command == CursesCommands.QUIT:
+                break
+            elif command == CursesCommands.NEXT_SEAT:
+                selected = (selected + 1) % len(supervisor.workers)
+            elif command != CursesCommands.NORMAL:
+                supervisor.workers[selected].send(command)
+            sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    supervisor.stop()
+    return 0
@@ -0,0 +1,228 @@
+"""The controller's state in shared memory, for local tools to read.
+
+A publisher writes a fixed layout snapshot into a named
+`multiprocessing.shared_memory` block every update. Readers on the same
+computer attach to the block by name and copy the snapshot out, without
+asking the controller or the sim for anything. Only the standard library is
+used, so a tool can copy this file to read the block.
+
+The block starts with a header, then the snapshot:
+
+    offset  type     field
+    0       4 bytes  MAGIC
+    4       uint16   LAYOUT_VERSION
+    6       uint16   snapshot size in bytes
+    8       uint32   sequence
+    12      SNAPSHOT, see FIELDS
+
+All little endian, without padding. The sequence is a seqlock: odd while the
+publisher is writing a snapshot, and even, and one higher, once it is done.
+A reader that sees the same even sequence before and after copying the
+snapshot has copied a whole one, and tries again otherwise. Sequence 0 is a
+block nothing has been published to yet.
+
+A float that is not known, e.g. the TOD without a descent ahead, is NaN in
+the block and None when read. Strings are UTF-8, padded with zeros.
+"""
+import re
+import struct
+import time
+from math import isnan, nan
+from multiprocessing import shared_memory
+
+MAGIC = b"SCRC"
+# Changes whenever FIELDS do. Readers refuse a block of another version.
+LAYOUT_VERSION = 1
+DEFAULT_NAME = "simrate_control"
+
+# (name, struct format) in the order they are stored
+FIELDS = (
+    # time.time() of the update
+    ("updated", "d"),
+    ("connected", "?"),
+    ("paused", "?"),
+    ("accelerating", "?"),
+    ("sim_rate", "d"),
+    ("target_rate", "d"),
+    ("max_rate", "d"),
+    ("limiting_guard", "32s"),
+    ("waypoint_ident", "12s"),
+    ("waypoint_distance", "d"),
+    ("waypoint_alt", "d"),
+    ("alt", "d"),
+    ("vspeed", "d"),
+    ("target_vspeed", "d"),
+    ("needed_vspeed", "d"),
+    ("tod_distance", "d"),
+    ("tod_time", "d"),
+    ("ground_speed", "d"),
+    ("ete", "d"),
+)
+
+HEADER = struct.Struct("<4sHHI")
+SNAPSHOT = struct.Struct("<" + "".join(code for _, code in FIELDS))
+SEQUENCE = struct.Struct("<I")
+SEQUENCE_OFFSET = 8
+SIZE = HEADER.size + SNAPSHOT.size
+
+
+class SharedStateError(Exception):
+    pass
+
+
+def _pack_value(code, value):
+    if code.endswith("s"):
+        return str(value if value is not None else "").encode()[: int(code[:-1])]
+    if code == "?":
+        return bool(value)
+    if value is None:
+        return nan
+    return float(value)
+
+
+def _unpack_value(code, value):
+    if code.endswith("s"):
+        return value.rstrip(b"\0").decode(errors="replace") or None
+    if code == "d" and isnan(value):
+        return None
+    return value
+
+
+def block_name(name, seat=None):
+    """The block a seat publishes to, `name` followed by the seat name."""
+    if seat is None:
+        return name
+    return f"{name}_{re.sub(r'[^A-Za-z0-9_]', '_', seat)}"
+
+
+def _attach(name):
+    """The existing block `name`, without this process removing it on exit."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 every process attaching a block on POSIX
+        # registers it to be removed when the process ends.
+        shm = shared_memory.SharedMemory(name)
+        try:
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except (ImportError, AttributeError):
+            pass
+        return shm
+
+
+class StatePublisher:
+    """Publishes snapshots into the shared memory block `name`.
+
+    A block of that name left behind by a publisher that did not close is
+    taken over. There should only ever be one publisher per block, the
+    seqlock does not guard against two writing at once.
+    """
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=SIZE)
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name)
+            if self._shm.size < SIZE:
+                self._shm.close()
+                raise SharedStateError(
+                    f"Shared memory {name} exists and is too small for the state"
+                )
+        self._buf = self._shm.buf
+        self._sequence = 0
+        HEADER.pack_into(self._buf, 0, MAGIC, LAYOUT_VERSION, SNAPSHOT.size, 0)
+
+    def publish(self, state):
+        """Write a snapshot of `state`, a dict with any of the FIELDS. The
+        ones left out are not known, and `updated` defaults to now."""
+        state = dict(state)
+        state.setdefault("updated", time.time())
+        values = [_pack_value(code, state.get(name)) for name, code in FIELDS]
+        buf = self._buf
+        self._sequence += 1
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, self._sequence & 0xFFFFFFFF)
+        SNAPSHOT.pack_into(buf, HEADER.size, *values)
+        self._sequence += 1
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, self._sequence & 0xFFFFFFFF)
+
+    def close(self):
+        """Stop publishing and remove the block. Readers attached keep the
+        last snapshot."""
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+
+class StateReader:
+    """Reads the snapshots published into the shared memory block `name`,
+    from another process than the publisher's.
+
+    Raises FileNotFoundError when nothing published the block yet, and
+    SharedStateError when the block has another layout.
+    """
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        self._shm = _attach(name)
+        self._buf = self._shm.buf
+        magic, version, size, _ = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION or size != SNAPSHOT.size:
+            self.close()
+            raise SharedStateError(
+                f"Shared memory {name} has layout {magic!r} {version}, "
+                f"expected {MAGIC!r} {LAYOUT_VERSION}"
+            )
+
+    def sequence(self):
+        """Changes with every snapshot published, so a reader polling often
+        can skip copying an unchanged one."""
+        return SEQUENCE.unpack_from(self._buf, SEQUENCE_OFFSET)[0]
+
+    def read(self, retries=1000):
+        """The latest snapshot as a dict, or None if there is none yet.
+
+        Copies until it gets a whole snapshot, and raises SharedStateError
+        after `retries` tries, e.g. with the publisher stopped in the middle
+        of writing one.
+        """
+        buf = self._buf
+        start = HEADER.size
+        end = start + SNAPSHOT.size
+        for _ in range(retries):
+            before = SEQUENCE.unpack_from(buf, SEQUENCE_OFFSET)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            data = bytes(buf[start:end])
+            if SEQUENCE.unpack_from(buf, SEQUENCE_OFFSET)[0] != before:
+                continue
+            if before == 0:
+                return None
+            values = SNAPSHOT.unpack(data)
+            return {
+                name: _unpack_value(code, value)
+                for (name, code), value in zip(FIELDS, values)
+            }
+        raise SharedStateError(f"No complete snapshot in {self.name}")
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
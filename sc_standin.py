@@ -0,0 +1,543 @@
+import ctypes
+import struct
+from collections import namedtuple
+from math import radians, degrees, sin, cos, asin, atan2, sqrt
+from time import monotonic
+
+from SimConnect.Enum import (
+    SIMCONNECT_RECV_CLIENT_DATA,
+    SIMCONNECT_RECV_SIMOBJECT_DATA_BYTYPE,
+)
+
+from sc_connection import ConnectionState
+
+
+class StandInDisconnected(OSError):
+    pass
+
+
+# A flight plan waypoint. Altitude in feet.
+StandInWaypoint = namedtuple("StandInWaypoint", "ident lat lon alt")
+
+DEFAULT_ROUTE = [
+    StandInWaypoint("KSEA", 47.4490, -122.3093, 433),
+    StandInWaypoint("SEA", 47.4354, -122.3097, 3000),
+    StandInWaypoint("OLM", 46.9717, -122.9017, 12000),
+    StandInWaypoint("BTG", 45.7474, -122.5934, 12000),
+    StandInWaypoint("UBG", 45.3562, -122.9769, 12000),
+    StandInWaypoint("EUG", 44.1207, -123.2236, 8000),
+    StandInWaypoint("KEUG", 44.1246, -123.2119, 374),
+]
+
+EARTH_RADIUS_NM = 3440.065
+
+
+def _distance_nm(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * asin(sqrt(a))
+
+
+def _bearing(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    y = sin(lon2 - lon1) * cos(lat2)
+    x = cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(lon2 - lon1)
+    return atan2(y, x)
+
+
+def _destination(lat, lon, bearing, distance_nm):
+    lat, lon = radians(lat), radians(lon)
+    d = distance_nm / EARTH_RADIUS_NM
+    lat2 = asin(sin(lat) * cos(d) + cos(lat) * sin(d) * cos(bearing))
+    lon2 = lon + atan2(sin(bearing) * sin(d) * cos(lat), cos(d) - sin(lat) * sin(lat2))
+    return degrees(lat2), degrees(lon2)
+
+
+class _Id:
+    def __init__(self, value):
+        self.value = value
+
+
+class _StandInDll:
+    """The SimConnect DLL calls made directly by this project and the
+    SimConnect package, answered by a `StandInSimulator`."""
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def AddToDataDefinition(self, handle, definition_id, name, unit, datatype, epsilon, datum):
+        self._sim.data_definitions.setdefault(definition_id, []).append(name.decode())
+        return 0
+
+    def ClearDataDefinition(self, handle, definition_id):
+        self._sim.data_definitions.pop(definition_id, None)
+        return 0
+
+    def RequestDataOnSimObjectType(self, handle, request_id, definition_id, radius, object_type):
+        self._sim.request_data(request_id, definition_id)
+        return 0
+
+    def SetDataOnSimObject(self, handle, definition_id, object_id, flags, count, size, data):
+        names = self._sim.data_definitions.get(definition_id, [])
+        values = (ctypes.c_double * len(names)).from_address(data.value)
+        for name, value in zip(names, values):
+            self._sim.set_simvar(name, value)
+        return 0
+
+    def GetLastSentPacketID(self, handle, packet_id):
+        packet_id.value = self._sim.counters["requests"]
+        return 0
+
+    def MapClientDataNameToID(self, handle, name, area_id):
+        self._sim.client_areas[area_id] = name.decode("ascii")
+        return 0
+
+    def CreateClientData(self, handle, area_id, size, flags):
+        return 0
+
+    def AddToClientDataDefinition(self, handle, definition_id, offset, size, epsilon, datum):
+        self._sim.client_definitions[definition_id] = (offset, size)
+        return 0
+
+    def ClearClientDataDefinition(self, handle, definition_id):
+        self._sim.client_definitions.pop(definition_id, None)
+        return 0
+
+    def RequestClientData(self, handle, area_id, request_id, definition_id, *args):
+        self._sim.client_subscriptions[(area_id, request_id)] = definition_id
+        self._sim.publish_lvars()
+        return 0
+
+    def SetClientData(self, handle, area_id, definition_id, flags, reserved, size, data):
+        self._sim.client_command(area_id, bytes(data).split(b"\0", 1)[0].decode("ascii"))
+        return 0
+
+    def Close(self, handle):
+        return 0
+
+
+class StandInSimulator:
+    """Stands in for a SimConnect connection to a simulator flying a route.
+
+    It answers the requests, events and MobiFlight client data traffic this
+    project uses, from a simple model of an aircraft flying `route` on
+    autopilot at a constant ground speed. Simulated time advances with the
+    clock times the sim rate, so it can be combined with a virtual clock.
+    """
+
+    def __init__(
+        self,
+        route=DEFAULT_ROUTE,
+        title="Stand-in Aircraft",
+        ground_speed=250,
+        vertical_speed=1500,
+        ground_elevation=100,
+        clock=monotonic,
+    ):
+        self.dll = _StandInDll(self)
+        self.hSimConnect = None
+        self.Requests = {}
+        self.quit = 0
+        self.ok = True
+        self.running = True
+        self.paused = False
+        self.connected = True
+        self.clock = clock
+        self.route = list(route)
+        # Length of the route after each waypoint, in nm
+        self._legs_after = [0.0] * len(self.route)
+        for i in range(len(self.route) - 2, -1, -1):
+            a, b = self.route[i], self.route[i + 1]
+            self._legs_after[i] = self._legs_after[i + 1] + _distance_nm(
+                a.lat, a.lon, b.lat, b.lon
+            )
+        self.title = title
+        self.ground_speed = ground_speed  # knots
+        self.vertical_speed = vertical_speed  # fpm
+        self.ground_elevation = ground_elevation  # meters
+        self.sim_rate = 1.0
+        self.sim_time = 0.0
+        self.lvars = {}
+        self.overrides = {}
+        self.events = []
+        self.counters = {"requests": 0, "events": 0}
+        self.data_definitions = {}
+        self._simobject_data_handlers = {}
+        # Payload stations and fuel tanks, in pounds and gallons
+        self.payload_stations = [0.0] * 4
+        self.fuel_tanks = {"LEFT MAIN": 50.0, "RIGHT MAIN": 50.0}
+        self.fuel_capacity = 100.0
+        self.client_areas = {}
+        self.client_definitions = {}
+        self.client_subscriptions = {}
+        self.client_lvars = {}
+        self._client_data_handlers = []
+        self._client_data_routes = {}
+        self._published = {}
+        self._next_id = 0
+        self.leg = 1
+        self.lat, self.lon, self.alt = self.route[0].lat, self.route[0].lon, 3000.0
+        self.bank = 0.0
+        self.turn_remaining = 0.0
+        self._last_advance = self.clock()
+        # Simvar values for the current state, see `simvar`
+        self._values = None
+
+    # Connection handle interface
+
+    def IsHR(self, hr, value):
+        return hr == value
+
+    def new_def_id(self):
+        self._next_id += 1
+        return _Id(self._next_id)
+
+    def new_request_id(self):
+        self._next_id += 1
+        return _Id(self._next_id)
+
+    def get_data(self, request):
+        self._check_connected()
+        self.counters["requests"] += 1
+        name, unit = request.definitions[0]
+        request.outData = self.simvar(name.decode())
+        return request.outData is not None
+
+    def set_data(self, request):
+        self._check_connected()
+        self.set_simvar(request.definitions[0][0].decode(), request.outData)
+        return True
+
+    def map_to_sim_event(self, name):
+        return _Id(name.decode())
+
+    def send_event(self, event, data=0):
+        self._check_connected()
+        self.counters["events"] += 1
+        self.events.append(event.value)
+        self.advance()
+        self._values = None
+        if event.value == "SIM_RATE_INCR":
+            self.sim_rate = min(16.0, self.sim_rate * 2)
+        elif event.value == "SIM_RATE_DECR":
+            self.sim_rate = max(0.25, self.sim_rate / 2)
+        elif event.value == "PAUSE_ON":
+            self.paused = True
+        elif event.value == "PAUSE_OFF":
+            self.paused = False
+        return True
+
+    def register_simobject_data_handler(self, request_id, handler):
+        self._simobject_data_handlers[request_id] = handler
+
+    def unregister_simobject_data_handler(self, request_id):
+        self._simobject_data_handlers.pop(request_id, None)
+
+    def request_data(self, request_id, definition_id):
+        self._check_connected()
+        self.counters["requests"] += 1
+        names = self.data_definitions.get(definition_id, [])
+        values = (ctypes.c_double * len(names))(*(self.simvar(n) for n in names))
+        message = SIMCONNECT_RECV_SIMOBJECT_DATA_BYTYPE()
+        message.dwRequestID = request_id
+        message.dwDefineID = definition_id
+        message.dwDefineCount = len(names)
+        ctypes.memmove(ctypes.addressof(message.dwData), values, ctypes.sizeof(values))
+        handler = self._simobject_data_handlers.get(request_id)
+        if handler is not None:
+            handler(message)
+
+    def register_client_data_handler(self, handler):
+        if handler not in self._client_data_handlers:
+            self._client_data_handlers.append(handler)
+
+    def unregister_client_data_handler(self, handler):
+        if handler in self._client_data_handlers:
+            self._client_data_handlers.remove(handler)
+
+    def route_client_data(self, request_id, handler):
+        self._client_data_routes[request_id] = handler
+
+    def unroute_client_data(self, request_id):
+        self._client_data_routes.pop(request_id, None)
+
+    def handoff(self, work):
+        # Messages are delivered on the calling thread, so is handed off work
+        work()
+
+    def exit(self):
+        self.quit = 1
+        self.connected = False
+
+    def disconnect(self):
+        """Simulate the simulator going away."""
+        self.quit = 1
+        self.connected = False
+
+    def reconnect(self):
+        """Simulate connecting again after `disconnect`. What SimConnect
+        keeps per connection starts over, the MobiFlight module keeps its
+        clients and their LVars."""
+        self.quit = 0
+        self.connected = True
+        self.Requests = {}
+        self.data_definitions = {}
+        self._simobject_data_handlers = {}
+        self.client_areas = {}
+        self.client_definitions = {}
+        self.client_subscriptions = {}
+        self._client_data_handlers = []
+        self._client_data_routes = {}
+        self._published = {}
+
+    def _check_connected(self):
+        if not self.connected:
+            raise StandInDisconnected("Stand-in simulator disconnected")
+
+    def resource_counts(self):
+        """Outstanding data requests, definitions and subscriptions, and
+        requests and events sent so far."""
+        return {
+            "data_requests": len(self.Requests),
+            "data_definitions": len(self.data_definitions),
+            "client_definitions": len(self.client_definitions),
+            "client_subscriptions": len(self.client_subscriptions),
+            "client_lvars": sum(len(v) for v in self.client_lvars.values()),
+            "requests": self.counters["requests"],
+            "events": self.counters["events"],
+        }
+
+    # MobiFlight WASM module
+
+    def set_lvar(self, name, value):
+        self.lvars[name] = value
+        self.publish_lvars()
+
+    def client_command(self, area_id, command):
+        area = self.client_areas.get(area_id, "")
+        client, _, kind = area.rpartition(".")
+        if kind != "Command":
+            return
+        if command.startswith("MF.SimVars.Add."):
+            self.client_lvars.setdefault(client, []).append(command[15:])
+        elif command == "MF.SimVars.Clear":
+            self.client_lvars[client] = []
+        elif command.startswith("MF.Clients.Add."):
+            self._respond(client, command + ".Finished")
+        elif command == "MF.Ping":
+            self._respond(client, "MF.Pong")
+        self.publish_lvars()
+
+    def _client_area(self, client, kind):
+        for area_id, name in self.client_areas.items():
+            if name == f"{client}.{kind}":
+                return area_id
+        return None
+
+    def _deliver(self, request_id, definition_id, data):
+        message = SIMCONNECT_RECV_CLIENT_DATA()
+        message.dwRequestID = request_id
+        message.dwDefineID = definition_id
+        ctypes.memmove(ctypes.addressof(message.dwData), data, len(data))
+        handler = self._client_data_routes.get(request_id)
+        if handler is not None:
+            handler(message)
+            return
+        for handler in list(self._client_data_handlers):
+            handler(message)
+
+    def _respond(self, client, response):
+        area_id = self._client_area(client, "Response")
+        data = response.encode("ascii") + b"\0"
+        for (area, request_id), definition_id in list(self.client_subscriptions.items()):
+            if area == area_id:
+                self._deliver(request_id, definition_id, data)
+
+    def publish_lvars(self):
+        """Send LVar values that changed to the subscribed client data."""
+        for (area_id, request_id), definition_id in list(
+            self.client_subscriptions.items()
+        ):
+            client, _, kind = self.client_areas.get(area_id, "").rpartition(".")
+            if kind != "LVars" or definition_id not in self.client_definitions:
+                continue
+            values = [self.lvars.get(name, 0.0) for name in self.client_lvars.get(client, [])]
+            area = struct.pack(f"<{len(values)}f", *values).ljust(4096, b"\0")
+            offset, size = self.client_definitions[definition_id]
+            data = area[offset : offset + size]
+            if self._published.get((area_id, request_id)) != data:
+                self._published[(area_id, request_id)] = data
+                self._deliver(request_id, definition_id, data)
+
+    # Flight model
+
+    def restart(self):
+        """Fly the route again from the start, as the next flight."""
+        self.leg = 1
+        self.lat, self.lon, self.alt = self.route[0].lat, self.route[0].lon, 3000.0
+        self.bank = 0.0
+        self.turn_remaining = 0.0
+        self.events = []
+        self._values = None
+
+    def advance(self):
+        now = self.clock()
+        elapsed = now - self._last_advance
+        self._last_advance = now
+        if self.paused or elapsed <= 0:
+            return
+        self.step(elapsed * self.sim_rate)
+
+    def step(self, seconds):
+        """Fly `seconds` of simulated time."""
+        self.sim_time += seconds
+        self._values = None
+        if self.leg >= len(self.route):
+            return
+        remaining = self.ground_speed / 3600 * seconds
+        while remaining > 0 and self.leg < len(self.route):
+            target = self.route[self.leg]
+            to_go = _distance_nm(self.lat, self.lon, target.lat, target.lon)
+            if to_go > remaining:
+                course = _bearing(self.lat, self.lon, target.lat, target.lon)
+                self.lat, self.lon = _destination(self.lat, self.lon, course, remaining)
+                break
+            remaining -= to_go
+            self.lat, self.lon = target.lat, target.lon
+            self.leg += 1
+            if self.leg < len(self.route):
+                turn = abs(self._leg_course(self.leg) - self._leg_course(self.leg - 1))
+                turn = min(turn, 360 - turn)
+                # A standard rate turn takes one second per 3 degrees
+                self.turn_remaining = turn / 3
+        self.bank = radians(25) if self.turn_remaining > 0 else 0.0
+        self.turn_remaining = max(0.0, self.turn_remaining - seconds)
+        target_alt = self.route[min(self.leg, len(self.route) - 1)].alt
+        climb = self.vertical_speed / 60 * seconds
+        if abs(target_alt - self.alt) <= climb:
+            self.alt = target_alt
+        else:
+            self.alt += climb if target_alt > self.alt else -climb
+
+    def _leg_course(self, leg):
+        a, b = self.route[leg - 1], self.route[leg]
+        return degrees(_bearing(a.lat, a.lon, b.lat, b.lon)) % 360
+
+    def _remaining_nm(self):
+        if self.leg >= len(self.route):
+            return 0.0
+        target = self.route[self.leg]
+        return (
+            _distance_nm(self.lat, self.lon, target.lat, target.lon)
+            + self._legs_after[self.leg]
+        )
+
+    def _vertical_speed(self):
+        target_alt = self.route[min(self.leg, len(self.route) - 1)].alt
+        if abs(target_alt - self.alt) < 1:
+            return 0.0
+        return self.vertical_speed if target_alt > self.alt else -self.vertical_speed
+
+    def set_simvar(self, name, value):
+        self._values = None
+        station, _, index = name.partition(":")
+        if station == "PAYLOAD STATION WEIGHT":
+            i = int(index) - 1
+            if 0 <= i < len(self.payload_stations):
+                self.payload_stations[i] = value
+        elif name.startswith("FUEL TANK ") and name.endswith(" QUANTITY"):
+            tank = name[10:-9]
+            if tank in self.fuel_tanks:
+                self.fuel_tanks[tank] = min(value, self.fuel_capacity)
+        else:
+            self.overrides[name] = value
+
+    def simvar(self, name):
+        """The value of a simvar, by its SimConnect name, e.g. "GPS ETE"."""
+        self.advance()
+        if name in self.overrides:
+            return self.overrides[name]
+        station, _, index = name.partition(":")
+        if station == "PAYLOAD STATION WEIGHT":
+            i = int(index) - 1
+            return self.payload_stations[i] if 0 <= i < len(self.payload_stations) else 0.0
+        if name.startswith("FUEL TANK ") and name.endswith(" QUANTITY"):
+            return self.fuel_tanks.get(name[10:-9], 0.0)
+        if name.startswith("FUEL TANK ") and name.endswith(" CAPACITY"):
+            tank = name[10:-9]
+            return self.fuel_capacity if tank in self.fuel_tanks else 0.0
+        if self._values is None:
+            self._values = self._simvars()
+        return self._values.get(name, 0.0)
+
+    def _simvars(self):
+        last = len(self.route) - 1
+        prev_wp = self.route[min(self.leg - 1, last)]
+        next_wp = self.route[min(self.leg, last)]
+        ground_ft = self.ground_elevation * 3.28084
+        gs_mps = self.ground_speed * 0.514444
+        return {
+            "TITLE": self.title.encode("utf-8"),
+            "GPS WP PREV LAT": prev_wp.lat,
+            "GPS WP PREV LON": prev_wp.lon,
+            "GPS POSITION LAT": self.lat,
+            "GPS POSITION LON": self.lon,
+            "GPS WP NEXT LAT": next_wp.lat,
+            "GPS WP NEXT LON": next_wp.lon,
+            "GPS WP NEXT ALT": next_wp.alt / 3.28084,
+            "GPS WP NEXT ID": next_wp.ident.encode("utf-8"),
+            "GROUND ALTITUDE": self.ground_elevation,
+            "PLANE PITCH DEGREES": 0.0,
+            "PLANE BANK DEGREES": self.bank,
+            "VERTICAL SPEED": self._vertical_speed(),
+            "AUTOPILOT MASTER": 1.0,
+            "GPS FLIGHT PLAN WP INDEX": float(min(self.leg, last)),
+            "GPS FLIGHT PLAN WP COUNT": float(len(self.route)),
+            "PLANE ALT ABOVE GROUND": self.alt - ground_ft,
+            "INDICATED ALTITUDE": self.alt,
+            "AUTOPILOT NAV1 LOCK": 1.0,
+            "AUTOPILOT HEADING LOCK": 0.0,
+            "AUTOPILOT APPROACH HOLD": 0.0,
+            "GPS IS APPROACH ACTIVE": 0.0,
+            "GPS GROUND SPEED": gs_mps,
+            "GPS GROUND TRUE TRACK": _bearing(self.lat, self.lon, next_wp.lat, next_wp.lon),
+            "GPS ETE": self._remaining_nm() / self.ground_speed * 3600,
+            "TRAILING EDGE FLAPS LEFT PERCENT": 0.0,
+            "TRAILING EDGE FLAPS RIGHT PERCENT": 0.0,
+            "LIGHT LANDING": 0.0,
+            "SIMULATION RATE": self.sim_rate,
+            "KOHLSMAN SETTING MB": 1013.25,
+            "SEA LEVEL PRESSURE": 1013.25,
+            "ENGINE TYPE": 1.0,
+            "PAYLOAD STATION COUNT": float(len(self.payload_stations)),
+            "EMPTY WEIGHT": 9000.0,
+            "MAX GROSS WEIGHT": 16000.0,
+            "FUEL WEIGHT PER GALLON": 6.7,
+            "FUEL TOTAL CAPACITY": self.fuel_capacity * len(self.fuel_tanks),
+            "FUEL TOTAL QUANTITY": sum(self.fuel_tanks.values()),
+            "FUEL TOTAL QUANTITY WEIGHT": sum(self.fuel_tanks.values()) * 6.7,
+        }
+
+
+class StandInConnection:
+    """Stands in for a `ConnectionSupervisor` that is connected to one
+    simulator, so the controller can be stepped from a single thread."""
+
+    def __init__(self, sim):
+        self.handle = sim
+        self.state = ConnectionState.CONNECTED
+        self.generation = 1
+        self.last_error = None
+
+    def reconnect(self, sim):
+        """Connected again, e.g. after `StandInSimulator.reconnect`."""
+        self.handle = sim
+        self.state = ConnectionState.CONNECTED
+        self.generation += 1
+
+    def connection_lost(self, handle, error=None):
+        if handle is not self.handle:
+            return
+        self.last_error = error
+        self.handle = None
+        self.state = ConnectionState.DISCONNECTED
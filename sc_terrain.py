@@ -0,0 +1,146 @@
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from math import cos, floor, radians, sin, sqrt
+
+
+class TerrainError(Exception):
+    pass
+
+
+# Two adjacent big-endian samples of one row
+_SAMPLE_PAIR = struct.Struct(">hh")
+# SRTM marks missing samples with this value
+VOID = -32768
+
+
+def tile_name(lat, lon):
+    """The SRTM file name of the tile holding lat/lon, e.g. N47W123.hgt."""
+    south, west = floor(lat), floor(lon)
+    ns = "N" if south >= 0 else "S"
+    ew = "E" if west >= 0 else "W"
+    return f"{ns}{abs(south):02d}{ew}{abs(west):03d}.hgt"
+
+
+class HgtTile:
+    """One memory mapped SRTM .hgt tile, 1 by 1 degree.
+
+    Samples are big-endian signed 16 bit meters, rows from north to south.
+    Both 3 arc second (1201 x 1201) and 1 arc second (3601 x 3601) tiles work.
+    """
+
+    def __init__(self, path, south, west):
+        size = os.path.getsize(path)
+        samples = int(round(sqrt(size / 2)))
+        if samples < 2 or samples * samples * 2 != size:
+            raise TerrainError(f"{path} is not an SRTM tile")
+        self.path = path
+        self.south = south
+        self.west = west
+        self.samples = samples
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def elevation(self, lat, lon):
+        """Bilinear interpolated elevation in meters, or None for a void."""
+        last = self.samples - 1
+        y = (self.south + 1 - lat) * last
+        x = (lon - self.west) * last
+        row = min(int(y), last - 1)
+        col = min(int(x), last - 1)
+        fy = y - row
+        fx = x - col
+        offset = (row * self.samples + col) * 2
+        nw, ne = _SAMPLE_PAIR.unpack_from(self._map, offset)
+        sw, se = _SAMPLE_PAIR.unpack_from(self._map, offset + self.samples * 2)
+        if VOID in (nw, ne, sw, se):
+            valid = [e for e in (nw, ne, sw, se) if e != VOID]
+            return max(valid) if valid else None
+        north = nw + (ne - nw) * fx
+        south = sw + (se - sw) * fx
+        return north + (south - north) * fy
+
+
+class TerrainTiles:
+    """Elevation lookups from a directory of SRTM .hgt tiles.
+
+    Tiles are opened on first use and the `max_open` most recently used are
+    kept mapped. Areas without a tile have no elevation (None).
+    """
+
+    def __init__(self, directory, max_open=16):
+        self.directory = directory
+        self.max_open = max_open
+        self._tiles = OrderedDict()
+
+    def close(self):
+        for tile in self._tiles.values():
+            if tile is not None:
+                tile.close()
+        self._tiles.clear()
+
+    def _tile(self, south, west):
+        key = (south, west)
+        tile = self._tiles.get(key, False)
+        if tile is not False:
+            self._tiles.move_to_end(key)
+            return tile
+        path = os.path.join(self.directory, tile_name(south, west))
+        tile = HgtTile(path, south, west) if os.path.exists(path) else None
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_open:
+            _, evicted = self._tiles.popitem(last=False)
+            if evicted is not None:
+                evicted.close()
+        return tile
+
+    def elevation(self, lat, lon):
+        """Elevation in meters at lat/lon, or None without data."""
+        tile = self._tile(floor(lat), floor(lon))
+        if tile is None:
+            return None
+        return tile.elevation(lat, lon)
+
+    def highest_along_track(self, lat, lon, track, distance_nm, spacing_nm=0.5):
+        """The highest terrain within `distance_nm` ahead on `track` (radians).
+
+        Returns (elevation in meters, distance in nm) of the highest sample,
+        or None if there is no data along the track.
+        """
+        lowest = self.lowest_clearance(
+            lat, lon, track, distance_nm, 0.0, 0.0, spacing_nm
+        )
+        return None if lowest is None else lowest[1:]
+
+    def lowest_clearance(
+        self, lat, lon, track, distance_nm, altitude, climb_per_nm, spacing_nm=0.5
+    ):
+        """The least height above the terrain within `distance_nm` ahead on
+        `track` (radians), starting at `altitude` meters and climbing
+        `climb_per_nm` meters per nm (negative to descend).
+
+        Every sample is compared with the altitude projected to it, so a lower
+        ridge further into a descent counts as well as the highest one.
+        Returns (clearance in meters, elevation in meters, distance in nm) of
+        the sample with the least clearance, or None if there is no data
+        along the track.
+        """
+        # Flat earth steps are close enough over the few hundred nm looked at
+        dlat = cos(track) / 60
+        dlon = sin(track) / (60 * max(0.01, cos(radians(lat))))
+        lowest = None
+        steps = int(distance_nm / spacing_nm)
+        for i in range(steps + 1):
+            d = i * spacing_nm
+            elevation = self.elevation(lat + dlat * d, lon + dlon * d)
+            if elevation is None:
+                continue
+            clearance = altitude + climb_per_nm * d - elevation
+            if lowest is None or clearance < lowest[0]:
+                lowest = (clearance, elevation, d)
+        return lowest
@@ -0,0 +1,303 @@
+import json
+from collections import defaultdict
+from math import cos, floor, log2, radians, sin, sqrt
+
+
+class ZoneError(Exception):
+    pass
+
+
+# Grid cell size of the index, in degrees
+CELL_DEGREES = 0.5
+
+
+def _nm_per_degree_lon(lat):
+    return 60 * max(0.01, cos(radians(lat)))
+
+
+def _rate_step(rate):
+    """The sim rate step at or below `rate`."""
+    return 2.0 ** floor(log2(rate))
+
+
+def _segment_hit(px, py, dx, dy, ax, ay, bx, by):
+    """Where segment p + t*d crosses segment a-b, as t from 0 to 1, or None."""
+    ex, ey = bx - ax, by - ay
+    denominator = dx * ey - dy * ex
+    if denominator == 0:
+        return None
+    qx, qy = ax - px, ay - py
+    t = (qx * ey - qy * ex) / denominator
+    u = (qx * dy - qy * dx) / denominator
+    if 0 <= t <= 1 and 0 <= u <= 1:
+        return t
+    return None
+
+
+class Zone:
+    """An area where the sim rate is capped at `max_rate`, between `floor`
+    and `ceiling` feet (None for no limit). `bounds` is (south, west, north,
+    east) in degrees.
+
+    The sim rate only steps in powers of two, so `max_rate` is rounded down
+    to one, e.g. 3 to 2, or the sim would flip around a cap it never hits.
+    """
+
+    def __init__(self, name, max_rate, floor=None, ceiling=None):
+        if max_rate <= 0:
+            raise ZoneError(f"Zone {name} needs a max_rate above 0")
+        self.name = name
+        self.max_rate = _rate_step(max_rate)
+        self.floor = floor
+        self.ceiling = ceiling
+        self.bounds = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r}, {self.max_rate})"
+
+    def in_band(self, altitude):
+        if altitude is None:
+            return True
+        if self.floor is not None and altitude < self.floor:
+            return False
+        return self.ceiling is None or altitude <= self.ceiling
+
+    def contains(self, lat, lon):
+        raise NotImplementedError
+
+    def entry(self, lat, lon, dx, dy):
+        """Where the track from lat/lon, `dx` nm east and `dy` nm north,
+        first enters the zone, as a fraction of it, or None if it does not."""
+        raise NotImplementedError
+
+
+class PolygonZone(Zone):
+    """Polygons as GeoJSON coordinates: a list of polygons, each a list of
+    rings of [lon, lat]. The first ring of a polygon is its outline and the
+    others are holes in it."""
+
+    def __init__(self, name, max_rate, polygons, floor=None, ceiling=None):
+        super().__init__(name, max_rate, floor, ceiling)
+        self.polygons = [
+            [[(float(lat), float(lon)) for lon, lat, *_ in ring] for ring in polygon]
+            for polygon in polygons
+        ]
+        points = [p for polygon in self.polygons for ring in polygon for p in ring]
+        if len(points) < 3:
+            raise ZoneError(f"Zone {name} has no area")
+        lats = [lat for lat, _ in points]
+        lons = [lon for _, lon in points]
+        self.bounds = (min(lats), min(lons), max(lats), max(lons))
+
+    def contains(self, lat, lon):
+        south, west, north, east = self.bounds
+        if not (south <= lat <= north and west <= lon <= east):
+            return False
+        for polygon in self.polygons:
+            inside = False
+            for ring in polygon:
+                j = len(ring) - 1
+                for i in range(len(ring)):
+                    lat_i, lon_i = ring[i]
+                    lat_j, lon_j = ring[j]
+                    if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (
+                        lat - lat_i
+                    ) / (lat_j - lat_i) + lon_i:
+                        inside = not inside
+                    j = i
+            if inside:
+                return True
+        return False
+
+    def entry(self, lat, lon, dx, dy):
+        if self.contains(lat, lon):
+            return 0.0
+        # Flat earth around the aircraft, close enough over a lookahead
+        x_scale = _nm_per_degree_lon(lat)
+        first = None
+        for polygon in self.polygons:
+            for ring in polygon:
+                previous = ring[-1]
+                for point in ring:
+                    t = _segment_hit(
+                        0.0,
+                        0.0,
+                        dx,
+                        dy,
+                        (previous[1] - lon) * x_scale,
+                        (previous[0] - lat) * 60,
+                        (point[1] - lon) * x_scale,
+                        (point[0] - lat) * 60,
+                    )
+                    if t is not None and (first is None or t < first):
+                        first = t
+                    previous = point
+        return first
+
+
+class CircleZone(Zone):
+    """Everything within `radius` nm of lat/lon."""
+
+    def __init__(self, name, max_rate, lat, lon, radius, floor=None, ceiling=None):
+        super().__init__(name, max_rate, floor, ceiling)
+        if radius <= 0:
+            raise ZoneError(f"Zone {name} needs a radius above 0")
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radius = float(radius)
+        dlat = radius / 60
+        dlon = radius / _nm_per_degree_lon(self.lat + (dlat if lat >= 0 else -dlat))
+        self.bounds = (
+            self.lat - dlat,
+            self.lon - dlon,
+            self.lat + dlat,
+            self.lon + dlon,
+        )
+
+    def _offset(self, lat, lon):
+        """The center, in nm east and north of lat/lon."""
+        return (
+            (self.lon - lon) * _nm_per_degree_lon((lat + self.lat) / 2),
+            (self.lat - lat) * 60,
+        )
+
+    def contains(self, lat, lon):
+        cx, cy = self._offset(lat, lon)
+        return cx * cx + cy * cy <= self.radius * self.radius
+
+    def entry(self, lat, lon, dx, dy):
+        cx, cy = self._offset(lat, lon)
+        c = cx * cx + cy * cy - self.radius * self.radius
+        if c <= 0:
+            return 0.0
+        # |t*d - center| = radius
+        a = dx * dx + dy * dy
+        b = -2 * (dx * cx + dy * cy)
+        discriminant = b * b - 4 * a * c
+        if a == 0 or discriminant < 0:
+            return None
+        t = (-b - sqrt(discriminant)) / (2 * a)
+        return t if 0 <= t <= 1 else None
+
+
+class ZoneIndex:
+    """Zones in a grid of `cell` degree cells by their bounds, so a query
+    only looks at the zones of the few cells around the aircraft and the
+    track ahead, however many zones there are. Zones may not cross the
+    antimeridian."""
+
+    def __init__(self, zones, cell=CELL_DEGREES):
+        self.zones = list(zones)
+        self.cell = cell
+        self._cells = defaultdict(list)
+        for zone in self.zones:
+            south, west, north, east = zone.bounds
+            for row in range(floor(south / cell), floor(north / cell) + 1):
+                for col in range(floor(west / cell), floor(east / cell) + 1):
+                    self._cells[(row, col)].append(zone)
+
+    def __len__(self):
+        return len(self.zones)
+
+    def candidates(self, south, west, north, east):
+        """The zones whose cells overlap the bounds, each once."""
+        cell = self.cell
+        found = {}
+        for row in range(floor(south / cell), floor(north / cell) + 1):
+            for col in range(floor(west / cell), floor(east / cell) + 1):
+                for zone in self._cells.get((row, col), ()):
+                    found[id(zone)] = zone
+        return found.values()
+
+    def containing(self, lat, lon, altitude=None):
+        """The zones lat/lon is in, at `altitude` feet if given."""
+        return [
+            zone
+            for zone in self.candidates(lat, lon, lat, lon)
+            if zone.in_band(altitude) and zone.contains(lat, lon)
+        ]
+
+    def ahead(self, lat, lon, track, distance_nm, altitude=None, feet_per_nm=0.0):
+        """The zones entered within `distance_nm` on `track` (radians), as
+        (distance in nm, zone) sorted by distance, then rate and name. A zone
+        the aircraft is in is at 0. The altitude at each entry is projected
+        with `feet_per_nm` for the altitude bands."""
+        dx = sin(track) * distance_nm
+        dy = cos(track) * distance_nm
+        end_lat = lat + dy / 60
+        end_lon = lon + dx / _nm_per_degree_lon(lat)
+        found = []
+        for zone in self.candidates(
+            min(lat, end_lat), min(lon, end_lon), max(lat, end_lat), max(lon, end_lon)
+        ):
+            t = zone.entry(lat, lon, dx, dy)
+            if t is None:
+                continue
+            distance = t * distance_nm
+            if altitude is not None and not zone.in_band(
+                altitude + feet_per_nm * distance
+            ):
+                continue
+            found.append((distance, zone))
+        found.sort(key=lambda hit: (hit[0], hit[1].max_rate, hit[1].name))
+        return found
+
+
+def _number(properties, key, name, default=None):
+    value = properties.get(key, default)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ZoneError(f"Zone {name}: {key} is not a number: {value!r}")
+
+
+def zone_from_feature(feature, number=0):
+    """A zone from a GeoJSON feature. Polygons and multipolygons are zones
+    as drawn, a point is a circle with a `radius_nm` property. `max_rate`
+    is required, `floor_ft` and `ceiling_ft` are optional."""
+    properties = feature.get("properties") or {}
+    geometry = feature.get("geometry") or {}
+    name = str(properties.get("name") or f"#{number + 1}")
+    max_rate = _number(properties, "max_rate", name)
+    if max_rate is None or max_rate <= 0:
+        raise ZoneError(f"Zone {name} needs a max_rate above 0")
+    floor_ft = _number(properties, "floor_ft", name)
+    ceiling_ft = _number(properties, "ceiling_ft", name)
+    kind = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    try:
+        if kind == "Polygon":
+            return PolygonZone(name, max_rate, [coordinates], floor_ft, ceiling_ft)
+        if kind == "MultiPolygon":
+            return PolygonZone(name, max_rate, coordinates, floor_ft, ceiling_ft)
+        if kind == "Point":
+            radius = _number(properties, "radius_nm", name)
+            if radius is None:
+                raise ZoneError(f"Zone {name} is a point without radius_nm")
+            lon, lat = coordinates[:2]
+            return CircleZone(name, max_rate, lat, lon, radius, floor_ft, ceiling_ft)
+    except (TypeError, ValueError, IndexError):
+        raise ZoneError(f"Zone {name} has invalid coordinates")
+    raise ZoneError(f"Zone {name}: {kind} geometry is not supported")
+
+
+def load_zones(path, cell=CELL_DEGREES):
+    """A ZoneIndex of the features in a GeoJSON file."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ZoneError(f"Cannot read zones from {path}: {e}")
+    if isinstance(data, dict) and data.get("type") == "Feature":
+        features = [data]
+    elif isinstance(data, dict):
+        features = data.get("features")
+    else:
+        features = data
+    if not isinstance(features, list):
+        raise ZoneError(f"{path} is not a GeoJSON feature collection")
+    return ZoneIndex(
+        (zone_from_feature(feature, i) for i, feature in enumerate(features)), cell
+    )
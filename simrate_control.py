@@ -1,16 +1,28 @@
-from sc_config import SimrateControlConfig
+from sc_clock import SYSTEM_CLOCK
+from sc_reads import SimvarReads
+from sc_annunciator import Annunciator
+from sc_analytics import FlightRecorder, session_path, write_report
+from sc_config import SimrateControlConfig, SimrateControlConfigError, ConfigWatcher
 from sc_curses import ScCurses, CursesCommands
-from lib.koseng.simconnect_mobiflight import SimConnectMobiFlight
+from sc_connection import ConnectionSupervisor
+from sc_events import EventDispatcher
+from sc_dashboard import Dashboard
+from sc_flightplans import FlightPlanIndex
+from sc_horizon import EVENTS, EventHorizon
+from sc_scheduler import TickScheduler
+from sc_shm import SharedStateError, StatePublisher, block_name
 from flight_parameters import (
     FlightDataMetrics,
     SimrateDiscriminator,
     SimConnectDataError,
+    UNCACHED,
 )
 from SimConnect import *
 import sys, os
+import logging
 import configparser
-from time import sleep
-from math import degrees, floor, log2
+import threading
+from math import ceil, degrees, floor, log2
 
 import pyttsx3
 
@@ -25,73 +37,166 @@ from geopy import distance
 # WaypointClearance = namedtuple("WaypointClearances", "prev next")
 
 
+class Speaker:
+    """A text-to-speech engine that can be shared between threads.
+
+    pyttsx3 engines are not thread safe, so announcements are serialised.
+    The engine is created on first use.
+    """
+
+    def __init__(self, engine=None):
+        self._engine = engine
+        self._lock = threading.Lock()
+
+    def say(self, text):
+        with self._lock:
+            if self._engine is None:
+                self._engine = pyttsx3.init()
+            self._engine.say(text)
+            self._engine.runAndWait()
+
+
+def make_speaker(config):
+    """The speaker for announcements, playing pre-rendered phrases."""
+    return Annunciator(
+        os.path.expandvars(config.annunciation_cache) or None,
+        config.annunciation_voice,
+    )
+
+
+def rate_phrase(rate):
+    """The announcement for a sim rate."""
+    if rate >= 1.0:
+        return f"Sim rate {str(int(rate))}"
+    return f"Sim rate {str(rate)}"
+
+
 class SimRateManager:
     """Manages the game sim rate, and audible annunciation."""
 
-    def __init__(self, sm, config):
-        self.sm = sm
+    def __init__(
+        self, sm, config, speaker=None, name=None, clock=SYSTEM_CLOCK, reads=None
+    ):
         self._config = config
+        self.clock = clock
+        self.reads = (
+            reads
+            if reads is not None
+            else SimvarReads(
+                clock,
+                config.read_deadline,
+                config.breaker_failures,
+                config.breaker_reset,
+            )
+        )
         self.have_paused_at_tod = False
-
-        self.aq = AircraftRequests(self.sm)
+        # The last sim rate read, or the one it was changed to since
+        self.sim_rate = None
+        # The sim rate last announced, see `update`
+        self._announced_rate = None
+        # A changed sim rate is not read again before this clock time
+        self._settled_at = None
+        # Paused by `pause`, until `unpause`
+        self.paused = False
+        self.rebind(sm)
+        self.speaker = speaker if speaker is not None else Speaker()
+        # Prefixed to announcements, to tell seats apart
+        self.name = name
+        self.prepare_announcements()
+
+    def rebind(self, sm):
+        """Send requests and events through a new SimConnect connection."""
+        self.sm = sm
+        self.aq = AircraftRequests(self.sm, _time=UNCACHED)
         self.ae = AircraftEvents(self.sm)
-
-        self.increase_sim_rate = self.ae.find("SIM_RATE_INCR")
-        self.decrease_sim_rate = self.ae.find("SIM_RATE_DECR")
-        # The most innocuous "SELECT" event I can find at the moment to prevent
-        # wild simrrate selections while adjusting something (e.g. altitude bug)
-        # during a transition.
-        # TODO: Figure out something better.
-        self.heading_select_bug = self.ae.find("HEADING_BUG_SELECT")
-        self.set_barometer = self.ae.find("BAROMETRIC")
-        self.set_mixture = self.ae.find("MIXTURE_SET_BEST")
-        self.ae_pause = self.ae.find("PAUSE_ON")
-        self.ae_pause_off = self.ae.find("PAUSE_OFF")
-        self.tts_engine = pyttsx3.init()
+        if hasattr(self, "events"):
+            self.events.rebind(self.ae)
+        else:
+            self.events = EventDispatcher(self.ae, clock=self.clock)
+        # Static for an aircraft, read on first use, see `set_aircraft`
+        self._engine_type = None
+        self._aircraft = None
+
+    def reconfigure(self, config):
+        self.reads.reconfigure(
+            config.read_deadline, config.breaker_failures, config.breaker_reset
+        )
+        rates_changed = (config.min_rate, config.max_rate) != (
+            self._config.min_rate,
+            self._config.max_rate,
+        )
+        self._config = config
+        if rates_changed:
+            self.prepare_announcements()
 
     def _get_value(self, aq_name, retries=sys.maxsize):
-        # PySimConnect seems to crash the sim if requests happen too fast.
-        sleep(0.05)
-        val = self.aq.find(str(aq_name)).value
-        i = 0
-        while val is None and i < retries:
-            sleep(min(1, 0.01 * (i + 1)))
-            val = self.aq.find(str(aq_name)).value
-            i += 1
-        return val
+        """The value of a simvar, or its last good value when it could not be
+        read in time, so a stuck simvar cannot stop deceleration."""
+        value, _ = self.reads.read(aq_name, self._request, retries)
+        return value
+
+    def _request(self, aq_name):
+        return self.aq.find(str(aq_name)).value
+
+    def _named(self, text):
+        return f"{self.name}, {text}" if self.name else text
+
+    def say(self, text):
+        self.speaker.say(self._named(text))
+
+    def announcements(self):
+        """What may be said with the current config: the rates the sim steps
+        through between `min_rate` and `max_rate`, and pausing."""
+        low = ceil(log2(self._config.min_rate))
+        high = floor(log2(self._config.max_rate))
+        phrases = [rate_phrase(2.0 ** k) for k in range(low, high + 1)]
+        phrases += ["Game paused at tod", "Game unpaused"]
+        return [self._named(text) for text in phrases]
+
+    def prepare_announcements(self):
+        """Let a speaker that renders phrases ahead of time, like
+        `Annunciator`, prepare them."""
+        prepare = getattr(self.speaker, "prepare", None)
+        if self._config.annunciation and prepare is not None:
+            prepare(self.announcements())
+
+    def settling(self):
+        """Has the sim rate been changed less than `rate_settle` seconds
+        ago?"""
+        return (
+            self._settled_at is not None and self.clock.monotonic() < self._settled_at
+        )
 
     def get_sim_rate(self):
-        """Get the current sim rate."""
-        return self._get_value("SIMULATION_RATE")
+        """Get the current sim rate. While `settling`, the rate it was
+        changed to, which the sim may not report yet."""
+        if not self.settling():
+            self.sim_rate = self._get_value("SIMULATION_RATE")
+        return self.sim_rate
 
-    def say_sim_rate(self):
+    def say_sim_rate(self, rate=None):
         """Speak the current sim rate using text-to-speech"""
         if not self._config.annunciation:
             return
 
         try:
-            simrate = self.get_sim_rate()
-            if simrate >= 1.0:
-                self.tts_engine.say(f"Sim rate {str(int(simrate))}")
-            else:
-                self.tts_engine.say(f"Sim rate {str(simrate)}")
-            self.tts_engine.runAndWait()
+            self.say(rate_phrase(self.get_sim_rate() if rate is None else rate))
         except TypeError:
             pass
 
     def pause(self):
         """Pause the sim"""
-        self.ae_pause()
+        self.events.send("PAUSE_ON")
+        self.paused = True
         if self._config.annunciation:
-            self.tts_engine.say(f"Game paused at tod")
-            self.tts_engine.runAndWait()
+            self.say(f"Game paused at tod")
 
     def unpause(self):
         """Pause the sim"""
-        self.ae_pause_off()
+        self.events.send("PAUSE_OFF")
+        self.paused = False
         if self._config.annunciation:
-            self.tts_engine.say(f"Game unpaused")
-            self.tts_engine.runAndWait()
+            self.say(f"Game unpaused")
 
     def stop_acceleration(self):
         """Decrease the sim rate to the minimum"""
@@ -99,29 +204,66 @@ class SimRateManager:
         if simrate is None:
             return
         while simrate > self._config.min_rate:
-            sleep(2)
+            self.clock.sleep(2)
             self.decelerate()
             simrate /= 2
 
+    def is_barometer_set(self):
+        """Is the altimeter already set to the sea level pressure?"""
+        kohlsman = self._get_value("KOHLSMAN_SETTING_MB", retries=3)
+        sea_level = self._get_value("SEA_LEVEL_PRESSURE", retries=3)
+        if kohlsman is None or sea_level is None:
+            return False
+        return abs(kohlsman - sea_level) < 0.5
+
+    def set_aircraft(self, title):
+        """Forget what was read about the aircraft when it changes."""
+        if title != self._aircraft:
+            self._aircraft = title
+            self._engine_type = None
+
+    def has_mixture(self):
+        """Only piston engines have a mixture control."""
+        if self._engine_type is None:
+            self._engine_type = self._get_value("ENGINE_TYPE", retries=3)
+        return self._engine_type is None or int(self._engine_type) == 0
+
+    def change_rate(self, rate_event):
+        """Send a sim rate event and its side effects as one batch."""
+        with self.clock.held():
+            self.events.queue(rate_event)
+            if self._config.set_barometer:
+                if self.is_barometer_set():
+                    self.events.skip("BAROMETRIC")
+                else:
+                    self.events.queue("BAROMETRIC")
+            if self._config.set_mixture:
+                if self.has_mixture():
+                    self.events.queue("MIXTURE_SET_BEST")
+                else:
+                    self.events.skip("MIXTURE_SET_BEST")
+            # The most innocuous "SELECT" event I can find at the moment to
+            # prevent wild simrrate selections while adjusting something (e.g.
+            # altitude bug) during a transition.
+            # TODO: Figure out something better.
+            self.events.queue("HEADING_BUG_SELECT")
+            self.events.flush()
+        if self.sim_rate is not None:
+            if rate_event == "SIM_RATE_INCR":
+                self.sim_rate *= 2
+            else:
+                self.sim_rate /= 2
+        self._settled_at = self.clock.monotonic() + self._config.rate_settle
+
     def decelerate(self):
         """Decrease the sim rate, up to some maximum"""
         simrate = self.get_sim_rate()
         if simrate is None:
             return
         if simrate > self._config.min_rate:
-            self.decrease_sim_rate()
-            if self._config.set_barometer:
-                self.set_barometer()
-            if self._config.set_mixture:
-                self.set_mixture()
-            self.heading_select_bug()
+            self.change_rate("SIM_RATE_DECR")
         elif simrate < self._config.min_rate:
-            self.increase_sim_rate()
-            if self._config.set_barometer:
-                self.set_barometer()
-            if self._config.set_mixture:
-                self.set_mixture()
-            self.heading_select_bug()
+            self.change_rate("SIM_RATE_INCR")
 
     def accelerate(self):
         """Increase the sim rate, up to some maximum"""
@@ -129,100 +271,521 @@ class SimRateManager:
         if simrate is None:
             return
         if simrate < self._config.max_rate:
-            self.increase_sim_rate()
-            if self._config.set_barometer:
-                self.set_barometer()
-            if self._config.set_mixture:
-                self.set_mixture()
-            self.heading_select_bug()
+            self.change_rate("SIM_RATE_INCR")
         elif simrate > self._config.max_rate:
-            self.decrease_sim_rate()
-            if self._config.set_barometer:
-                self.set_barometer()
-            if self._config.set_mixture:
-                self.set_mixture()
-            self.heading_select_bug()
+            self.change_rate("SIM_RATE_DECR")
+
+    def slow_to(self, rate):
+        """Decrease the sim rate to `rate` right away, stepping down from the
+        last sim rate known instead of reading it between steps."""
+        rate = max(rate, self._config.min_rate)
+        while self.sim_rate is not None and self.sim_rate > rate:
+            self.change_rate("SIM_RATE_DECR")
 
     def update(self, max_stable_rate):
+        """Step the sim rate toward `max_stable_rate`.
+
+        A change is given `rate_settle` seconds to take effect before the
+        next one, instead of waiting for it here. A new rate is announced
+        once the sim reports it.
+        """
         messages = []
-        prev_simrate = self.get_sim_rate()
         if max_stable_rate is None:
             raise SimConnectDataError()
-        elif max_stable_rate == 0 and not self.have_paused_at_tod:
-            self.have_paused_at_tod = True
-            self.pause()
-        elif max_stable_rate > prev_simrate:
-            messages.append("accelerate")
-            self.accelerate()
-        elif max_stable_rate < prev_simrate:
-            messages.append("decelerate")
-            self.decelerate()
-        sleep(0.5)
-        new_simrate = self.get_sim_rate()
-        if prev_simrate != new_simrate:
-            self.say_sim_rate()
+        # The rate read must not change before it is acted on
+        with self.clock.held():
+            settling = self.settling()
+            prev_simrate = self.get_sim_rate()
+            if max_stable_rate == 0 and not self.have_paused_at_tod:
+                self.have_paused_at_tod = True
+                self.pause()
+            elif settling:
+                pass
+            elif max_stable_rate > prev_simrate:
+                messages.append("accelerate")
+                self.accelerate()
+            elif max_stable_rate < prev_simrate:
+                messages.append("decelerate")
+                self.decelerate()
+        if not settling:
+            announced = self._announced_rate
+            if announced is not None and prev_simrate != announced:
+                self.say_sim_rate(prev_simrate)
+            self._announced_rate = prev_simrate
         return messages
 
 
-def write_screen(
-    sc_curses: ScCurses,
+def rate_status(
+    config: SimrateControlConfig,
+    simrate_discriminator: SimrateDiscriminator,
+    simrate_manager: SimRateManager,
+    target_rate=None,
+    limiting_guard=None,
+):
+    """The sim rate and what limits it, as decided this tick. The target
+    rate and limiting guard default to the discriminator's last decision."""
+    if target_rate is None:
+        target_rate = simrate_discriminator.max_sim_rate
+    if limiting_guard is None:
+        limiting_guard = simrate_discriminator.limiting_guard
+    return {
+        "sim_rate": simrate_manager.sim_rate,
+        "target_rate": target_rate,
+        "max_rate": config.max_rate,
+        "limiting_guard": limiting_guard,
+    }
+
+
+def flight_status(
+    config: SimrateControlConfig,
+    flight_data_parameters: FlightDataMetrics,
+    simrate_discriminator: SimrateDiscriminator,
+):
+    """The flight data shown on screen. Reads any simvars the decision this
+    tick did not need."""
+    return {
+        "bank": degrees(flight_data_parameters.aq_bank),
+        "pitch": degrees(flight_data_parameters.aq_pitch),
+        "max_bank": config.max_bank,
+        "max_pitch": config.max_pitch,
+        "ground_speed": flight_data_parameters.ground_speed() * 3600,
+        "waypoint_ident": flight_data_parameters.aq_next_wp_ident,
+        "ground_alt": flight_data_parameters.get_ground_elevation(),
+        "waypoint_distance": flight_data_parameters.get_waypoint_distances().next,
+        "waypoint_direction": flight_data_parameters.get_waypoint_directions()[1],
+        "waypoint_alt": flight_data_parameters.next_waypoint_altitude(),
+        "target_vspeed": flight_data_parameters.target_fpm(),
+        "target_slope": flight_data_parameters.choose_slope_angle(),
+        "tod_distance": flight_data_parameters.distance_to_flc(),
+        "tod_time": flight_data_parameters.time_to_flc(),
+        "vspeed": flight_data_parameters.aq_vsi,
+        "needed_vspeed": flight_data_parameters.required_fpm(),
+        "ap_mode": simrate_discriminator.is_ap_active(),
+        "min_agl": config.min_agl_cruise,
+        "agl": flight_data_parameters.aq_agl,
+        "alt": flight_data_parameters.aq_alt_indicated,
+        "ete": flight_data_parameters.aq_ete,
+    }
+
+
+def screen_status(
     config: SimrateControlConfig,
     flight_data_parameters: FlightDataMetrics,
     simrate_discriminator: SimrateDiscriminator,
     simrate_manager: SimRateManager,
-    messages,
 ):
-    sc_curses.write_simrate(simrate_manager.get_sim_rate())
-    sc_curses.write_target_simrate(simrate_discriminator.get_max_sim_rate())
-    sc_curses.write_max_simrate(config.max_rate)
-    sc_curses.write_bank(degrees(flight_data_parameters.aq_bank))
-    sc_curses.write_pitch(degrees(flight_data_parameters.aq_pitch))
-    sc_curses.write_ground_speed(flight_data_parameters.ground_speed() * 3600)
-    sc_curses.write_waypoint_ident(flight_data_parameters.aq_next_wp_ident)
-    sc_curses.write_ground_alt(flight_data_parameters.get_ground_elevation())
-    sc_curses.write_waypoint_distance(
-        flight_data_parameters.get_waypoint_distances().next
-    )
-    sc_curses.write_waypoint_direction(
-        flight_data_parameters.get_waypoint_directions()[1]
-    )
-    sc_curses.write_waypoint_alt(flight_data_parameters.next_waypoint_altitude())
-    sc_curses.write_target_vspeed(flight_data_parameters.target_fpm())
-    sc_curses.write_target_slope(flight_data_parameters.choose_slope_angle())
-    sc_curses.write_tod_distance(flight_data_parameters.distance_to_flc())
-    sc_curses.write_tod_time(
-        flight_data_parameters.time_to_flc(), simrate_manager.get_sim_rate()
-    )
-    sc_curses.write_vspeed(flight_data_parameters.aq_vsi)
-    sc_curses.write_needed_vspeed(flight_data_parameters.required_fpm())
-    sc_curses.write_max_bank(config.max_bank)
-    sc_curses.write_max_pitch(config.max_pitch)
-    sc_curses.write_ap_mode(simrate_discriminator.is_ap_active())
-    sc_curses.write_min_agl(config.min_agl_cruise)
-    sc_curses.write_agl(flight_data_parameters.aq_agl)
-    sc_curses.write_alt(flight_data_parameters.aq_alt_indicated)
-    sc_curses.write_ete(flight_data_parameters.aq_ete)
-    sc_curses.write_ete_compressed(
-        flight_data_parameters.aq_ete, simrate_manager.get_sim_rate()
+    """Everything shown on screen, from the values read this tick."""
+    status = rate_status(config, simrate_discriminator, simrate_manager)
+    status.update(
+        flight_status(config, flight_data_parameters, simrate_discriminator)
     )
+    return status
+
+
+def write_screen(sc_curses: ScCurses, status, messages):
+    sc_curses.write_simrate(status["sim_rate"])
+    sc_curses.write_target_simrate(status["target_rate"])
+    sc_curses.write_max_simrate(status["max_rate"])
+    sc_curses.write_bank(status["bank"])
+    sc_curses.write_pitch(status["pitch"])
+    sc_curses.write_ground_speed(status["ground_speed"])
+    sc_curses.write_waypoint_ident(status["waypoint_ident"])
+    sc_curses.write_ground_alt(status["ground_alt"])
+    sc_curses.write_waypoint_distance(status["waypoint_distance"])
+    sc_curses.write_waypoint_direction(status["waypoint_direction"])
+    sc_curses.write_waypoint_alt(status["waypoint_alt"])
+    sc_curses.write_target_vspeed(status["target_vspeed"])
+    sc_curses.write_target_slope(status["target_slope"])
+    sc_curses.write_tod_distance(status["tod_distance"])
+    sc_curses.write_tod_time(status["tod_time"], status["sim_rate"])
+    sc_curses.write_vspeed(status["vspeed"])
+    sc_curses.write_needed_vspeed(status["needed_vspeed"])
+    sc_curses.write_max_bank(status["max_bank"])
+    sc_curses.write_max_pitch(status["max_pitch"])
+    sc_curses.write_ap_mode(status["ap_mode"])
+    sc_curses.write_min_agl(status["min_agl"])
+    sc_curses.write_agl(status["agl"])
+    sc_curses.write_alt(status["alt"])
+    sc_curses.write_ete(status["ete"])
+    sc_curses.write_ete_compressed(status["ete"], status["sim_rate"])
     sc_curses.write_messages(messages)
 
 
-def connect(retries=999):
-    connected = False
-    sm = None
-    i = 0
-    while not connected and i <= retries:
-        i += 1
+def config_changes(user_input, config):
+    """The config changes requested by a key press."""
+    if user_input == CursesCommands.TOGGLE_VNAV_GUARD:
+        return {"waypoint_vnav": not config.waypoint_vnav}
+    if user_input == CursesCommands.TOGGLE_LNAV_GUARD:
+        return {"ap_nav_guarded": not config.ap_nav_guarded}
+    if user_input == CursesCommands.TOGGLE_ETE_GUARD:
+        return {"ete_guard": not config.ete_guard}
+    if user_input == CursesCommands.MAX_SIMRATE_1:
+        return {"max_rate": 1}
+    if user_input == CursesCommands.MAX_SIMRATE_2:
+        return {"max_rate": 2}
+    if user_input == CursesCommands.MAX_SIMRATE_4:
+        return {"max_rate": 4}
+    if user_input == CursesCommands.MAX_SIMRATE_8:
+        return {"max_rate": 8}
+    if user_input == CursesCommands.MAX_SIMRATE_16:
+        return {"max_rate": 16}
+    return {}
+
+
+def reconfigure(config, *components):
+    """Swap a new config into every component that exists."""
+    for component in components:
+        if component is not None:
+            component.reconfigure(config)
+
+
+class SimrateController:
+    """Flight data, stability discriminator and sim rate manager for one sim.
+
+    The components are created on the first connection and rebound to every
+    later one, so their state (e.g. pause at TOD, acceleration toggled off by
+    the user) survives a reconnect.
+    """
+
+    def __init__(
+        self, config, speaker=None, name=None, flight_plans=None, clock=SYSTEM_CLOCK
+    ):
+        self.config = config
+        self.clock = clock
+        self.speaker = speaker
+        self.name = name
+        self.flight_plans = flight_plans
+        self.sm = None
+        self.flight_data_metrics = None
+        self.flight_stability = None
+        self.srm = None
+        self.accelerating = True
+        self.target_rate = None
+        self.messages = []
+        self.status = None
+        # The components sleep on the event horizon, so that predicted events
+        # fire on time in the middle of a tick, see `plan_events`
+        self.horizon = EventHorizon(clock, config.horizon_drift, self._event_due)
+        # Updates start on its deadlines, see `wait`
+        self.scheduler = TickScheduler(self.horizon)
+        # Simvar reads for the flight data and the sim rate manager. Every
+        # tick shares one deadline.
+        self.reads = SimvarReads(
+            self.horizon,
+            config.read_deadline,
+            config.breaker_failures,
+            config.breaker_reset,
+        )
+        # Flight data is shown every `display_interval` seconds, see `step`
+        self._flight_status = None
+        self._flight_status_time = None
+        self.recorder = None
+        if config.analytics_directory:
+            directory = os.path.expandvars(config.analytics_directory)
+            os.makedirs(directory, exist_ok=True)
+            self.recorder = FlightRecorder(session_path(directory, name), clock)
+        # The state for local tools, see `publish`, and why it is not
+        # published
+        self.shared_state = None
+        self.shared_state_error = None
+        if config.shared_memory:
+            try:
+                self.shared_state = StatePublisher(
+                    block_name(config.shared_memory, name)
+                )
+            except (SharedStateError, OSError) as e:
+                self.shared_state_error = str(e)
+
+    @property
+    def ready(self):
+        return self.sm is not None and self.srm is not None
+
+    def bind(self, sm):
+        self.sm = None
+        if self.flight_data_metrics is None:
+            self.flight_data_metrics = FlightDataMetrics(
+                sm, self.config, self.flight_plans, self.horizon, self.reads
+            )
+            self.flight_stability = SimrateDiscriminator(
+                self.flight_data_metrics, self.config
+            )
+        else:
+            self.flight_data_metrics.rebind(sm)
+        if self.srm is None:
+            self.srm = SimRateManager(
+                sm, self.config, self.speaker, self.name, self.horizon, self.reads
+            )
+        else:
+            self.srm.rebind(sm)
+        self.sm = sm
+
+    def unbind(self):
+        self.sm = None
+        self.horizon.clear()
+
+    def reconfigure(self, config):
+        self.config = config
+        self.horizon.drift = config.horizon_drift
+        reconfigure(config, self.flight_data_metrics, self.flight_stability, self.srm)
+
+    def handle_command(self, command):
+        if command == CursesCommands.TOGGLE_ACCEL:
+            # Toggle pausing acceleration on and off
+            self.accelerating = not self.accelerating
+        if command == CursesCommands.UNPAUSE:
+            self.srm.unpause()
+        if command == CursesCommands.PAUSE:
+            self.srm.pause()
+
+    def max_stable_rate(self):
+        if self.accelerating:
+            return self.flight_stability.get_max_sim_rate()
+        return 1
+
+    def tick(self):
+        messages = []
+        if not self.config.waypoint_vnav:
+            messages.append("Waypoint vertical detection disabled")
+        if not self.accelerating:
+            messages.append("Acceleration paused by user")
+        self.reads.start_tick()
         try:
-            sm = SimConnectMobiFlight()  # SimConnect()
-            connected = True
-        except KeyboardInterrupt:
-            quit()
-        except Exception as e:
-            # ui.write_message(type(e).__name__, e)
-            sleep(1)
-    return sm
+            self.flight_data_metrics.update()
+            self.srm.set_aircraft(self.flight_data_metrics.aq_title)
+            rate_then = self.srm.sim_rate
+            max_stable_rate = self.max_stable_rate()
+            decided = self.clock.monotonic()
+            upcoming = self.upcoming_events()
+            max_stable_rate = self.held_rate(max_stable_rate)
+            self.target_rate = max_stable_rate
+            messages += self.flight_data_metrics.messages
+            messages += self.flight_stability.get_messages()
+            messages += self.srm.update(max_stable_rate)
+            self.plan_events(upcoming, decided, rate_then)
+        finally:
+            self.reads.end_tick()
+        return messages
+
+    def upcoming_events(self):
+        if not (self.config.event_horizon and self.accelerating):
+            return {}
+        return self.flight_stability.upcoming_events()
+
+    def held_rate(self, max_stable_rate):
+        """The decided rate, lowered for the events that fired since they
+        were planned and are still due."""
+        limit = self.horizon.limit()
+        if limit is None or not self.accelerating or self.srm.paused:
+            return max_stable_rate
+        self.flight_stability.hold(max(limit.rate, self.config.min_rate), limit.name)
+        return self.flight_stability.max_sim_rate
+
+    def plan_events(self, upcoming, since, rate_then):
+        """Plan the upcoming events on the horizon, in clock seconds at the
+        sim rate now. `upcoming` is in sim seconds from clock time `since`,
+        when the sim ran at `rate_then`."""
+        rate = self.srm.sim_rate
+        if not (self.config.event_horizon and self.accelerating and rate) or (
+            self.srm.paused
+        ):
+            # Sim time does not pass at a known rate
+            self.horizon.clear()
+            return
+        flown = (self.clock.monotonic() - since) * (rate_then or rate)
+        for name in EVENTS:
+            if name in upcoming:
+                sim_seconds, event_rate = upcoming[name]
+                self.horizon.plan(name, (sim_seconds - flown) / rate, event_rate)
+            else:
+                self.horizon.cancel(name)
+
+    def _event_due(self, event):
+        """Slow down or pause for an event as it comes due."""
+        if not self.ready:
+            return
+        if event.rate == 0 and not self.srm.have_paused_at_tod:
+            self.flight_stability.have_paused_at_tod = True
+            self.srm.have_paused_at_tod = True
+            self.srm.pause()
+        else:
+            self.srm.slow_to(event.rate)
+
+    def step(self, supervisor, config_watcher, command=None, ui=None):
+        """Run one control loop iteration on the supervisor's connection.
+
+        Returns False when there is no connection to run on. Data errors
+        decelerate the sim if configured, and a failed connection is handed
+        back to the supervisor to replace.
+        """
+        messages = []
+        new_config = config_watcher.poll()
+        if new_config is not None:
+            self.reconfigure(new_config)
+            messages.append("Configuration reloaded.")
+        if config_watcher.error is not None:
+            messages.append(f"Config error, keeping last good: {config_watcher.error}")
+        if self.shared_state_error is not None:
+            messages.append(f"Shared memory not published: {self.shared_state_error}")
+
+        sm = supervisor.handle
+        if sm is None:
+            self.unbind()
+            self.scheduler.reset()
+            self.messages = messages
+            self.publish()
+            return False
+        try:
+            if sm is not self.sm:
+                self.bind(sm)
+            if ui is not None:
+                ui.write_message("Connected to simulator.")
+            self.handle_command(command)
+            changes = config_changes(command, self.config)
+            if changes:
+                try:
+                    self.reconfigure(config_watcher.override(**changes))
+                except SimrateControlConfigError as e:
+                    messages.append(str(e))
+
+            messages += self.tick()
+            self.status = self.screen_status()
+            self.record()
+            if ui is not None:
+                self.write_screen(ui, messages)
+        except (SimConnectDataError, AttributeError, TypeError) as e:
+            messages.append("DATA ERROR")
+            messages.append(str(e))
+            if self.config.decelerate_on_simconnect_error and self.ready:
+                self.srm.decelerate()
+        except OSError as e:
+            if ui is not None:
+                ui.write_message(str(e))
+            messages.append(str(e))
+            self.unbind()
+            supervisor.connection_lost(sm, e)
+        self.messages = messages
+        self.publish()
+        return True
+
+    def screen_status(self):
+        """The status for this tick. The sim rate is always current, flight
+        data is refreshed every `display_interval` seconds so that the
+        display does not read every simvar on every tick."""
+        now = self.clock.monotonic()
+        if (
+            self._flight_status is None
+            or now - self._flight_status_time >= self.config.display_interval
+        ):
+            self._flight_status = flight_status(
+                self.config, self.flight_data_metrics, self.flight_stability
+            )
+            self._flight_status_time = now
+        # The target set this tick, which is 1x with acceleration off and
+        # the discriminator not asked
+        status = rate_status(
+            self.config,
+            self.flight_stability,
+            self.srm,
+            self.target_rate,
+            self.limiting_guard(),
+        )
+        status.update(self._flight_status)
+        status.update(self.scheduler.stats())
+        status.update(self.srm.events.stats())
+        return status
+
+    def tick_period(self):
+        """Seconds from this update to the next.
+
+        `loop_sim_seconds` of flight at the current sim rate, so updates
+        come quicker the faster the sim runs, and slower in cruise at a low
+        rate. The shortest while the sim rate is stepping toward the target,
+        a guard is near its threshold (see `near_thresholds`), or a
+        predicted event is due before the next update would be.
+        """
+        config = self.config
+        rate = self.srm.sim_rate if self.srm is not None else None
+        if not rate or rate != self.target_rate:
+            return config.loop_min_period
+        if self.accelerating and self.flight_stability.near_thresholds:
+            return config.loop_min_period
+        period = min(config.loop_max_period, config.loop_sim_seconds / rate)
+        due = self.horizon.next_due()
+        if due is not None and due - self.clock.monotonic() < period:
+            return config.loop_min_period
+        return max(config.loop_min_period, period)
+
+    def wait(self):
+        """Sleep until the next update is due. Predicted events fire
+        meanwhile."""
+        self.scheduler.wait(self.tick_period())
+
+    def write_screen(self, ui, messages):
+        write_screen(ui, self.status, messages)
+
+    def limiting_guard(self):
+        if not self.accelerating:
+            return "acceleration off"
+        return self.flight_stability.limiting_guard
+
+    def record(self):
+        if self.recorder is None:
+            return
+        guard = self.limiting_guard()
+        self.recorder.record(
+            self.srm.sim_rate,
+            self.target_rate,
+            self.config.max_rate,
+            guard,
+            self.srm.paused,
+        )
+
+    def publish(self):
+        """Publish the state of this update for local tools, see `sc_shm`."""
+        if self.shared_state is None:
+            return
+        state = {"connected": self.ready, "accelerating": self.accelerating}
+        if self.ready and self.status is not None:
+            state.update(self.status)
+            state["paused"] = self.srm.paused
+        self.shared_state.publish(state)
+
+    def stop(self):
+        """Bring the sim back to the minimum rate."""
+        self.horizon.clear()
+        self.srm.stop_acceleration()
+        self.clock.sleep(1)
+        self.srm.say_sim_rate()
+
+    def close(self):
+        """End the session. Returns the path of the flight report, if any."""
+        if self.srm is not None:
+            logging.info("Events sent: %s", self.srm.events.summary())
+        if self.shared_state is not None:
+            self.shared_state.close()
+            self.shared_state = None
+        if self.recorder is None:
+            return None
+        path = self.recorder.path
+        self.recorder.close()
+        self.recorder = None
+        return write_report(path)
+
+
+def start_flight_plans(config):
+    """Index the saved flight plans in the background, if configured."""
+    if not config.flight_plan_directory:
+        return None
+    flight_plans = FlightPlanIndex(
+        os.path.expandvars(config.flight_plan_directory),
+        config.flight_plan_interval,
+    )
+    flight_plans.start()
+    return flight_plans
+
+
+# The name the single simulator is shown under on the dashboard
+DASHBOARD_SEAT = "Simulator"
 
 
 def main(stdscr):
@@ -230,89 +793,62 @@ def main(stdscr):
 
     stdscr.nodelay(True)
     ui = ScCurses(stdscr)
-    config = SimrateControlConfig("config.ini")
+    clock = SYSTEM_CLOCK
+    config_watcher = ConfigWatcher("config.ini", clock=clock)
+    flight_plans = start_flight_plans(config_watcher.config)
+    controller = SimrateController(
+        config_watcher.config,
+        make_speaker(config_watcher.config),
+        flight_plans=flight_plans,
+        clock=clock,
+    )
+    supervisor = ConnectionSupervisor()
+    supervisor.start()
+    dashboard = None
+    if config_watcher.config.dashboard:
+        dashboard = Dashboard(
+            config_watcher.config.dashboard_host,
+            config_watcher.config.dashboard_port,
+            [DASHBOARD_SEAT],
+            config_watcher.config.dashboard_token,
+        )
+        dashboard.start()
     ui.write_message("Not connected...")
-    sm = None
-    srm = None
-    flight_data_metrics = None
-    flight_stability = None
     while True:
         user_input = ui.update()
         if user_input == CursesCommands.QUIT:
             break
-        messages = []
-        if sm is None:
-            ui.write_message("Not connected...")
-            flight_data_metrics = None
-            srm = None
-            flight_stability = None
-            sm = connect(0)
-        else:
-            if flight_data_metrics is None:
-                flight_data_metrics = FlightDataMetrics(sm, config)
-                flight_stability = SimrateDiscriminator(flight_data_metrics, config)
-                # This will be used to toggle pause on and off
-                simrate_functions = [flight_stability.get_max_sim_rate, lambda: 1]
-            if srm is None:
-                srm = SimRateManager(sm, config)
-            ui.write_message("Connected to simulator.")
-
-        if sm is not None and srm is not None:
-            try:
-                if user_input == CursesCommands.TOGGLE_ACCEL:
-                    simrate_functions.reverse()
-                if user_input == CursesCommands.TOGGLE_VNAV_GUARD:
-                    config.waypoint_vnav = not config.waypoint_vnav
-                if user_input == CursesCommands.UNPAUSE:
-                    srm.unpause()
-                if user_input == CursesCommands.PAUSE:
-                    srm.pause()
-                if user_input == CursesCommands.TOGGLE_LNAV_GUARD:
-                    config.ap_nav_guarded = not config.ap_nav_guarded
-                if user_input == CursesCommands.TOGGLE_ETE_GUARD:
-                    config.ete_guard = not config.ete_guard
-                if user_input == CursesCommands.MAX_SIMRATE_1:
-                    config.max_rate = 1
-                if user_input == CursesCommands.MAX_SIMRATE_2:
-                    config.max_rate = 2
-                if user_input == CursesCommands.MAX_SIMRATE_4:
-                    config.max_rate = 4
-                if user_input == CursesCommands.MAX_SIMRATE_8:
-                    config.max_rate = 8
-                if user_input == CursesCommands.MAX_SIMRATE_16:
-                    config.max_rate = 16
-
-                if not config.waypoint_vnav:
-                    ui.write_message("Waypoint vertical detection disabled")
-                if simrate_functions[0] != flight_stability.get_max_sim_rate:
-                    ui.write_message("Acceleration paused by user")
-                flight_data_metrics.update()
-                max_stable_rate = simrate_functions[0]()
-                messages += flight_stability.get_messages()
-                messages += srm.update(max_stable_rate)
-                write_screen(
-                    ui, config, flight_data_metrics, flight_stability, srm, messages
+        if user_input == CursesCommands.NORMAL and dashboard is not None:
+            user_input = dashboard.next_command(DASHBOARD_SEAT) or user_input
+        try:
+            if not controller.step(supervisor, config_watcher, user_input, ui):
+                state = supervisor.state.name.lower()
+                ui.write_message(f"Not connected... ({state})")
+                if dashboard is not None:
+                    dashboard.publish(DASHBOARD_SEAT, {"state": state})
+                clock.sleep(0.1)
+                continue
+            if dashboard is not None:
+                dashboard.publish(
+                    DASHBOARD_SEAT,
+                    dict(controller.status or {}, state="connected"),
+                    controller.messages,
                 )
-                sleep(0.01)
-            except (SimConnectDataError, AttributeError, TypeError) as e:
-                messages.append("DATA ERROR")
-                messages.append(str(e))
-                if config.decelerate_on_simconnect_error:
-                    srm.decelerate()
-            except KeyboardInterrupt:
-                srm.stop_acceleration()
-                sleep(1)
-                srm.say_sim_rate()
-                ui.update()
-                break
-            except OSError as e:
-                ui.write_message(str(e))
-                sm = None
-    if srm is not None and sm is not None:
-        srm.unpause()
-        srm.stop_acceleration()
-        sleep(1)
-        srm.say_sim_rate()
+            controller.wait()
+        except KeyboardInterrupt:
+            if controller.ready:
+                controller.stop()
+            ui.update()
+            break
+    if controller.ready:
+        controller.srm.unpause()
+        controller.stop()
+    controller.close()
+    supervisor.stop()
+    if dashboard is not None:
+        dashboard.stop()
+    if flight_plans is not None:
+        flight_plans.stop()
     return 0
 
 
@@ -328,6 +864,12 @@ if __name__ == "__main__":
     from curses import wrapper
 
     try:
+        if "--seats" in sys.argv:
+            from sc_seats import seats_main
+
+            seats_file = sys.argv[sys.argv.index("--seats") + 1 :][:1]
+            wrapper(seats_main, seats_file[0] if seats_file else "seats.ini")
+            sys.exit()
         os.system("mode con: cols=65 lines=20")
         wrapper(main)
     except OSError:
@@ -18,7 +18,13 @@ a = Analysis(
     binaries=[
         (find_file_by_name("SimConnect.dll", [SPECPATH] + sys.path), "./SimConnect/")
     ],
-    datas=[("config.ini", "./"), ("README.md", "./"), ("LICENSE", "./")],
+    datas=[
+        ("config.ini", "./"),
+        ("seats.ini", "./"),
+        ("profiles", "./profiles"),
+        ("README.md", "./"),
+        ("LICENSE", "./"),
+    ],
     hiddenimports=["pyttsx3.drivers", "pyttsx3.drivers.sapi5"],
     hookspath=[],
     runtime_hooks=[],